@@ -9,30 +9,36 @@
 import numpy as np
 import time
 from imports.adwin_femto import *
-from imports.data import data
+from imports.data import Data
+from imports.stability import StabilityMonitor
+
+# end the trace as soon as the current of the last 50 datapoints varies and drifts less than 1% (None measures all)
+monitor = StabilityMonitor(window=50, max_relative_std=0.01, max_drift=0.01)
 
 def init():
     return ADwinFemto(drain=1, source=1, iv_gain=9, burn_gain=4)
 
 def start(instr, name, dev): # This function is run for every device from main.py.
     print("Measuring IT-trace of experiment %s at device %s" % (name,dev))
-    data_IT = data(name='%s_IT' % name, dev=dev, coordinates='time',values='Isd')
+    data_IT = Data(name='%s_IT' % name, dev=dev, coordinates='time',values='Isd')
     s=time.time()
-    [t, i, flags] = instr.current_time_trace(v=0.4,
-                                             num_datapoints=300,
-                                             data_frequency=10,
-                                             num_average=50,
-                                             wait_for_complete=False)
-
-    # because wait_for_complete is false, we can plot (incomplete) data until the data_incomplete flag is cleared
-    data_start=0
-    while(flags & ADWIN_FLAG_DATA_INCOMPLETE):  # the data incomplete flag is only set when the measurement is still ongoing
-        qt.msleep(0.5)
-        [t,i,flags,data_start] = instr.get_data(data_start)
+    if monitor is not None:
+        monitor.reset()
+    # the trace is streamed in chunks, so it can be plotted while it is measured (set num_datapoints=None to measure
+    # until the experiment is stopped)
+    for [t, i, flags] in instr.stream_current_time_trace(v=0.4,
+                                                         num_datapoints=300,
+                                                         data_frequency=10,
+                                                         num_average=50,
+                                                         chunk_size=5):
         data_IT.fill(t,i)
         data_IT.plot()  #updates plot if it exists
+        if monitor is not None and monitor.update(t, i):
+            break  # leaving the loop stops the trace
 
-    print("Saved IV trace at time %.2f" % (time.time()-s))
+    print("Saved IT trace at time %.2f" % (time.time()-s))
+    if monitor is not None and monitor.reason:
+        print("Trace ended early: %s" % monitor.reason)
 
-    data_IT.close_file()
+    data_IT.close()
     print("Measurement completed.")
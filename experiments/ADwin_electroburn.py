@@ -7,8 +7,11 @@
 
 """
 from imports.adwin_femto import *
-from imports.functions import add_metric_prefix, linear_fit_resistance, check_user_input
+from imports.functions import add_metric_prefix, check_user_input
 from imports.data import Data
+from imports.pipeline import Pipeline
+from imports.burn_schedule import BurnScheduler
+import imports.data
 # critical resistance at which the junction is considered a tunneling junction
 R_crit = 500e6
 
@@ -21,11 +24,13 @@ cycles = 10
 
 # burning settings
 auto_burn_gain = True  # for autogaining between L3 and L4 (required for broader graphene junctions)
+save_burn_traces = True  # read and save the full data of every burn cycle (False only reads the ramp down)
+R_fit_tolerance = 0.05  # relative error of the resistance fitted to the burn cycle above which the resistance is swept
+pipeline_depth = 4  # number of cycles that may wait to be saved and plotted while the next cycle is burned
+learn_breakpoints = True  # seed the breakpoint voltage and its increase from the devices already burned in this run
+scheduler = None  # BurnScheduler of the run, created by the first device
 
 
-def max_voltage_increase(v_max):
-    return max(v_max * (1 + v_max / 20), v_max + 0.1)  # function to increase the maximum breakpoint voltage. higher increases at higher volts
-
 def trigger_flag_to_string(flags):
     if flags & ADWIN_FLAG_BURN_OHMIC:
         return 'V overload (10 V)'
@@ -40,6 +45,17 @@ def trigger_flag_to_string(flags):
     elif flags & ADWIN_FLAG_BURN_BREAKPOINT_V:
         return 'maximum V reached'
 
+def save_burn_cycle(data_burn, n, v, i):
+    if np.size(v) > 1:
+        data_burn.fill(v, n * np.ones(np.size(v)), np.array(i))
+        data_burn.new_block()  # is this line required?
+
+def save_resistance(info_burn, data_R, n, v, i, R, v_max, burn_gain, burn_flags):
+    info_burn.fill(n, R, v_max, burn_gain, burn_flags)
+    if v is not None:  # the resistance was swept
+        data_R.fill(v, n * np.ones(np.size(v)), i)
+        data_R.new_block()
+
 def init():
     return ADwinFemto(drain=1, source=1, iv_gain=9, burn_gain=4)
 
@@ -47,14 +63,12 @@ def start(instr, name, dev, **kwargs):  # This function is run for every device
     ####################
     #  Preset globals  #
     ####################
-    fail_counter = 0
     num_burn_cycles = 100
     output = []
     
     ###########################
     #  Electroburning cycles  #
     ###########################
-    cont = True
     R = 1e3
     instr.burn_gain = 4
 
@@ -67,75 +81,52 @@ def start(instr, name, dev, **kwargs):  # This function is run for every device
 
     data_R.plot2d()
     data_burn.plot2d()
+    global scheduler
+    if scheduler is None:
+        # the statistics are saved with the run, so that they survive a restart
+        scheduler = BurnScheduler('%s\\%s_burn_schedule.json' % (imports.data.basepath, name))
     bpv = 10.  # set the maximum voltage to 10 V
+    breakpoint_increase = increase_breakpoint
+    if learn_breakpoints:
+        bpv = scheduler.initial_voltage(bpv)  # or to the breakpoints learned on this chip
+        breakpoint_increase = scheduler.increase
     if R > 1e6:
         bpv = 1.
-    # loop until the electroburning is completed (R should be higher than Rcrit at the end of the process)
-    Rv = 0
-    Ri = 0
-    while (R < R_crit and R > 0 and cont and n < num_burn_cycles):
-        check_user_input()  # check for user input (asynchronously)
-        # run the burning process (ElectroBurn.bas), returns the sweep data and flags
-        [v, i, burn_flags] = instr.eburn(v_rate_up=kwargs.get('v_rate_up',7.6), # V/s
-                                         v_rate_down=2300, # V/s
-                                         max_voltage=bpv, # V
-                                         feedback_high=36.6, # mI / s
-                                         feedback_low=6.1, # mI / s
-                                         feedback_steepness=0.6, # sigmoidal curve steepness
-                                         feedback_center=1.3, # V
-                                         threshold_resistance=R_crit) # Ohm
-
-        # remember the breakpoint voltage (it is the maximum voltage from the burn cycle)
-        v_max = np.max(v)
-        if not (burn_flags & ADWIN_FLAG_OVERLOAD or burn_flags & ADWIN_FLAG_BURN_I_OVERLOAD or burn_flags & ADWIN_FLAG_BURN_OHMIC): # in case of overload, dont change the bpv
-            if not (burn_flags & ADWIN_FLAG_UNDERLOAD and instr.burn_gain < 8): # in case of underload at lowest gain, dont change the bpv
-                bpv = v_max
-
-        # save burn data
-        if np.size(v) > 1:
-            data_burn.fill(v, n * np.ones(np.size(v)), np.array(i))
-            data_burn.new_block()  # is this line required?
-        data_burn.plot()
-
-        # measure the new resistance between -0.1 and 0.1 V
-        [v, i, _] = instr.sweep_linear(v_min=-0.4, v_max=0.4, num_datapoints=50, num_average = 10, time_per_scan=0.2)
-        R = abs(linear_fit_resistance(v, i))
-        info_burn.fill(n, R, v_max, instr.burn_gain, burn_flags)
-        data_R.fill(v, n * np.ones(np.size(v)), i)
-        data_R.new_block()
-        data_R.plot()
-
-        # output information to the user
-        print('cyc %d: bpv %.2f V, R (%s) %sOhm, gain %s, tr: %s' % (n, v_max, dev, add_metric_prefix(R), instr.burn_gain, trigger_flag_to_string(burn_flags)))
-
-        # update electroburn parameters
-        n = n + 1
-
-        # handle the burn flags
-        if (auto_burn_gain):
-            if (burn_flags & ADWIN_FLAG_UNDERLOAD):
-                # this should be difficult to measure with current gain, change the gain!
-                if (instr.burn_gain < 9):
-                    instr.burn_gain += 1
-                    #print('> Note: gain too low, cannot measure current. Increasing gain to: %s' % instr.burn_gain)
-            elif (burn_flags & ADWIN_FLAG_OVERLOAD or burn_flags & ADWIN_FLAG_BURN_I_OVERLOAD):
-                if (instr.burn_gain > 3):
-                    instr.burn_gain -= 1
-                    num_burn_cycles += 1
-                    #print('> Note: gain too high, cannot measure current. Reducing gain to: %s' % instr.burn_gain)
-
-        # if the burn script overloads the I or the V, stop trying after 3 times
-        if (burn_flags & ADWIN_FLAG_BURN_OHMIC or (burn_flags & ADWIN_FLAG_BURN_I_OVERLOAD and instr.burn_gain == 3)):
-            fail_counter = fail_counter + 1
-            if (fail_counter > 2):
+    if bpv < 10.:
+        print('Breakpoint voltage seeded at %.2f V from %d devices' % (bpv, len(scheduler.first_breakpoints)))
+    scheduler.start_device()
+    # loop until the electroburning is completed (R should be higher than Rcrit at the end of the process). The cycle to
+    # cycle policy (breakpoint voltage, burn gain, fails) runs in the driver, see ADwinFemto.eburn_series.
+    # the data of a cycle is saved in the background while the next cycle runs, and plotted here once it is saved. All
+    # of it is written before leaving the with block (also when the run is stopped)
+    stop_reason = None
+    with Pipeline(max_pending=pipeline_depth) as pipeline:
+        for cycle in instr.eburn_series(R_crit=R_crit, max_cycles=num_burn_cycles, max_fails=3, max_voltage=bpv,
+                                        breakpoint_increase=breakpoint_increase, auto_gain=auto_burn_gain,
+                                        R_fit_tolerance=R_fit_tolerance, keep_data=save_burn_traces,
+                                        v_rate_up=kwargs.get('v_rate_up',7.6), # V/s
+                                        v_rate_down=2300, # V/s
+                                        feedback_high=36.6, # mI / s
+                                        feedback_low=6.1, # mI / s
+                                        feedback_steepness=0.6, # sigmoidal curve steepness
+                                        feedback_center=1.3, # V
+                                        threshold_resistance=R_crit): # Ohm
+            scheduler.observe(cycle)
+            # save burn data (in the background, while the next measurement runs)
+            pipeline.submit(save_burn_cycle, data_burn, cycle.n, cycle.v, cycle.i)
+            pipeline.submit(save_resistance, info_burn, data_R, cycle.n, cycle.v_R, cycle.i_R, cycle.R,
+                            cycle.breakpoint, cycle.gain, cycle.flags)
+            pipeline.plot(data_burn)  # the plots are drawn on this thread, once the data is saved
+            if cycle.v_R is not None:
+                pipeline.plot(data_R)
+
+            # output information to the user
+            print('cyc %d: bpv %.2f V, R (%s) %sOhm, gain %s, tr: %s' % (cycle.n, cycle.breakpoint, dev, add_metric_prefix(cycle.R), cycle.gain, trigger_flag_to_string(cycle.flags)))
+            [n, R, stop_reason] = [cycle.n + 1, cycle.R, cycle.stop_reason]
+            if stop_reason == 'fails':
                 print('Three fails, deserting device...')
-                cont = False  # ohmic resistance found after hanging at 10 V for 5 seconds, stop burning.
-        else:
-            fail_counter = 0
-
-        if (burn_flags & ADWIN_FLAG_BURN_BREAKPOINT_V):
-            bpv = max_voltage_increase(bpv)
-        #cont = input('Continue? (1/0): ')
+            check_user_input()  # check for user input (asynchronously)
+    scheduler.end_device()
 
     data_burn.close()
     info_burn.close()
@@ -143,10 +134,10 @@ def start(instr, name, dev, **kwargs):  # This function is run for every device
 
     output.append('cycles: %s' % n)
     output.append('R: %s' % add_metric_prefix(R))
-    if fail_counter > 2:
+    if stop_reason == 'fails':
         output.append('IorV overload')
         #output.append('SKIP')
-    if n == num_burn_cycles:
+    if stop_reason == 'max_cycles':
         output.append('repeat')  # signal user that this junction should be electroburned once more
         #output.append('SKIP')
     print("Measurement completed.")
@@ -8,6 +8,7 @@
 from imports.data import Data
 from imports.hp4156a import HP
 from imports.adwin_femto import *
+from imports.coacquisition import hp_gate_trace
 from imports.functions import sleep
 import time
 def init():
@@ -28,22 +29,15 @@ def start(instr,name, dev, **kwargs): # This function is run for every device fr
     data_IVg = Data(name='%s_%s' % (name, filename), dev = dev,coordinates='Vg',values='Isd')  #create the data file
     #sleep(5)
     tm = time.time()
-    adwin.current_time_trace(0.2,
-                             num_average = 1000,
-                             data_frequency = 50,
-                             num_datapoints = 30000,
-                             wait_for_complete = False,
-                             in_channel = 'both')
-            
-    hp.sweep_triangle(v_min=-100,
-                      v_max=100,
-                      v_step=1,
-                      electrode='gate',
-                      source=0.2)
-    adwin.stop() # stops the current acquisition
-    [t,i,flags,_] = adwin.get_data()
-    v = i[1]*10  # get the voltage applied from the hp
-    i = i[0]
+    # the ADwin records the current while the HP sweeps the gate, the trace is decimated to the gate steps of the HP
+    [v, i, t, flags] = hp_gate_trace(adwin, hp,
+                                     v_min=-100,
+                                     v_max=100,
+                                     v_step=1,
+                                     bias=0.2,
+                                     data_frequency=50,
+                                     num_average=1000,
+                                     vg_scale=10)  # the gate voltage is read on the second ADC channel, divided by 10
     data_IVg.fill(v,i)
     data_IVg.plot()
     data_IVg.close()
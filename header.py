@@ -12,6 +12,7 @@ from imports.experiment import Experiment
 from imports.cascade import Cascade
 from imports.arduino import SignalSwitch
 from imports.functions import *
+from imports.timing import timing
 import imports.data as d
 reload(d)
 d.basepath = '%s%s\\%s' % (d.basepath, time.strftime('%Y'), script_dir.split('\\')[-1])
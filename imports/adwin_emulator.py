@@ -0,0 +1,421 @@
+"""
+
+Emulator of the ADwin Gold II and the FEMTO DLPCA 200, for running ADwinFemto and the experiment scripts without the
+hardware (offline runs, benchmarks, testing changes to the driver).
+
+The emulator implements the par/fpar/data interface of the ADwin processes that ADwinFemto uses:
+    1 DAC.bas, 2 ADC.bas, 3 Sweep_Linear.bas, 4 Sweep_Triangle.bas, 5 ElectroBurn.bas, 6 ITTrace.bas
+including the process timing (processdelay and averaging) and the 16 bit quantisation of the DAC and ADC. The device
+between the probes is a pluggable model: Resistor, TunnelJunction, Open, Short or BurningJunction.
+
+Wiring of the emulated setup:
+    DAC output bias_channel (1) biases the device, DAC output gate_channel (2) gates it
+    the device current goes through the FEMTO into ADC input femto_channel (1)
+    the other ADC inputs read the voltage returned by aux(channel, t) (0 V by default)
+
+Usage:
+    from imports.adwin_emulator import ADwinEmulator, BurningJunction
+    emulator = ADwinEmulator(BurningJunction(R=2e3), speed=10.)
+    instrument = ADwinFemto(emulator=emulator)  # emulates a single instrument
+    ADwinFemto.use_emulator(emulator)  # or: all ADwinFemto instruments that are created (e.g. by main.py) are emulated
+
+    speed = the factor by which the emulated time runs faster than real time (None runs as fast as possible)
+    The emulated time in s is emulator.time, the device model can be replaced at any time by setting emulator.model.
+"""
+import threading
+import time
+import numpy as np
+from imports.adwin_femto import PROCESS_CLOCK, BUFFER_SIZE, ADWIN_FLAG_BURN_OHMIC, ADWIN_FLAG_BURN_R_THRESHOLD, \
+    ADWIN_FLAG_BURN_FEEDBACK, ADWIN_FLAG_BURN_I_OVERLOAD, ADWIN_FLAG_BURN_BREAKPOINT_V
+
+_DIGITS = 65535
+_ZERO = 32768  # digit of 0 V
+_FEMTO_SATURATION = 10.5  # V, output of the FEMTO when it overloads
+_ADC_PROCESSDELAY = 1000  # process delay of ADC.bas
+_BURN_SMOOTHING = 0.005  # weight of a new current reading in the smoothed current of ElectroBurn.bas
+_PACE = 0.002  # s, the process threads sleep once they run this far ahead of real time
+
+
+def _to_digit(v):
+    return int(min(max(round((v + 10.0) * _DIGITS / 20.0), 0), _DIGITS))
+
+
+def _to_voltage(d):
+    return d * 20.0 / _DIGITS - 10.0
+
+
+#######################
+#  Device models      #
+#######################
+
+class Resistor(object):
+    '''
+    ohmic resistor of R Ohm
+    '''
+    def __init__(self, R=1e6):
+        self.R = float(R)
+
+    def current(self, v, vg=0., dt=0.):
+        '''
+        :param v: bias voltage in V
+        :param vg: gate voltage in V
+        :param dt: emulated time in s since the previous call
+        :return: current in A
+        '''
+        return v / self.R
+
+
+class Open(Resistor):
+    '''
+    open circuit (only leakage)
+    '''
+    def __init__(self, R=1e15):
+        Resistor.__init__(self, R)
+
+
+class Short(Resistor):
+    '''
+    shorted probes
+    '''
+    def __init__(self, R=1.):
+        Resistor.__init__(self, R)
+
+
+class TunnelJunction(object):
+    '''
+    tunnel junction with zero bias resistance R and a cubic (Simmons-like) nonlinearity set by the barrier voltage.
+    The conductance is modulated by the gate as exp(gate_coupling * vg).
+    '''
+    def __init__(self, R=1e9, v_barrier=0.5, gate_coupling=0.):
+        self.R = float(R)
+        self.v_barrier = v_barrier
+        self.gate_coupling = gate_coupling
+
+    def current(self, v, vg=0., dt=0.):
+        return v / self.R * (1 + (v / self.v_barrier) ** 2) * np.exp(self.gate_coupling * vg)
+
+
+class BurningJunction(object):
+    '''
+    graphene constriction that narrows stochastically when the dissipated power exceeds its breakdown power P_break.
+    The breakdown rate rises exponentially with the power: rate * exp(sharpness * (P / P_break - 1)). Every breakdown
+    raises the resistance by a random factor and lowers the breakdown power, until the resistance exceeds R_tunnel and
+    the junction behaves as a TunnelJunction.
+    '''
+    def __init__(self, R=2e3, R_tunnel=1e9, P_break=4e-3, rate=20., sharpness=10., seed=None):
+        self.R = float(R)
+        self.R_tunnel = R_tunnel
+        self.P_break = P_break
+        self.rate = rate
+        self.sharpness = sharpness
+        self._random = np.random.RandomState(seed)
+
+    def current(self, v, vg=0., dt=0.):
+        if self.R < self.R_tunnel and dt > 0:
+            power = v * v / self.R
+            rate = self.rate * np.exp(min(self.sharpness * (power / self.P_break - 1), 50.))
+            if self._random.random_sample() < 1 - np.exp(-rate * dt):
+                self.R *= 1 + self._random.exponential(0.5)
+                self.P_break *= 0.9
+        if self.R < self.R_tunnel:
+            return v / self.R
+        return v / self.R * (1 + (v / 0.5) ** 2)
+
+
+#######################
+#  Instruments        #
+#######################
+
+class EmulatedFemto(object):
+    '''
+    FEMTO DLPCA 200 with the qt instrument interface used by ADwinFemto
+    '''
+    def __init__(self, gain=9):
+        self.gain = gain
+
+    def set(self, name, value=None, fast=False, **kwargs):
+        if name == 'gain':
+            self.gain = int(str(value).lstrip('L'))
+
+    def get(self, name):
+        if name == 'gain':
+            return 'L%d' % self.gain
+
+    def output(self, i):
+        '''
+        :param i: input current in A
+        :return: output voltage in V
+        '''
+        return min(max(i * 10 ** self.gain, -_FEMTO_SATURATION), _FEMTO_SATURATION)
+
+
+class EmulatedADwin(object):
+    '''
+    ADwin Gold II with the qt instrument interface used by ADwinFemto. The processes run in background threads.
+    '''
+    def __init__(self, emulator):
+        self._emulator = emulator
+        self._par = {}
+        self._data = {}
+        self._lock = threading.Lock()
+        self._processes = {1: self._dac, 2: self._adc_process, 3: self._sweep_linear, 4: self._sweep_triangle,
+                           5: self._electroburn, 6: self._it_trace}
+        self.loaded = set()
+
+    # qt instrument interface
+
+    def set(self, name, value=None, fast=False, **kwargs):
+        if isinstance(name, dict):
+            for key in name:
+                self._set(key, name[key])
+        else:
+            self._set(name, value)
+
+    def _set(self, name, value):
+        self._par[name] = float(value) if name.startswith('fpar') else int(value)
+
+    def get(self, name):
+        if name.startswith('data'):
+            with self._lock:
+                return self._data.get(int(name[4:]), np.zeros(0, dtype=np.int32)).copy()
+        return self._par.get(name, 0.0 if name.startswith('fpar') else 0)
+
+    def get_data_range(self, index, start, count):
+        with self._lock:
+            return self._data.get(index, np.zeros(0, dtype=np.int32))[start:start + count].copy()
+
+    def compile_process(self, filename, process=1, **kwargs):
+        return process
+
+    def load_process(self, process):
+        self.loaded.add(process)
+
+    def start_process(self, process):
+        if not process in self._processes:
+            print('Warning (emulator): process %d is not emulated.' % process)
+            return
+        if process == 1:
+            self._dac()
+            return
+        busy_par = {2: 'par20', 3: 'par30', 4: 'par50', 5: 'par40', 6: 'par60'}[process]
+        self._par[busy_par] = 1
+        self._par['par80'] = 0
+        thread = threading.Thread(target=self._run, args=(self._processes[process], busy_par))
+        thread.daemon = True
+        thread.start()
+
+    # process helpers
+
+    def _run(self, process, busy_par):
+        self._t_real = time.time()
+        self._t_start = self._emulator.time
+        try:
+            process()
+        finally:
+            self._par[busy_par] = 0
+
+    def _p(self, n):
+        return self._par.get('par%d' % n, 0)
+
+    def _fp(self, n):
+        return self._par.get('fpar%d' % n, 0.)
+
+    def _stopped(self):
+        if self._par.get('par80', 0):
+            self._par['par80'] = 0
+            return True
+        return False
+
+    def _write(self, index, k, value):
+        with self._lock:
+            data = self._data.get(index)
+            if data is None or k >= data.size:
+                size = min(max(4096, 2 * k), int(BUFFER_SIZE))
+                if k >= size:
+                    return  # buffer overflow, like the hardware the data is lost
+                grown = np.zeros(size, dtype=np.int32)
+                if data is not None:
+                    grown[:data.size] = data
+                self._data[index] = data = grown
+            data[k] = value
+
+    def _step(self, dt):
+        '''
+        advances the emulated time by dt and keeps the process paced to real time
+        '''
+        self._emulator.time += dt
+        if self._emulator.speed:
+            ahead = self._t_real + (self._emulator.time - self._t_start) / self._emulator.speed - time.time()
+            if ahead > _PACE:
+                time.sleep(ahead)
+
+    # processes
+
+    def _dac(self):
+        self._emulator.dac[self._p(1)] = _to_voltage(self._p(2))
+
+    def _adc_process(self):
+        averages = max(self._p(19), 1)
+        dt = averages * _ADC_PROCESSDELAY / PROCESS_CLOCK
+        self._step(dt)
+        self._par['par11'] = self._emulator.adc(self._p(11), averages, dt)
+
+    def _sweep_linear(self):
+        [out, inp, start, step] = [self._p(21), self._p(22), self._p(23), self._fp(25)]
+        averages = max(self._p(27), 1)
+        dt = self._p(26) * averages / PROCESS_CLOCK
+        self._par['par29'] = 0
+        for k in range(self._p(28)):
+            if self._stopped():
+                break
+            d = int(round(start + k * step))
+            self._emulator.dac[out] = _to_voltage(d)
+            self._step(dt)
+            self._write(1, k, d)
+            self._write(2, k, self._emulator.adc(inp, averages, dt))
+            self._par['par29'] = k + 1
+
+    def _sweep_triangle(self):
+        [out, inp, v_min, v_max, position, step] = [self._p(41), self._p(42), self._p(44), self._p(45), self._p(46),
+                                                   self._fp(41)]
+        averages = max(self._p(48), 1)
+        dt = self._p(43) * averages / PROCESS_CLOCK
+        points = (int(round(2 * (v_max - v_min) / step)) + 2) * self._p(47) if step > 0 else 0
+        direction = 1
+        position = float(position)
+        self._par['par49'] = 0
+        for k in range(points):
+            if self._stopped():
+                break
+            d = int(round(position))
+            self._emulator.dac[out] = _to_voltage(d)
+            self._step(dt)
+            self._write(1, k, d)
+            self._write(2, k, self._emulator.adc(inp, averages, dt))
+            self._par['par49'] = k + 1
+            position += direction * step
+            if position >= v_max:
+                [position, direction] = [v_max, -1]
+            elif position <= v_min:
+                [position, direction] = [v_min, 1]
+
+    def _electroburn(self):
+        [inp, out, d_max, hold, up, down] = [self._p(31), self._p(32), self._p(33), self._p(34), self._fp(31),
+                                             self._fp(32)]
+        [fb_high, fb_low, fb_center, fb_steepness] = [self._fp(33), self._fp(34), self._fp(35), self._fp(36)]
+        [gain, threshold_resistance] = [self._fp(37) or 1., self._fp(38)]
+        dt = self._p(35) / PROCESS_CLOCK
+        d = float(_ZERO)
+        flags = 0
+        k = 0
+        held = 0
+        smoothed = None
+        while True:
+            if self._stopped():
+                break
+            v = _to_voltage(int(d))
+            self._emulator.dac[out] = v
+            self._step(dt)
+            i_digit = self._emulator.adc(inp, 1, dt)
+            self._write(1, k, int(d))
+            self._write(2, k, i_digit)
+            k += 1
+            if _to_voltage(i_digit) >= 9.9 or _to_voltage(i_digit) <= -9.9:
+                flags |= ADWIN_FLAG_BURN_I_OVERLOAD
+                break
+            # the slope of the (smoothed) current is compared with the sigmoidal feedback parameter in digits per step
+            i_amplitude = abs(i_digit - _ZERO)
+            if smoothed is None:
+                smoothed = float(i_amplitude)
+            slope = _BURN_SMOOTHING * (i_amplitude - smoothed)
+            smoothed += slope
+            feedback = fb_low + (fb_high - fb_low) / (1 + np.exp((v - fb_center) / max(fb_steepness, 1e-3)))
+            if -slope > feedback:
+                flags |= ADWIN_FLAG_BURN_FEEDBACK
+                break
+            if v > 0.1 and smoothed > 0 and v / (smoothed * 20.0 / _DIGITS / gain) > threshold_resistance:
+                flags |= ADWIN_FLAG_BURN_R_THRESHOLD
+                break
+            if d >= d_max:
+                held += 1
+                if held > hold:
+                    flags |= ADWIN_FLAG_BURN_OHMIC if d >= _to_digit(9.99) else ADWIN_FLAG_BURN_BREAKPOINT_V
+                    break
+            else:
+                d = min(d + up, d_max)
+        # ramp down
+        while d > _ZERO:
+            d = max(d - max(down, 1.), _ZERO)
+            self._emulator.dac[out] = _to_voltage(int(d))
+            self._step(dt)
+            self._write(1, k, int(d))
+            self._write(2, k, self._emulator.adc(inp, 1, dt))
+            k += 1
+        self._par['par39'] = k
+        self._par['par38'] = flags
+        self._par['par37'] = flags
+
+    def _it_trace(self):
+        [out, inp, averages] = [self._p(51), self._p(52), max(self._p(55), 1)]
+        self._emulator.dac[out] = _to_voltage(self._p(53))
+        dt = self._p(54) * averages / PROCESS_CLOCK
+        self._par['par57'] = 0
+        for k in range(self._p(56)):
+            if self._stopped():
+                break
+            self._step(dt)
+            self._write(1, k, k * averages)
+            if inp == 0:
+                self._write(2, k, self._emulator.adc(1, averages, dt))
+                self._write(3, k, self._emulator.adc(2, averages, dt))
+            else:
+                self._write(2, k, self._emulator.adc(inp, averages, dt))
+            self._par['par57'] = k + 1
+
+
+class ADwinEmulator(object):
+    '''
+    the emulated setup: an EmulatedADwin and an EmulatedFemto connected to a device model
+    '''
+    def __init__(self, model=None, speed=1., bias_channel=1, gate_channel=2, femto_channel=1, current_noise=1e-13,
+                 adc_noise=1.5, aux=None, seed=None):
+        '''
+        :param model: device model (Resistor(1 MOhm) by default)
+        :param speed: factor by which the emulated time runs faster than real time, None runs as fast as possible
+        :param current_noise: rms noise of the device current in A
+        :param adc_noise: rms noise of a single ADC conversion in digits
+        :param aux: function aux(channel, t) that returns the voltage on the other ADC inputs
+        :param seed: seed of the noise
+        '''
+        self.model = model if model is not None else Resistor(1e6)
+        self.speed = speed
+        self.bias_channel = bias_channel
+        self.gate_channel = gate_channel
+        self.femto_channel = femto_channel
+        self.current_noise = current_noise
+        self.adc_noise = adc_noise
+        self.aux = aux
+        self.time = 0.
+        self.dac = {}
+        self._random = np.random.RandomState(seed)
+        self._t_model = 0.
+        self.femto = EmulatedFemto()
+        self.adwin = EmulatedADwin(self)
+
+    def adc(self, channel, averages=1, dt=0.):
+        '''
+        :param channel: ADC input channel
+        :param averages: number of averaged conversions
+        :return: the (averaged) ADC reading in digits
+        '''
+        if channel == self.femto_channel:
+            i = self.model.current(self.dac.get(self.bias_channel, 0.), self.dac.get(self.gate_channel, 0.),
+                                   self.time - self._t_model)
+            self._t_model = self.time
+            v = self.femto.output(i + self._random.normal(0, self.current_noise))
+        elif self.aux is not None:
+            v = self.aux(channel, self.time)
+        else:
+            v = 0.
+        d = (v + 10.0) * _DIGITS / 20.0 + self._random.normal(0, self.adc_noise / np.sqrt(averages))
+        return int(min(max(round(d), 0), _DIGITS))
@@ -22,17 +22,23 @@ Driver initialisation:
         iv_gain = 9  # order of magnitude of original gain (10^9 is the standard setting, which corresponds to L9.)
         burn_gain = 4  # order of magnitude of the burn_gain (10^4 is the standard setting, which corresponds to L4.)
     Calling this function loads the ADwin and FEMTO instruments
-    Additionally, 5 processes will be loaded:
+    The following processes are loaded when a measurement first needs them (the compiled binaries are cached and the
+    processes that are still resident on the ADwin are reused, see adwin_processes.py):
         C:\scripts\ADwin\Standard\DAC.bas  # for simple DAC conversion (writing)
         C:\scripts\ADwin\Standard\ADC.bas  # for simple ADC conversion (reading)
         C:\scripts\ADwin\Standard\Sweep_Linear.bas  # for a (single) linear sweep iv trace
         C:\scripts\ADwin\Standard\Sweep_Triangle.bas  # for triangular wave voltammetry
         C:\scripts\ADwin\Standard\ElectroBurn.bas  # for feedback controlled electroburning
+        C:\scripts\ADwin\Standard\ITTrace.bas  # for current versus time traces
 
 Driver usage:
     outputting a voltage:
         instrument.write(voltage)  # this function will run the DAC.bas script that outputs a voltage on the output channel
         instrument.write_gate(voltage)  # this function will run the DAC.bas script that outputs a voltage on the gate channel
+        instrument.ramp(voltage, rate=1., electrode='gate', v_start=None)  # ramps the output at rate V/s on the ADwin
+            (Sweep_Linear.bas), starting from the voltage the output was left at. Returns at once if the output is already
+            there. When a measurement on the output was stopped halfway, the output is only known after a (stopped)
+            sweep_linear or ramp, otherwise ramp refuses to run unless v_start is given.
 
     reading a voltage:
         instrument.read(auto_gain = True)  # this function returns the current flowing through the FEMTO at the input channel
@@ -87,6 +93,23 @@ Driver usage:
                         the currect was too low to correctly measure with the set gain values (auto_gain is preferably used)
                     if (flags & ADWIN_FLAG_OVERLOAD):
                         the currect was too high to correctly measure with the set gain values (auto_gain is preferably used)
+            The result is a TriangleSweep, which also holds the data per cycle:
+                sweep = instrument.sweep_triangle(...)
+                sweep.v_cycles, sweep.i_cycles  # views of v and i with shape (num_cycles, num_datapoints)
+                [v, i] = sweep.mean()  # the mean cycle, sweep.std() is the spread of the current over the cycles
+                sweep.hysteresis_area()  # the area between the forward and backward sweep of every cycle
+                [R, I0, r2, R_error] = sweep.resistance(v_window=None, robust=False)  # the resistance of every cycle
+                data.fill_grid(range(1, sweep.num_cycles + 1), sweep.v_cycles, sweep.i_cycles)  # Data with coordinates ('n', 'Vsd')
+
+        instrument.stability_diagram(self, vg, v_min, v_max, num_datapoints=100, time_per_scan=-1, scan_frequency=1, num_average=1, gain=None)
+            Measures a stability diagram row by row: for every gate voltage in vg, the gate is written and a
+            Sweep_Linear bias sweep is run. The sweep parameters are only uploaded for the first row. The gain is gain,
+            or set with auto gain at the first gate voltage; a row that overloads is measured again one decade lower,
+            and the rows after it keep that gain.
+            returns: [v, i, flags]
+                v = a numpy array of the bias voltage with a length of num_datapoints
+                i = a numpy array of current with shape (len(vg), num_datapoints)
+                flags = a numpy array with the flags of every row
 
         instrument.burn(self, cycle_num, differential = 1, ramp_up = 0.5, ramp_down = 150, max_voltage = 10)
             Runs the ElectroBurn.bas script
@@ -106,9 +129,80 @@ Driver usage:
                     if (flags & ADWIN_FLAG_BURN_OHMIC):
                         The script went all the way to 10 V and stayed there for 5 seconds without the junction breaking,
                         the junction is too conductive and probably will not burn.
+
+    series of burn cycles:
+        for cycle in instrument.eburn_series(R_crit=500e6, max_cycles=100, max_fails=3, max_voltage=10., **burn_parameters):
+            Burns the junction until its resistance exceeds R_crit, applying the cycle to cycle policy of the
+            electroburning (breakpoint voltage, burn gain, failed cycles) in the driver. Every cycle yields a BurnCycle
+            with the breakpoint, resistance, gain, flags and (with keep_data=True) the burn data of the cycle. The last
+            cycle has stop_reason set to 'R_crit', 'fails', 'max_cycles' or 'error'.
+
+    resistance from a burn cycle:
+        [v, i, flags, [R, R_error]] = instrument.eburn(..., fit_resistance=True)
+            Also fits the low bias resistance to the burn cycle (see fit_burn_resistance), so that a separate
+            resistance sweep is only needed when the relative error R_error is too large. By default the ramp down is
+            fitted, which measures the junction after the burn.
+        [R, R_error] = fit_burn_resistance(v, i, v_window=0.4, segment='down')
+            The same fit for burn data that was already measured (e.g. of an eburn with wait_for_complete = False).
+
+    streaming:
+        for [t, i, flags] in instrument.stream_current_time_trace(v, data_frequency=10, chunk_size=1000, num_datapoints=None):
+            Streams a current versus time trace in chunks, without the BUFFER_SIZE limit of current_time_trace. The
+            trace is recorded in segments that are read out while they are recorded, so the memory use is bounded by
+            the chunk size. With num_datapoints = None the trace runs until it is stopped or the loop is left.
+
+    ending a current versus time trace early:
+        [t, i, flags, info] = instrument.current_time_trace(v, data_frequency=10, num_datapoints=100, monitor=StabilityMonitor(...))
+            Streams the trace into the monitor (see stability.py), which ends it as soon as the current is stable or
+            jumps. info holds the statistics of the trace and the reason it ended ('stable', 'jump', 'complete' or
+            'stopped').
+
+    waiting for measurements:
+        instrument.wait(timeout=None, cancel=None)
+            Waits for a measurement that was started with wait_for_complete = False. All blocking calls wait in the same
+            way: they sleep until shortly before the measurement is expected to be done, and only then poll the ADwin.
+            parameters:
+                timeout = the maximum waiting time in s, after which the measurement is stopped
+                cancel = a function that returns True when the measurement should be stopped
+            returns: True if the measurement completed, False if it was stopped
+        The defaults for the blocking calls can be set with instrument.wait_timeout and instrument.cancel_hook. Data of
+        a stopped measurement is flagged with ADWIN_FLAG_DATA_INCOMPLETE.
+
+    running measurements in the background:
+        With wait_for_complete = False, sweep_linear, sweep_triangle and eburn return an Acquisition handle, so that the
+        python code can continue (write files, fit, plot, set up other instruments) while the ADwin measures:
+            acquisition = instrument.sweep_linear(-0.4, 0.4, wait_for_complete=False)
+            acquisition.done()  # True when the measurement is complete
+            acquisition.partial(start=0)  # the data measured so far as [v, i, flags, count] (see get_data)
+            acquisition.cancel()  # stops the measurement
+            [v, i, flags] = acquisition.result(timeout=None)  # waits for the measurement, like the blocking call
+            [v, i, flags] = await acquisition  # the same as result(), in an asyncio event loop (python 3)
+        The handle stays valid until the next measurement is started.
+
+    parameter uploads:
+        The driver remembers the last value written to every ADwin parameter and only uploads parameters that changed.
+        Every uploaded parameter is still a transaction of its own, as the ADwin offers no block writes for them.
+        If the ADwin was rebooted, or its parameters were changed by another program, call
+        instrument.invalidate_parameters() to upload all parameters again.
+        Likewise, the FEMTO gain is only sent when it changes. If the gain was changed on the front panel of the FEMTO,
+        call instrument.invalidate_gain().
+
+    emulation:
+        instrument = ADwinFemto(emulator=ADwinEmulator(model, speed=10.))
+            Runs the driver on an emulated ADwin and FEMTO with a device model instead of the hardware (see
+            adwin_emulator.py), for offline runs and benchmarks. The emulator replaces the hardware for all ADwinFemto
+            instruments, ADwinFemto.use_emulator(emulator) does the same for the instruments that are created later
+            (e.g. by the experiments that main.py runs). ADwinFemto.use_emulator(None) switches back to the hardware.
 """
-import qt
+import time
 import numpy as np
+from imports.adwin_processes import ProcessManager
+from imports.fitting import fit_resistance, fit_resistance_robust
+from imports.timing import timing, timed
+try:
+    import qt
+except ImportError:  # running on the emulator without qtlab (see adwin_emulator.py)
+    qt = None
 
 ADWIN_FLAG_OVERLOAD             = int('0000000000000001',2)
 ADWIN_FLAG_UNDERLOAD            = int('0000000000000010',2)
@@ -128,21 +222,395 @@ PROCESS_CLOCK = 300e6  # PROCESS CLOCK OF THE ADWIN
 PROCESSDELAY_MINIMUM = 1000
 _UNDERLOAD_THRESHOLD = 0.95
 _OVERLOAD_THRESHOLD = 9.9
+# pacing of the wait for running ADwin processes (see ADwinFemto.wait)
+_WAIT_MARGIN = 0.02  # s before the expected end of a process at which the busy parameter is polled
+_WAIT_SLICE = 0.05  # s, longest sleep between polls, so that stops, timeouts and the cancel hook stay responsive
+_WAIT_STOP_GRACE = 1.0  # s to wait for a process to acknowledge a stop before giving up
+_POLL_INTERVAL_MIN = 0.001  # s
+_POLL_INTERVAL_MAX = 0.05  # s
+_POLL_INTERVAL_GROWTH = 1.5
+_STREAM_POLL_MAX = 0.5  # s, longest sleep between polls of a streaming acquisition
+_MONITOR_INTERVAL = 0.25  # s of data per chunk that a StabilityMonitor analyses
+# auto gain (see _predict_gain)
+_AUTO_GAIN_NOISE_FLOOR = 0.002  # V, FEMTO output below which the amplitude is not known well enough to predict the gain
+_AUTO_GAIN_HEADROOM = 0.5  # a new gain aims at a peak of at most this fraction of _OVERLOAD_THRESHOLD
+# parameters that the ADwin processes write themselves, these are always uploaded (see ADwinFemto._set)
+_ADC_PROCESSDELAY = 1000  # process delay of ADC.bas
+_VOLATILE_PARAMETERS = ('par11', 'par80')
+_DATA_PROCESSES = (3, 4, 5, 6)  # processes that write the data arrays
+
+# ADbasic sources of the processes in C:\scripts\ADwin\Standard, loaded when they are first needed (see _start_process)
+_PROCESS_SOURCES = {1: 'DAC.bas', 2: 'ADC.bas', 3: 'Sweep_Linear.bas', 4: 'Sweep_Triangle.bas', 5: 'ElectroBurn.bas',
+                    6: 'ITTrace.bas'}
+
+_DIGIT_SCALE = 20.0 / 65535  # V per ADwin digit
+_DIGIT_OFFSET = -10.0  # V at digit 0
+
+
+def _msleep(t):
+    if qt is not None:
+        qt.msleep(t)
+    else:
+        time.sleep(t)
+
+
+def _range_reader(adwin, dev=1):
+    '''
+    :param adwin: ADwin instrument
+    :param dev: device number of the ADwin
+    :return: function(index, start, count) that reads count elements of a data array from index start on, None if
+        neither the instrument nor the ADwin python package offers ranged reads
+    '''
+    if hasattr(adwin, 'get_data_range'):
+        return adwin.get_data_range
+    try:
+        import ADwin
+    except ImportError:
+        return None
+    # the qt driver only reads whole arrays, so the window is read through a connection of the ADwin package itself
+    connection = ADwin.ADwin(DeviceNo=dev, raiseExceptions=1)
+
+    def read(index, start, count):
+        return np.array(connection.GetData_Long(index, start + 1, count), dtype=np.int32)  # the arrays start at 1
+    return read
+
+
+def _digits_to_units(digits, gain=0, out=None):
+    '''
+    converts raw ADwin digits to physical units with a single affine operation (scale, offset and FEMTO gain fused),
+    without creating temporary arrays
+
+    :param digits: array of raw digits
+    :param gain: order of magnitude of the FEMTO gain (0 for voltages)
+    :param out: optional float array to write the result into
+    :return: the converted array (out, if supplied)
+    '''
+    factor = 10.0 ** (-gain)
+    out = np.multiply(digits, _DIGIT_SCALE * factor, out=out)
+    out += _DIGIT_OFFSET * factor
+    return out
+
+
+def _peak_voltage(digits):
+    '''
+    :param digits: array of raw digits (not empty)
+    :return: the largest absolute voltage in V, from a single min/max reduction of the digits
+    '''
+    return max(abs(digits.min() * _DIGIT_SCALE + _DIGIT_OFFSET), abs(digits.max() * _DIGIT_SCALE + _DIGIT_OFFSET))
+
+
+def _burn_step(v_rate, process_delay):
+    '''
+    :param v_rate: ramp rate of ElectroBurn.bas in V/s
+    :param process_delay: process delay of ElectroBurn.bas
+    :return: the voltage step of the ramp in digits per process delay
+    '''
+    return (v_rate * (65535 / 20)) * (process_delay / PROCESS_CLOCK)
+
+
+def _load_flags(digits):
+    '''
+    derives ADWIN_FLAG_UNDERLOAD/ADWIN_FLAG_OVERLOAD (or ADWIN_FLAG_NO_DATA) from the raw digits of the FEMTO output
+
+    :param digits: array of raw digits
+    :return: flags
+    '''
+    digits = np.asarray(digits)
+    if not digits.size:
+        return ADWIN_FLAG_NO_DATA
+    peak = _peak_voltage(digits)
+    if peak < _UNDERLOAD_THRESHOLD:
+        return ADWIN_FLAG_UNDERLOAD
+    elif peak > _OVERLOAD_THRESHOLD:
+        return ADWIN_FLAG_OVERLOAD
+    return 0
+
+
+def _predict_gain(peak, gain, gains, overload_step=None):
+    '''
+    predicts the FEMTO gain at which a signal falls within the measurable window (between _UNDERLOAD_THRESHOLD and
+    _OVERLOAD_THRESHOLD), using that the output scales with 10^gain. A peak within the window keeps the gain. Otherwise
+    a peak of p V at gain g is expected to be p * 10^(g'-g) V at gain g', and the gain moves to the highest g' at which
+    the peak stays below _AUTO_GAIN_HEADROOM * _OVERLOAD_THRESHOLD, so that the next signal may grow before it
+    overloads. When that decade would underload, the next one is taken, which is still below _OVERLOAD_THRESHOLD.
+
+    :param peak: peak absolute FEMTO output in V, measured at gain
+    :param gain: gain (order of magnitude) of the measurement
+    :param gains: sorted list of the available gains
+    :param overload_step: number of decades to step down when the output is overloaded (the amplitude is then unknown),
+        None to go to the lowest gain
+    :return: the predicted gain
+    '''
+    if _UNDERLOAD_THRESHOLD <= peak <= _OVERLOAD_THRESHOLD:
+        return gain
+    target = _AUTO_GAIN_HEADROOM * _OVERLOAD_THRESHOLD
+    if peak > _OVERLOAD_THRESHOLD:
+        if overload_step is None:
+            return gains[0]
+        gain -= overload_step
+    elif peak < _AUTO_GAIN_NOISE_FLOOR:
+        # the amplitude is only known to be below the noise floor, so step up as far as that bound allows
+        gain += int(np.floor(np.log10(target / _AUTO_GAIN_NOISE_FLOOR)))
+    else:
+        step = int(np.floor(np.log10(target / peak)))
+        if peak * 10 ** step < _UNDERLOAD_THRESHOLD:
+            step += 1
+        gain += step
+    return min(max(gain, gains[0]), gains[-1])
+
+
+def fit_burn_resistance(v, i, v_window=0.4, segment='down'):
+    '''
+    fits I = V / R + I0 to the low bias part of one segment of an electroburning cycle (see eburn)
+
+    :param v: voltage data of the burn cycle in V
+    :param i: current data of the burn cycle in A
+    :param v_window: only the datapoints with |V| <= v_window are fitted
+    :param segment: 'down' fits the ramp down (the junction after the burn), 'up' fits the ramp up (before the burn)
+    :return: [R, relative standard error of R], [nan, inf] if the segment has too few datapoints to fit
+    '''
+    v = np.asarray(v, dtype=float)
+    i = np.asarray(i, dtype=float)
+    if v.size < 4:
+        return [np.nan, np.inf]
+    if segment == 'up':
+        window = slice(0, int(np.argmax(v)) + 1)
+    else:
+        window = slice(v.size - 1 - int(np.argmax(v[::-1])), v.size)
+    low_bias = np.abs(v[window]) <= v_window
+    v = v[window][low_bias]
+    i = i[window][low_bias]
+    if v.size < 4:
+        return [np.nan, np.inf]
+    [R, _, _, R_error] = fit_resistance(v, i)
+    if np.isnan(R):
+        return [np.nan, np.inf]
+    return [R, R_error / abs(R)]  # the relative error of R is that of the slope
+
+
+class Acquisition(object):
+    """
+    handle to a measurement that runs on the ADwin, returned by sweep_linear, sweep_triangle and eburn when
+    wait_for_complete is False. The handle stays valid until the next measurement is started.
+    """
+    def __init__(self, instr, busy_par, count_par, gain, flag_par=None, cycle_length=None, output=None):
+        self._instr = instr
+        self._output = output  # [DAC channel, voltage] at which the measurement leaves the output when it completes
+        self._cycle_length = cycle_length  # datapoints per cycle of a sweep_triangle, whose result is a TriangleSweep
+        self._run = ADwinFemto._run
+        self._busy_par = busy_par
+        self._count_par = count_par
+        self._gain = gain
+        self._flag_par = flag_par
+        self._t_expected = instr._t_expected
+        self._stopped = False
+        self._result = None
+
+    def _is_current(self):
+        return self._run == ADwinFemto._run
+
+    def _read(self, start):
+        count = self._instr._adwin.get(self._count_par)
+        [v, i, flag] = self._instr._read_iv(start, count, self._gain)
+        if self._flag_par:
+            flag |= self._instr._adwin.get(self._flag_par)
+        return [v, i, flag, count]
+
+    def done(self):
+        """
+        :return: True if the measurement is complete (or was stopped)
+        """
+        return self._result is not None or not self._is_current() or not self._instr._adwin.get(self._busy_par)
+
+    def result(self, timeout=None):
+        """
+        waits for the measurement to complete (see ADwinFemto.wait)
+
+        :param timeout: maximum waiting time in s, after which the measurement is stopped (defaults to wait_timeout)
+        :return: [v, i, flags], like the blocking call
+        """
+        if self._result is None:
+            if not self._is_current():
+                print("Error: the data of this measurement was overwritten by a later measurement.")
+                return [[], [], ADWIN_FLAG_NO_DATA | ADWIN_FLAG_ERROR]
+            if timeout is None:
+                timeout = self._instr.wait_timeout
+            completed = self._instr._wait(self._busy_par, timeout, self._instr.cancel_hook)
+            [v, i, flag, _] = self._read(0)
+            if self._stopped or not completed:
+                flag |= ADWIN_FLAG_DATA_INCOMPLETE
+            elif self._output is not None:
+                ADwinFemto._output_voltage[self._output[0]] = self._output[1]
+            if self._cycle_length:
+                self._result = TriangleSweep([v, i, flag], self._cycle_length)
+            else:
+                self._result = [v, i, flag]
+        return self._result
+
+    def partial(self, start=0):
+        """
+        reads the data measured so far, also while the measurement is running (see ADwinFemto.get_data)
+
+        :param start: index of the first datapoint to read
+        :return: [v, i, flags, count], where count is the start index for the next call
+        """
+        if self._result is not None:
+            [v, i, flag] = self._result
+            return [v[start:], i[start:], flag, len(v)]
+        if not self._is_current():
+            return [[], [], ADWIN_FLAG_NO_DATA | ADWIN_FLAG_ERROR, 0]
+        flag = ADWIN_FLAG_DATA_INCOMPLETE if self._instr._adwin.get(self._busy_par) else 0
+        [v, i, read_flag, count] = self._read(start)
+        return [v, i, flag | read_flag, count]
+
+    def cancel(self):
+        """
+        stops the measurement. result() then returns the data measured until the stop, flagged as incomplete.
+
+        :return: True if the measurement was running
+        """
+        if self.done():
+            return False
+        self._instr.stop()
+        self._stopped = True
+        self._t_expected = self._instr._t_expected
+        return True
+
+    def wait_async(self):
+        """
+        :return: an asyncio future for the result, which polls the ADwin from the running event loop (python 3)
+        """
+        import asyncio
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        def poll():
+            if future.cancelled():
+                self.cancel()
+            elif self.done():
+                future.set_result(self.result())
+            else:
+                loop.call_later(_POLL_INTERVAL_MAX, poll)
+        loop.call_later(max(self._t_expected - time.time(), 0.), poll)
+        return future
+
+    def __await__(self):
+        return self.wait_async().__await__()
+
+
+class TriangleSweep(list):
+    """
+    result [v, i, flags] of sweep_triangle, which also offers the data per cycle. The cycles are views of v and i with
+    shape (num_cycles, num_datapoints), so they cost no copy. Only complete cycles are included (a stopped sweep may
+    end halfway a cycle).
+    """
+    def __init__(self, result, num_datapoints):
+        list.__init__(self, result)
+        self.num_datapoints = num_datapoints
+        self.num_cycles = len(result[0]) // num_datapoints
+
+    def _cycles(self, data):
+        return np.asarray(data)[:self.num_cycles * self.num_datapoints].reshape(self.num_cycles, self.num_datapoints)
+
+    @property
+    def v_cycles(self):
+        return self._cycles(self[0])
+
+    @property
+    def i_cycles(self):
+        return self._cycles(self[1])
+
+    def mean(self):
+        '''
+        :return: [v, i] of the mean cycle
+        '''
+        return [self.v_cycles.mean(axis=0), self.i_cycles.mean(axis=0)]
+
+    def std(self):
+        '''
+        :return: the standard deviation of the current over the cycles at every datapoint of a cycle
+        '''
+        return self.i_cycles.std(axis=0)
+
+    def hysteresis_area(self):
+        '''
+        :return: the area enclosed by the forward and backward sweep of every cycle in V*A, positive when the current of
+            the forward sweep (towards v_max) is lower than that of the backward sweep
+        '''
+        v = self.v_cycles
+        i = self.i_cycles
+        # the integral of I dV around the closed cycle (trapezoids, including the step from the last to the first point)
+        dv = np.roll(v, -1, axis=1) - v
+        return -np.sum((i + np.roll(i, -1, axis=1)) * dv, axis=1) / 2.
+
+    def resistance(self, v_window=None, robust=False):
+        '''
+        :param v_window: only the datapoints with |V| <= v_window are fitted (None fits all datapoints)
+        :param robust: fit with fit_resistance_robust, which ignores outliers
+        :return: [R, I0, r2, R_error] of every cycle (see fitting.py)
+        '''
+        fit = fit_resistance_robust if robust else fit_resistance
+        return fit(self.v_cycles, self.i_cycles, v_window)
+
+
+def increase_breakpoint(v_max):
+    return max(v_max * (1 + v_max / 20), v_max + 0.1)  # higher increases at higher volts
+
+
+class BurnCycle(object):
+    '''
+    summary of one cycle of eburn_series
+    '''
+    def __init__(self, n, breakpoint, R, R_error, gain, flags, data, sweep, fails):
+        self.n = n  # cycle number, starting at 1
+        self.breakpoint = breakpoint  # highest voltage of the cycle in V
+        self.R = R  # resistance after the cycle in Ohm
+        self.R_error = R_error  # relative error of R fitted to the burn, or None if R was swept
+        self.gain = gain  # burn_gain during the cycle
+        self.flags = flags
+        [self.v, self.i] = data  # burn data (only the ramp down, unless the series keeps the data)
+        [self.v_R, self.i_R] = sweep  # resistance sweep, [None, None] if R was fitted to the burn
+        self.fails = fails  # number of consecutive failed (ohmic or overloaded) cycles
+        self.stop_reason = None  # set for the last cycle: 'R_crit', 'fails', 'max_cycles' or 'error'
+
 
 class ADwinFemto(object):
     loaded=False
-    def __init__(self, drain=1, source=1, gate = 2, iv_gain = 9, burn_gain = 4):
-        if not ADwinFemto.loaded:
+    _shadow = {}  # last written value of every par/fpar, shared like the instruments themselves
+    _femto_gain = None  # last gain setting sent to the FEMTO (None if unknown)
+    _run = 0  # counts the started measurements, so that an Acquisition knows when its data was overwritten
+    _emulator = None  # ADwinEmulator used instead of the hardware (see use_emulator)
+    _speed = 1.  # factor by which the ADwin time runs faster than real time (only differs from 1 on the emulator)
+    _output_voltage = {}  # voltage of every DAC channel that was written since loading, None while it is unknown
+    _swept = None  # DAC channel of the last Sweep_Linear run, whose output can be recovered from its data count
+    _read_range = None  # function that reads a window of a data array (see _range_reader), None reads whole arrays
+    def __init__(self, drain=1, source=1, gate = 2, iv_gain = 9, burn_gain = 4, emulator = None):
+        if emulator is None:
+            emulator = ADwinFemto._emulator
+        if emulator is not None:
+            if not ADwinFemto.loaded or ADwinFemto._adwin is not emulator.adwin:
+                ADwinFemto._emulator = emulator
+                ADwinFemto._adwin = emulator.adwin
+                ADwinFemto._femto = emulator.femto
+                ADwinFemto._speed = emulator.speed or float('inf')
+                ADwinFemto._shadow.clear()
+                ADwinFemto._output_voltage.clear()
+                ADwinFemto._femto_gain = None
+                ADwinFemto._processes = ProcessManager(ADwinFemto._adwin, _PROCESS_SOURCES)
+                ADwinFemto._read_range = _range_reader(ADwinFemto._adwin)
+                ADwinFemto.loaded = True
+        elif not ADwinFemto.loaded:
             ADwinFemto._adwin = qt.instruments.create('adwin_gold_ii', 'ADwin_Gold_II', dev=1)
             # self._adwin.boot()
             ADwinFemto._femto = qt.instruments.create('femto_dlpca_200', 'FEMTO_DLPCA_200', dev=1)
-            ADwinFemto._adwin.load_process(self._adwin.compile_process('C:\scripts\ADwin\Standard\DAC.bas', process=1))
-            ADwinFemto._adwin.load_process(self._adwin.compile_process('C:\scripts\ADwin\Standard\ADC.bas', process=2))
-            ADwinFemto._adwin.load_process(self._adwin.compile_process('C:\scripts\ADwin\Standard\Sweep_Linear.bas', process=3))
-            ADwinFemto._adwin.load_process(self._adwin.compile_process('C:\scripts\ADwin\Standard\Sweep_Triangle.bas', process=4))
-            ADwinFemto._adwin.load_process(self._adwin.compile_process('C:\scripts\ADwin\Standard\ElectroBurn.bas', process=5))
-            ADwinFemto._adwin.load_process(self._adwin.compile_process('C:\scripts\ADwin\Standard\ITTrace.bas', process=6))
+            ADwinFemto._processes = ProcessManager(ADwinFemto._adwin, _PROCESS_SOURCES)
+            ADwinFemto._read_range = _range_reader(ADwinFemto._adwin, dev=1)
+            if ADwinFemto._read_range is None:
+                print("Warning: the ADwin python package is not installed, the data arrays are read in full.")
             ADwinFemto.loaded=True
+        if not ADwinFemto._processes.verify():
+            ADwinFemto._shadow.clear()  # the ADwin was rebooted (or is new), so its parameters are reset as well
+            ADwinFemto._output_voltage.clear()
         self._adwin = ADwinFemto._adwin
         self._femto = ADwinFemto._femto
         self.set_input_channel(drain)
@@ -152,7 +620,31 @@ class ADwinFemto(object):
         self.burn_gain = burn_gain
         self._busy_par = 'par20' # initial busy parameter (just so that we don't crash)
         self._iv_gain_list = ['','','','L3','L4','L5','L6','L7','L8','L9']
-            
+        self._pending = {}  # parameters to upload before the next process start (see _set)
+        self._t_expected = 0  # time at which the running process is expected to be done (see _start_process)
+        self.wait_timeout = None  # default timeout in s for the blocking calls (None waits until the process is done)
+        self.cancel_hook = None  # callable that returns True when a blocking call should stop the running process
+
+
+    @staticmethod
+    def use_emulator(emulator):
+        '''
+        makes all ADwinFemto instruments that are created from now on use the emulator instead of the hardware
+
+        :param emulator: ADwinEmulator (see adwin_emulator.py), None to use the hardware again
+        '''
+        if ADwinFemto._emulator is not None and emulator is None:
+            ADwinFemto.loaded = False
+            ADwinFemto._speed = 1.
+        ADwinFemto._emulator = emulator
+
+    def _now(self):
+        '''
+        :return: the time in s (the emulated time when the ADwin is emulated)
+        '''
+        if ADwinFemto._emulator is not None:
+            return ADwinFemto._emulator.time
+        return time.time()
 
     def set_input_channel(self, channel):
         self._input_channel = channel
@@ -163,158 +655,403 @@ class ADwinFemto(object):
     def set_gate_channel(self, channel):
         self._gate_channel = channel
 
+    @timed('femto.set_gain')
     def set_gain(self,gain):
         try:
-            self._femto.set('gain',self._iv_gain_list[gain])
+            setting = self._iv_gain_list[gain]
         except:
-            self._femto.set('gain',gain)
+            setting = gain
+        if setting != ADwinFemto._femto_gain:  # only talk to the FEMTO when the gain changes
+            self._femto.set('gain',setting)
+            ADwinFemto._femto_gain = setting
+
+    def invalidate_gain(self):
+        '''
+        forgets the gain setting of the FEMTO, so that the next set_gain is sent to the instrument. Use this when the
+        gain was changed on the front panel.
+        '''
+        ADwinFemto._femto_gain = None
 
     def _voltage_to_digit(self, v):
         return int(65535 / 20.0 * (v + 10.0))
 
     def _digit_to_voltage(self, d):
-        return (d * 20.0 / 65535 - 10.0)
+        return d * _DIGIT_SCALE + _DIGIT_OFFSET
 
     def is_busy(self):
         return self._adwin.get(self._busy_par)
 
+    def _set(self, name, value):
+        '''
+        stages an ADwin parameter for upload. Staged parameters are sent by _flush_parameters (which is done when a
+        process is started), and only when they differ from the value that was last written.
+
+        :param name: parameter name (parNN or fparNN)
+        :param value: parameter value
+        '''
+        self._pending[name] = float(value) if name.startswith('fpar') else int(value)
+
+    def _flush_parameters(self):
+        '''
+        uploads the staged parameters that changed since they were last written, in a single call of the qt driver.
+        The driver (and the ADwin python package, which has no block writes for par/fpar) still writes every
+        parameter in its own transaction, so the saving is in the parameters that are not written.
+        '''
+        changed = {}
+        for name in self._pending:
+            value = self._pending[name]
+            if name in _VOLATILE_PARAMETERS or ADwinFemto._shadow.get(name) != value:
+                changed[name] = value
+        self._pending = {}
+        if changed:
+            self._adwin.set(changed, fast=True)
+            ADwinFemto._shadow.update(changed)
+
+    def invalidate_parameters(self):
+        '''
+        forgets the last written parameter values, so that all parameters are uploaded again. Use this when the ADwin
+        was rebooted or parameters were changed by another program. The processes are then verified, and loaded again
+        when the ADwin was rebooted.
+        '''
+        ADwinFemto._shadow.clear()
+        ADwinFemto._output_voltage.clear()
+        ADwinFemto._processes.verify()
+
+    @timed('adwin.transfer')
+    def _get_array(self, index, start, stop):
+        '''
+        reads the window [start, stop) of an ADwin data array. Only the window is transferred (see _range_reader),
+        unless ranged reads are not available: then the full array is fetched and sliced.
+
+        :param index: number of the data array (1 for data1)
+        :param start: index of the first element
+        :param stop: index after the last element
+        :return: numpy array with the raw data
+        '''
+        if stop <= start:
+            return np.array([])
+        if ADwinFemto._read_range is not None:
+            return np.asarray(ADwinFemto._read_range(index, start, stop - start))
+        return np.array(self._adwin.get('data%d' % index)[start:stop])
+
+    def _read_iv(self, start, count, gain):
+        '''
+        reads the voltage (data1) and current (data2) of a sweep or burn in real units
+
+        :param start: index of the first datapoint
+        :param count: index after the last datapoint
+        :param gain: order of magnitude of the FEMTO gain during the measurement
+        :return: [v, i, flags], where flags identify under/overloading (also when autogain was not used)
+        '''
+        v = _digits_to_units(self._get_array(1, start, count))
+        i = self._get_array(2, start, count)
+        return [v, _digits_to_units(i, gain), _load_flags(i)]
+
+    def _read_it(self, start, count, processdelay, both):
+        '''
+        reads a current versus time trace in real units
+
+        :param start: index of the first datapoint
+        :param count: index after the last datapoint
+        :param processdelay: process delay of the trace, to convert the time stamps to s
+        :param both: True if both ADC channels were recorded
+        :return: [t, i, flags]. If both channels were recorded, i is [i1, i2], where only the input channel is
+            corrected for the gain
+        '''
+        t = self._get_array(1, start, count) * (processdelay / PROCESS_CLOCK)
+        i = self._get_array(2, start, count)
+        if not both:
+            return [t, _digits_to_units(i, self.iv_gain), _load_flags(i)]
+        i2 = self._get_array(3, start, count)
+        if self._input_channel == 1:
+            return [t, [_digits_to_units(i, self.iv_gain), _digits_to_units(i2)], _load_flags(i)]
+        return [t, [_digits_to_units(i), _digits_to_units(i2, self.iv_gain)], _load_flags(i2)]
+
+    def _start_process(self, process, duration=0.):
+        '''
+        loads the process if needed, uploads the staged parameters, starts an ADwin process and remembers when it should be done, so that waiting
+        for it does not need to poll
+
+        :param process: ADwin process number
+        :param duration: expected run time of the process in s (a lower bound, 0 if unknown)
+        '''
+        ADwinFemto._processes.require(process)
+        self._flush_parameters()
+        self._t_expected = time.time() + max(duration, 0.) / ADwinFemto._speed
+        if process in _DATA_PROCESSES:
+            ADwinFemto._run += 1
+        self._adwin.start_process(process)
+
+    @timed('adwin.wait')
+    def _wait(self, busy_par, timeout=None, cancel=None):
+        '''
+        waits for the process signalled by busy_par. Sleeps until shortly before the expected end of the process without
+        talking to the ADwin, waking every _WAIT_SLICE to check the timeout, the cancel callable and stop(), which ends
+        the process early. Then it polls the busy parameter with an interval that grows from _POLL_INTERVAL_MIN to
+        _POLL_INTERVAL_MAX.
+
+        :param busy_par: the busy parameter of the process
+        :param timeout: maximum waiting time in s, after which the process is stopped (None waits indefinitely)
+        :param cancel: callable, the process is stopped as soon as it returns True
+        :return: True if the process completed, False if it was stopped
+        '''
+        t_timeout = None if timeout is None else time.time() + timeout
+        interval = _POLL_INTERVAL_MIN
+        stopped = False
+        while True:
+            now = time.time()
+            t_poll = self._t_expected - _WAIT_MARGIN  # stop() moves the expected end to the time of the stop
+            if now < t_poll:
+                _msleep(min(t_poll - now, _WAIT_SLICE))
+            else:
+                if not self._adwin.get(busy_par):
+                    return not stopped
+                if stopped and now > t_poll + _WAIT_MARGIN + _WAIT_STOP_GRACE:
+                    print("Warning: ADwin process did not acknowledge the stop request.")
+                    return False
+                _msleep(interval)
+                interval = min(interval * _POLL_INTERVAL_GROWTH, _POLL_INTERVAL_MAX)
+            if not stopped and ((t_timeout is not None and time.time() > t_timeout) or (cancel is not None and cancel())):
+                self.stop()  # from now on, only wait for the process to acknowledge the stop
+                stopped = True
+                interval = _POLL_INTERVAL_MIN
+
+    def wait(self, timeout=None, cancel=None):
+        '''
+        waits for the running measurement (started with wait_for_complete = False) to complete
+
+        :param timeout: maximum waiting time in s, after which the measurement is stopped (defaults to wait_timeout)
+        :param cancel: callable, the measurement is stopped as soon as it returns True (defaults to cancel_hook)
+        :return: True if the measurement completed, False if it was stopped
+        '''
+        if timeout is None:
+            timeout = self.wait_timeout
+        if cancel is None:
+            cancel = self.cancel_hook
+        return self._wait(self._busy_par, timeout, cancel)
+
+    def _gains(self):
+        return [gain for gain in range(len(self._iv_gain_list)) if self._iv_gain_list[gain]]
+
+    @timed('adwin.auto_gain')
+    def _auto_gain(self, measure):
+        '''
+        sets iv_gain such that measure() is within the measurable window. Instead of stepping one decade per
+        measurement, the gain jumps directly to the predicted decade (see _predict_gain) and is verified by one more
+        measurement. An overloaded measurement does not tell the amplitude, so it is first measured at the lowest gain.
+        That makes at most two measurements, or three after an overload.
+
+        :param measure: function that measures at the current iv_gain, returns [peak FEMTO output in V, result]
+        :return: the result of the last measurement
+        '''
+        [peak, result] = measure()
+        jumps = 2 if peak > _OVERLOAD_THRESHOLD else 1  # after an overload: to the lowest gain, then the prediction
+        for _ in range(jumps):
+            gain = _predict_gain(peak, self.iv_gain, self._gains())
+            if gain == self.iv_gain:
+                break
+            self.iv_gain = gain
+            self.set_gain(self.iv_gain)
+            [peak, result] = measure()
+        #print("autogained to 10^%d" % self.iv_gain)
+        return result
+
     def _auto_gain_iv(self,r,electrode='source'):
-        successful = False
-        while not successful:
+        def measure():
             # set adwin parameters to measure a single fast sweep
             if electrode == 'gate':
-                self._adwin.set('par21', self._gate_channel)
+                self._set('par21', self._gate_channel)
             else:
-                self._adwin.set('par21', self._output_channel)
-            self._adwin.set('par22', self._input_channel)
-            self._adwin.set('par23', self._voltage_to_digit(r[0]))
-            self._adwin.set('par24', self._voltage_to_digit(r[1]))
-            self._adwin.set('par25', (self._voltage_to_digit(r[1])-self._voltage_to_digit(r[0])) / 9)
-            self._adwin.set('par26', 5000)
-            self._adwin.set('par27', 5)
-            self._adwin.set('par28', 10)
-            
+                self._set('par21', self._output_channel)
+            self._set('par22', self._input_channel)
+            self._set('par23', self._voltage_to_digit(r[0]))
+            self._set('par24', self._voltage_to_digit(r[1]))
+            self._set('fpar25', (self._voltage_to_digit(r[1])-self._voltage_to_digit(r[0])) / 9.)
+            self._set('par26', 5000)
+            self._set('par27', 5)
+            self._set('par28', 10)
+
             self.write(r[0],electrode=electrode)
-            self._adwin.start_process(3)  # run the sweep_linear program
-            while self._adwin.get('par30'): pass  # wait while the adwin program is busy
+            self._start_process(3, 5000 * 5 * 10 / PROCESS_CLOCK)  # run the sweep_linear program
+            self._drive(self._channel(electrode), 3)
+            if self._wait('par30'):  # wait while the adwin program is busy
+                ADwinFemto._output_voltage[self._channel(electrode)] = float(r[1])
             count = self._adwin.get('par29')  # count the data
-            i = np.array(self._adwin.get('data2')[:(count)]) * (20.0 / 65535) - 10.0                      
-            if (np.max(np.absolute(i)) > _OVERLOAD_THRESHOLD):
-                if self._iv_gain_list[self.iv_gain-1] != '':
-                    self.iv_gain -= 1
-                    self.set_gain(self.iv_gain)
-                else:
-                    successful = True
-            elif (np.max(np.absolute(i)) < _UNDERLOAD_THRESHOLD):
-                try:
-                    _ = self._iv_gain_list[self.iv_gain+1]
-                    self.iv_gain += 1
-                    self.set_gain(self.iv_gain)
-                except:
-                    successful = True
-            else:
-                successful = True
-            #print("autogained to 10^%d" % self.iv_gain)
+            i = self._get_array(2, 0, count)
+            return [_peak_voltage(i) if i.size else 0., None]
+        self._auto_gain(measure)
+
+    def adjust_burn_gain(self, i, flags):
+        '''
+        predicts the burn_gain for the next electroburning cycle from the current of the last cycle (see _predict_gain).
+        The gain only changes when the last cycle was under- or overloaded. As the burn cannot be repeated to verify the
+        gain, an overloaded burn steps down one decade at a time.
+
+        :param i: current of the last burn cycle in A (as returned by eburn)
+        :param flags: flags of the last burn cycle
+        :return: the new burn_gain
+        '''
+        i = np.asarray(i)
+        if i.size and flags & (ADWIN_FLAG_UNDERLOAD | ADWIN_FLAG_OVERLOAD | ADWIN_FLAG_BURN_I_OVERLOAD):
+            peak = np.max(np.absolute(i)) * 10 ** self.burn_gain
+            if flags & ADWIN_FLAG_BURN_I_OVERLOAD:
+                peak = max(peak, 2 * _OVERLOAD_THRESHOLD)
+            self.burn_gain = _predict_gain(peak, self.burn_gain, self._gains(), overload_step=1)
+        return self.burn_gain
 
+    @timed('adwin.write')
     def write_gate(self,v):
-        self._adwin.set('par1', self._gate_channel)
-        self._adwin.set('par2', self._voltage_to_digit(v))
+        self._set('par1', self._gate_channel)
+        self._set('par2', self._voltage_to_digit(v))
+        self._flush_parameters()
+        ADwinFemto._processes.require(1)
         self._adwin.start_process(1)
+        ADwinFemto._output_voltage[self._gate_channel] = float(v)
 
+    @timed('adwin.write')
     def write(self,v,electrode='source'):
-        if electrode == 'gate':
-            self._adwin.set('par1', self._gate_channel)
-        else:
-            self._adwin.set('par1', self._output_channel)
-        self._adwin.set('par2', self._voltage_to_digit(v))
+        channel = self._channel(electrode)
+        self._set('par1', channel)
+        self._set('par2', self._voltage_to_digit(v))
+        self._flush_parameters()
+        ADwinFemto._processes.require(1)
         self._adwin.start_process(1)
+        ADwinFemto._output_voltage[channel] = float(v)
+
+    @timed('adwin.ramp')
+    def ramp(self, target, rate=1., electrode='gate', v_start=None):
+        '''
+        ramps an output to the target voltage at a constant rate. The ramp runs on the ADwin (Sweep_Linear.bas), so it
+        takes as long as the rate requires and no longer. The driver remembers the voltage every channel was left at
+        (see _output): when the output is already at the target, nothing is sent.
+
+        :param target: voltage in V
+        :param rate: ramp rate in V/s
+        :param electrode: 'gate' or 'source'
+        :param v_start: voltage the output is at in V, None uses the voltage the driver remembers. Needed when a
+            measurement on the output was stopped halfway (other than a sweep_linear or ramp).
+        :return: True if the output reached the target, False if the ramp was stopped (see wait) or not started
+        '''
+        if not rate > 0:
+            print("Error: the ramp rate should be positive.")
+            return False
+        channel = self._channel(electrode)
+        target = float(target)
+        if v_start is None:
+            v_start = self._output(channel)
+            if v_start is None:
+                print("Error: the %s output was left at an unknown voltage, ramp it with v_start." % electrode)
+                return False
+        v_start = float(v_start)
+        [d_start, d_stop] = [self._voltage_to_digit(v_start), self._voltage_to_digit(target)]
+        if d_start == d_stop:  # already there (within one DAC step)
+            return True
+        duration = abs(target - v_start) / float(rate)
+        # one datapoint per DAC step, as long as the process delay allows it and the ramp fits in the buffer
+        num_datapoints = int(max(2, min(abs(d_stop - d_start) + 1, BUFFER_SIZE,
+                                        duration * PROCESS_CLOCK / PROCESSDELAY_MINIMUM)))
+        processdelay = max(int(PROCESS_CLOCK * duration / num_datapoints), PROCESSDELAY_MINIMUM)
+        self._set('par21', channel)
+        self._set('par22', self._input_channel)
+        self._set('par23', d_start)
+        self._set('par24', d_stop)
+        self._set('fpar25', float(d_stop - d_start) / (num_datapoints - 1))
+        self._set('par26', processdelay)
+        self._set('par27', 1)
+        self._set('par28', num_datapoints)
+        self._busy_par = 'par30'
+        self._start_process(3, processdelay * num_datapoints / PROCESS_CLOCK)
+        self._drive(channel, 3)
+        if self.wait():
+            ADwinFemto._output_voltage[channel] = target
+            return True
+        return False  # stopped somewhere along the ramp, _output recovers where
+
+    def _drive(self, channel, process):
+        '''
+        forgets the voltage of a DAC channel while a process drives it. The process (or the Acquisition waiting for it)
+        sets the voltage again when it completes.
 
+        :param channel: DAC channel
+        :param process: ADwin process number that drives the channel
+        '''
+        ADwinFemto._output_voltage[channel] = None
+        if process == 3:
+            ADwinFemto._swept = channel
+        elif ADwinFemto._swept == channel:
+            ADwinFemto._swept = None
+
+    def _output(self, channel):
+        '''
+        :param channel: DAC channel
+        :return: the voltage the channel was left at in V: the voltage last written to it, 0 V if it was not written
+            since the ADwin was loaded, and for a stopped Sweep_Linear run the last voltage it output (from its start,
+            step and data count). None if the voltage is unknown.
+        '''
+        if not channel in ADwinFemto._output_voltage:
+            return 0.
+        v = ADwinFemto._output_voltage[channel]
+        if v is None and ADwinFemto._swept == channel and not self._adwin.get('par30'):
+            count = self._adwin.get('par29')
+            d = self._adwin.get('par23') + max(count - 1, 0) * self._adwin.get('fpar25')
+            v = ADwinFemto._output_voltage[channel] = self._digit_to_voltage(int(round(d)))
+        return v
+
+    def _channel(self, electrode):
+        '''
+        :return: the DAC channel of the electrode ('gate' or 'source')
+        '''
+        if electrode == 'gate':
+            return self._gate_channel
+        return self._output_channel
+
+    @timed('adwin.read')
     def read(self, auto_gain = True):
-        successful = False
-        i=0
-        while not successful:
+        def measure():
             self._busy_par = 'par20'
-            self.set_gain(self.iv_gain)
-            self._adwin.set('par11', self._input_channel)
-            self._adwin.set('par12', self._input_channel)
-            self._adwin.set('par19', 50) # this is the number of datapoints to be averaged. hardcoded could be changed.
-            self._adwin.start_process(2)
-            while self._adwin.get(self._busy_par): pass  # wait until done
+            self._set('par11', self._input_channel)
+            self._set('par12', self._input_channel)
+            self._set('par19', 50) # this is the number of datapoints to be averaged. hardcoded could be changed.
+            self._start_process(2, 50 * _ADC_PROCESSDELAY / PROCESS_CLOCK)
+            self.wait()  # wait until done
             i = self._digit_to_voltage(self._adwin.get('par11'))
-            if not auto_gain:
-                successful = True
-            else:
-                if (abs(i) > _OVERLOAD_THRESHOLD):
-                    if self._iv_gain_list[self.iv_gain-1] != '':
-                        self.iv_gain -= 1
-                        self.set_gain(self.iv_gain)
-                    else:
-                        successful = True
-                elif (abs(i) < _UNDERLOAD_THRESHOLD):
-                    try:
-                        _ = self._iv_gain_list[self.iv_gain+1]
-                        self.iv_gain += 1
-                        self.set_gain(self.iv_gain)
-                    except:
-                        successful = True
-                else:
-                    successful = True
+            return [abs(i), i]
+        self.set_gain(self.iv_gain)
+        if auto_gain:
+            i = self._auto_gain(measure)
+        else:
+            i = measure()[1]
         return i*(10**(-self.iv_gain))
 
+    @timed('adwin.get_data')
     def get_data(self,start=0):
+        '''
+        reads the data of the last started measurement from index start onwards, also while it is still running. Only
+        the new data is transferred, so polling with the returned count as the next start costs O(new points).
+
+        :param start: index of the first datapoint to read
+        :return: [v or t, i, flags, count], where count is the start index for the next call
+        '''
         flag = 0
         if self.is_busy():
             flag |= ADWIN_FLAG_DATA_INCOMPLETE
         if self._busy_par == 'par30' or self._busy_par == 'par50':  # sweeps
-            count = self._adwin.get('par29')  # get the data count
-            v = np.array(self._adwin.get('data1')[start:(count - 1)]) * (20.0 / 65535) - 10.0  # get voltage digit and transform into real units
-            i = np.array(self._adwin.get('data2')[start:(count - 1)]) * (20.0 / 65535) - 10.0  # get current digit transform into real units
-            # in case autogain was not used, flags can still identify under/overloading
-            if not v.size and not i.size:
-                flag |= ADWIN_FLAG_NO_DATA
-            if np.max(np.absolute(i)) < _UNDERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_UNDERLOAD
-            elif np.max(np.absolute(i)) > _OVERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_OVERLOAD
-            return [v,i*(10**(-self.iv_gain)), flag, count]
+            count = self._adwin.get('par29' if self._busy_par == 'par30' else 'par49')  # get the data count
+            [v, i, load_flag] = self._read_iv(start, count, self.iv_gain)
+            return [v, i, flag | load_flag, count]
         elif self._busy_par == 'par60':  # current versus time
             count = self._adwin.get('par57')  # get the data count
-            clock = self._adwin.get('par54')
-            t = np.array(self._adwin.get('data1')[start:count]) * (clock/PROCESS_CLOCK)  # get voltage digit and transform into real units
-            i = np.array(self._adwin.get('data2')[start:count]) * (20.0 / 65535) - 10.0  # get current digit transform into real units
-            flag_i = i
-            if self._adwin.get('par52') == 0:
-                i2 = np.array(self._adwin.get('data3')[start:count]) * (20.0 / 65535) - 10.0  # get current digit transform into real units
-                if self._input_channel == 1:
-                    flag_i = i
-                    i = [i*10**(-self.iv_gain),i2]
-                else:
-                    flag_i = i2
-                    i = [i,i2*10**(-self.iv_gain)]
-            if not t.size and not flag_i.size:
-                flag |= ADWIN_FLAG_NO_DATA
-            if np.max(np.absolute(flag_i)) < _UNDERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_UNDERLOAD
-            elif np.max(np.absolute(flag_i)) > _OVERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_OVERLOAD
-            if self._adwin.get('par52') > 0:
-                i*=10**(-self.iv_gain)
-            return [t, i, flag, count]
+            [t, i, load_flag] = self._read_it(start, count, self._adwin.get('par54'), self._adwin.get('par52') == 0)
+            return [t, i, flag | load_flag, count]
         elif self._busy_par == 'par40':  # electroburning
             count = self._adwin.get('par39')  # get the amount of datapoints
-            v = np.array(self._adwin.get('data1')[:count]) * (20.0 / 65535) - 10.0  # get voltage digit and transform into real units
-            i = np.array(self._adwin.get('data2')[:count]) * (20.0 / 65535) - 10.0  # get current digit transform into real units
-            flag = self._adwin.get('par37')  # get the burn flags
-            if not v.size and not i.size:
-                flag |= ADWIN_FLAG_NO_DATA
-            if np.max(np.absolute(i)) < _UNDERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_UNDERLOAD
-            elif np.max(np.absolute(i)) > _OVERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_OVERLOAD
-            return [v, i*(10**(-self.burn_gain)), flag, count]
+            [v, i, load_flag] = self._read_iv(start, count, self.burn_gain)
+            flag |= self._adwin.get('par37')  # get the burn flags
+            return [v, i, flag | load_flag, count]
         else:
             return [[],[],ADWIN_FLAG_NO_DATA | ADWIN_FLAG_ERROR,0]
 
+    @timed('adwin.sweep_linear')
     def sweep_linear(self,v_min,v_max,num_datapoints=100, electrode = 'source', scan_rate=-1, time_per_scan=-1,
                      scan_frequency=1,  num_average=1, auto_gain = True, wait_for_complete = True):
         
@@ -341,45 +1078,36 @@ class ADwinFemto(object):
             scan_rate = v_bias / time_per_scan
         # set the output and input channels to those set in the class
         if electrode == 'gate':
-            self._adwin.set('par21' , self._gate_channel)
+            self._set('par21' , self._gate_channel)
         else:
-            self._adwin.set('par21', self._output_channel)
-        self._adwin.set('par22' , self._input_channel)
+            self._set('par21', self._output_channel)
+        self._set('par22' , self._input_channel)
         # set the range and stepsize of the measurement
-        self._adwin.set('par23' , self._voltage_to_digit(v_min))
-        self._adwin.set('par24' , self._voltage_to_digit(v_max))
+        self._set('par23' , self._voltage_to_digit(v_min))
+        self._set('par24' , self._voltage_to_digit(v_max))
         # there are num_datapoints-1 steps to do in a linear sweep, set the correct stepsize
-        self._adwin.set('fpar25' , float(self._voltage_to_digit(v_max)-self._voltage_to_digit(v_min))/float(num_datapoints-1))
+        self._set('fpar25' , float(self._voltage_to_digit(v_max)-self._voltage_to_digit(v_min))/float(num_datapoints-1))
         # set the process delay
         processdelay = int(PROCESS_CLOCK * time_per_scan / (num_datapoints*num_average))
         if processdelay < PROCESSDELAY_MINIMUM:
             print("Warning: attempting to measure too fast, decrease scan_rate, num_datapoints, or num_average.")
-        self._adwin.set('par26', processdelay)
+        self._set('par26', processdelay)
         # set the number of averaging
-        self._adwin.set('par27', num_average)
+        self._set('par27', num_average)
         # set the number of datapoints to measure
-        self._adwin.set('par28', num_datapoints)
+        self._set('par28', num_datapoints)
         # preset the starting voltage
         self.write(v_min,electrode=electrode)
         self._busy_par = 'par30'
-        self._adwin.start_process(3)  # run the sweep_linear program
+        self._start_process(3, processdelay * num_average * num_datapoints / PROCESS_CLOCK)  # run the sweep_linear program
+        self._drive(self._channel(electrode), 3)
+        acquisition = Acquisition(self, 'par30', 'par29', self.iv_gain, output=[self._channel(electrode), v_max])
         if wait_for_complete:
-            while self._adwin.get(self._busy_par): pass  # wait while the adwin program is busy
-            v = np.array(self._adwin.get('data1')[:num_datapoints]) * (20.0 / 65535) - 10.0
-            i = np.array(self._adwin.get('data2')[:num_datapoints]) * (20.0 / 65535) - 10.0
-            # in case autogain was not used, flags can still identify under/overloading
-            flag = 0
-            if not v.size and not i.size:
-                flag |= ADWIN_FLAG_NO_DATA
-            if np.max(np.absolute(i)) < _UNDERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_UNDERLOAD
-            elif np.max(np.absolute(i)) > _OVERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_OVERLOAD
-            return [v,i*(10**(-self.iv_gain)),flag]
-        else:
-            return [[],[],ADWIN_FLAG_DATA_INCOMPLETE | ADWIN_FLAG_NO_DATA]
+            return acquisition.result()  # wait while the adwin program is busy
+        return acquisition
 
 
+    @timed('adwin.sweep_triangle')
     def sweep_triangle(self, v_min, v_max, v_start=0, num_datapoints=200, electrode = 'source', scan_rate=-1.,
                        time_per_cycle=-1., cycle_frequency=1, num_average=1, num_cycles=1, auto_gain = True,
                        wait_for_complete = True):
@@ -398,10 +1126,10 @@ class ADwinFemto(object):
             self._auto_gain_iv((v_min,v_max),electrode=electrode)  # sets the gain to be able to record the iv trace
         self.write(v_start,electrode=electrode)  # output the starting voltage
         if electrode == 'gate':
-            self._adwin.set('par41', self._gate_channel)
+            self._set('par41', self._gate_channel)
         else:
-            self._adwin.set('par41', self._output_channel)
-        self._adwin.set('par42' , self._input_channel)
+            self._set('par41', self._output_channel)
+        self._set('par42' , self._input_channel)
         v_bias = v_max-v_min
         if scan_rate > 0:  # scan_rate is in V/s
             time_per_cycle = 2 * v_bias/scan_rate  # in seconds
@@ -416,40 +1144,73 @@ class ADwinFemto(object):
         processdelay = int(PROCESS_CLOCK * time_per_cycle / (num_datapoints*num_average))
         if processdelay < PROCESSDELAY_MINIMUM:
             print("Warning: attempting to measure too fast, decrease scan_rate, num_datapoints, or num_average.")
-        self._adwin.set('par43', processdelay)
+        self._set('par43', processdelay)
         # set the voltages
-        self._adwin.set('par44', self._voltage_to_digit(v_min))
-        self._adwin.set('par45', self._voltage_to_digit(v_max))
-        self._adwin.set('par46', self._voltage_to_digit(v_start))
+        self._set('par44', self._voltage_to_digit(v_min))
+        self._set('par45', self._voltage_to_digit(v_max))
+        self._set('par46', self._voltage_to_digit(v_start))
         # set the step size based on the number of data points and maximum bias
-        self._adwin.set('fpar41', ((2*v_bias)/(num_datapoints-2))*(65535/20))
+        self._set('fpar41', ((2*v_bias)/(num_datapoints-2))*(65535/20))
         # set the number of cycles the script takes
-        self._adwin.set('par47', num_cycles)
+        self._set('par47', num_cycles)
         # set the number of averaging
-        self._adwin.set('par48', num_average)
+        self._set('par48', num_average)
         # start the process
         self._busy_par = 'par50'
-        self._adwin.start_process(4)
+        self._start_process(4, processdelay * num_average * num_datapoints * num_cycles / PROCESS_CLOCK)
+        self._drive(self._channel(electrode), 4)
+        acquisition = Acquisition(self, 'par50', 'par49', self.iv_gain, cycle_length=num_datapoints,
+                                  output=[self._channel(electrode), float(v_start)])  # every cycle returns to v_start
         if wait_for_complete:
-            while self._adwin.get(self._busy_par): pass
-            count = self._adwin.get('par49')
-            v =  np.array(self._adwin.get('data1')[:count]) * (20.0 / 65535) - 10.0
-            i =  np.array(self._adwin.get('data2')[:count]) * (20.0 / 65535) - 10.0
-            # in case autogain was not used, flags can still identify under/overloading
-            flag = 0
-            if not v.size and not i.size:
-                flag |= ADWIN_FLAG_NO_DATA
-            if np.max(np.absolute(i)) < _UNDERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_UNDERLOAD
-            elif np.max(np.absolute(i)) > _OVERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_OVERLOAD
-            return [v,i*(10**(-self.iv_gain)),flag]
-        else:
-            return [[],[],ADWIN_FLAG_DATA_INCOMPLETE | ADWIN_FLAG_NO_DATA]
+            return acquisition.result()
+        return acquisition
 
+    @timed('adwin.stability_diagram')
+    def stability_diagram(self, vg, v_min, v_max, num_datapoints=100, time_per_scan=-1, scan_frequency=1, num_average=1,
+                          gain=None):
+        '''
+        measures a stability diagram row by row: the gate is written and a linear bias sweep (see sweep_linear) is run
+        for every gate voltage. The sweep parameters are only uploaded for the first row, so a gate step only writes
+        the gate and the start of the sweep, and starts the sweep.
+
+        :param vg: gate voltages in V, one row of the diagram each
+        :param gain: FEMTO gain (order of magnitude) of the whole diagram. None sets the gain with auto gain at the first
+            gate voltage, and lowers it one decade when a row overloads (that row is then measured again, and the
+            later rows keep the lower gain).
+        :return: [v, i, flags]: v = bias voltages (num_datapoints), i = current in A (len(vg), num_datapoints),
+            flags = numpy array of the flags of every row. Rows after a stopped row are flagged ADWIN_FLAG_NO_DATA.
+        '''
+        vg = np.atleast_1d(np.asarray(vg, dtype=float))
+        i = np.zeros((vg.size, num_datapoints))
+        flags = np.zeros(vg.size, dtype=int)
+        v = np.zeros(num_datapoints)
+        if gain is not None:
+            self.iv_gain = gain
+        for row in range(vg.size):
+            self.write_gate(vg[row])
+            if gain is None and row == 0:
+                self.set_gain(self.iv_gain)
+                self._auto_gain_iv((v_min, v_max))
+            for _ in range(len(self._gains())):  # the gain only steps down, so every gain is measured at most once
+                [v_row, i_row, flag] = self.sweep_linear(v_min, v_max, num_datapoints=num_datapoints,
+                                                         time_per_scan=time_per_scan, scan_frequency=scan_frequency,
+                                                         num_average=num_average, auto_gain=False)
+                lower = [g for g in self._gains() if g < self.iv_gain]
+                if gain is not None or not flag & ADWIN_FLAG_OVERLOAD or not lower:
+                    break
+                self.iv_gain = lower[-1]  # the amplitude of an overloaded row is unknown, step one decade
+            flags[row] = flag
+            if len(i_row) == num_datapoints:
+                [v, i[row]] = [v_row, i_row]
+            if flag & ADWIN_FLAG_DATA_INCOMPLETE:  # stopped
+                flags[row + 1:] = ADWIN_FLAG_NO_DATA | ADWIN_FLAG_DATA_INCOMPLETE
+                break
+        return [v, i, flags]
+
+    @timed('adwin.eburn')
     def eburn(self, v_rate_up = 7.5, v_rate_down = 2000, max_voltage = 10, hold_at_10 = 1, feedback_high = 36.6,
               feedback_low = 6.1, feedback_center = 1.5, feedback_steepness = 0.8, threshold_resistance = 1e9,
-              process_delay=6000, wait_for_complete = True):
+              process_delay=6000, wait_for_complete = True, fit_resistance = False):
         '''
         runs a cycle of electroburning for the adwin
 
@@ -463,7 +1224,8 @@ class ADwinFemto(object):
         :param feedback_steepness: steepness of the feedback parameter switch between high and low
         :param threshold_resistance: threshold resistance at which to trigger
         :param wait_for_complete: wait for the process to complete before proceeding, or proceed with python code while the adwin is busy
-        :return: tuple of V data, I data and flags
+        :param fit_resistance: also return [R, relative error of R] fitted to the ramp down (see fit_burn_resistance)
+        :return: tuple of V data, I data and flags, or an Acquisition if wait_for_complete is False
 
         adwin communication parameters:
         pc >> adwin
@@ -499,37 +1261,124 @@ class ADwinFemto(object):
         siglow *= process_delay / PROCESS_CLOCK 
         # should be 24 at gain 4
         # set the required parameters for the script
-        self._adwin.set('par31', self._input_channel)
-        self._adwin.set('par32', self._output_channel)
-        self._adwin.set('par33', self._voltage_to_digit(max_voltage))
-        self._adwin.set('par34', hold_at_10 / (process_delay / PROCESS_CLOCK))
-        self._adwin.set('par35', process_delay)  # process delay
-        self._adwin.set('fpar31', (v_rate_up * (65535 / 20)) * (process_delay / PROCESS_CLOCK))
-        self._adwin.set('fpar32', (v_rate_down * (65535 / 20)) * (process_delay / PROCESS_CLOCK))
-        self._adwin.set('fpar33', sighigh)
-        self._adwin.set('fpar34', siglow)
-        self._adwin.set('fpar35', feedback_center)
-        self._adwin.set('fpar36', feedback_steepness)
-        self._adwin.set('fpar37', 10 ** self.burn_gain)
-        self._adwin.set('fpar38', threshold_resistance)
+        self._set('par31', self._input_channel)
+        self._set('par32', self._output_channel)
+        self._set('par33', self._voltage_to_digit(max_voltage))
+        self._set('par34', hold_at_10 / (process_delay / PROCESS_CLOCK))
+        self._set('par35', process_delay)  # process delay
+        self._set('fpar31', _burn_step(v_rate_up, process_delay))
+        self._set('fpar32', _burn_step(v_rate_down, process_delay))
+        self._set('fpar33', sighigh)
+        self._set('fpar34', siglow)
+        self._set('fpar35', feedback_center)
+        self._set('fpar36', feedback_steepness)
+        self._set('fpar37', 10 ** self.burn_gain)
+        self._set('fpar38', threshold_resistance)
         self._busy_par = 'par40'
-        self._adwin.start_process(5)
+        # the ramp up to max_voltage, unless the burn triggers before (it is then noticed at the end of the ramp)
+        self._start_process(5, abs(max_voltage) / float(v_rate_up) if v_rate_up > 0 else 0.)
+        self._drive(self._output_channel, 5)
+        acquisition = Acquisition(self, 'par40', 'par39', self.burn_gain, flag_par='par38',
+                                  output=[self._output_channel, 0.])  # the burn ends with the ramp down
         if wait_for_complete:
-            while self._adwin.get(self._busy_par): pass  # test the busy parameter until adwin is finished one cycle
-            count = self._adwin.get('par39')  # get the amount of datapoints
-            v = np.array(self._adwin.get('data1')[:count]) * (20.0 / 65535) - 10.0  # get voltage digit and transform into real units
-            i = np.array(self._adwin.get('data2')[:count]) * (20.0 / 65535) - 10.0  # get current digit transform into real units
-            flag = self._adwin.get('par38')  # get the burn flags
-            if not v.size and not i.size:
-                flag |= ADWIN_FLAG_NO_DATA
-            if np.max(np.absolute(i)) < _UNDERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_UNDERLOAD
-            elif np.max(np.absolute(i)) > _OVERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_OVERLOAD
-            return [v, i * (10 ** (-self.burn_gain)), flag]
-        else:
-            return [[], [], ADWIN_FLAG_DATA_INCOMPLETE | ADWIN_FLAG_NO_DATA]
+            result = acquisition.result()  # wait until adwin is finished one cycle
+            if fit_resistance:
+                return result + [fit_burn_resistance(result[0], result[1])]
+            return result
+        return acquisition
+
+    def eburn_series(self, R_crit = 500e6, max_cycles = 100, max_fails = 3, max_voltage = 10., breakpoint_increase = None,
+                     auto_gain = True, R_fit_tolerance = 0.05, keep_data = False, **burn_parameters):
+        '''
+        runs electroburning cycles (see eburn) until the resistance exceeds R_crit. The cycle to cycle policy runs in
+        the driver: the maximum voltage of a cycle is the breakpoint of the previous cycle (increased when it was
+        reached), the burn_gain follows the current, and the series stops after max_fails consecutive ohmic or
+        overloaded cycles. Between cycles only the changed parameters are uploaded and, unless keep_data is True, only
+        the ramp down is read, from which the resistance is fitted. The current of the ramp up is read as well, as the
+        load flags and the burn_gain depend on the whole cycle. A resistance sweep is only run when that fit is not
+        accurate enough.
+
+        :param R_crit: resistance in Ohm above which the junction is burned
+        :param max_cycles: maximum number of cycles (overloaded cycles do not count)
+        :param max_fails: number of consecutive ohmic or overloaded cycles after which the series stops
+        :param max_voltage: maximum voltage of the first cycle in V
+        :param breakpoint_increase: function that returns the next maximum voltage when it was reached without
+            triggering, max(v * (1 + v / 20), v + 0.1) by default
+        :param auto_gain: predict the burn_gain of the next cycle from the current (see adjust_burn_gain)
+        :param R_fit_tolerance: relative error of the fitted resistance above which the resistance is swept
+        :param keep_data: return the full burn data of every cycle (for saving), instead of only the ramp down
+        :param burn_parameters: other parameters of eburn (except wait_for_complete and fit_resistance, which the
+            series sets itself)
+        :return: generator of a BurnCycle per cycle, the last one has its stop_reason set
+        '''
+        for name in ('wait_for_complete', 'fit_resistance'):
+            if name in burn_parameters:
+                raise TypeError("eburn_series() sets the eburn parameter %s itself" % name)
+        if breakpoint_increase is None:
+            breakpoint_increase = increase_breakpoint
+        burn_parameters['threshold_resistance'] = burn_parameters.get('threshold_resistance', R_crit)
+        # the ramp down starts at the breakpoint and takes at most 10 V / (ramp down step) datapoints (eburn defaults)
+        step_down = _burn_step(burn_parameters.get('v_rate_down', 2000), burn_parameters.get('process_delay', 6000))
+        ramp_down = int(np.ceil((65535 - 32768) / max(step_down, 1.))) + 2
+        bpv = max_voltage
+        n = 0
+        fails = 0
+        while True:
+            n += 1
+            timing.next_cycle()
+            gain = self.burn_gain
+            self.eburn(max_voltage=bpv, wait_for_complete=False, **burn_parameters)
+            completed = self._wait('par40', self.wait_timeout, self.cancel_hook)
+            if completed:
+                ADwinFemto._output_voltage[self._output_channel] = 0.  # the burn ends with the ramp down
+            count = self._adwin.get('par39')
+            start = 0 if keep_data else max(count - ramp_down, 0)
+            # an under- or overload may occur anywhere in the cycle, so the current is read in full
+            i_cycle = self._get_array(2, 0, count)
+            v = _digits_to_units(self._get_array(1, start, count))
+            i = _digits_to_units(i_cycle[start:], gain)
+            flags = _load_flags(i_cycle) | self._adwin.get('par38')
+            if not completed:
+                flags |= ADWIN_FLAG_DATA_INCOMPLETE
+            v_max = np.max(v) if v.size else 0.
+            if not (flags & ADWIN_FLAG_OVERLOAD or flags & ADWIN_FLAG_BURN_I_OVERLOAD or flags & ADWIN_FLAG_BURN_OHMIC):
+                if not (flags & ADWIN_FLAG_UNDERLOAD and gain < 8):
+                    bpv = v_max
+
+            # resistance after the burn
+            [R, R_error] = fit_burn_resistance(v, i)
+            sweep = [None, None]
+            if not (R_error < R_fit_tolerance) or flags & (ADWIN_FLAG_OVERLOAD | ADWIN_FLAG_UNDERLOAD):
+                sweep = self.sweep_linear(v_min=-0.4, v_max=0.4, num_datapoints=50, num_average=10,
+                                          time_per_scan=0.2)[:2]
+                [R, R_error] = [fit_burn_resistance(sweep[0], sweep[1], segment='up')[0], None]
+            R = abs(R)
+
+            if auto_gain:
+                if (flags & ADWIN_FLAG_OVERLOAD or flags & ADWIN_FLAG_BURN_I_OVERLOAD) and gain > 3:
+                    max_cycles += 1  # the overloaded cycle does not count
+                self.adjust_burn_gain(_digits_to_units(i_cycle, gain), flags)
+            if flags & ADWIN_FLAG_BURN_OHMIC or (flags & ADWIN_FLAG_BURN_I_OVERLOAD and self.burn_gain == 3):
+                fails += 1
+            else:
+                fails = 0
+            if flags & ADWIN_FLAG_BURN_BREAKPOINT_V:
+                bpv = breakpoint_increase(bpv)
 
+            cycle = BurnCycle(n, v_max, R, R_error, gain, flags, [v, i], sweep, fails)
+            if not completed or not R > 0:
+                cycle.stop_reason = 'error'
+            elif R >= R_crit:
+                cycle.stop_reason = 'R_crit'
+            elif fails >= max_fails:
+                cycle.stop_reason = 'fails'
+            elif n + 1 >= max_cycles:
+                cycle.stop_reason = 'max_cycles'
+            yield cycle
+            if cycle.stop_reason is not None:
+                break
+
+    @timed('adwin.burn')
     def burn(self, cycle_num, ramp_up = 0.5, ramp_down = 150, max_voltage = 10, hold_at_10 = 5, process_delay = 18000,
              sigmoid_center = 1.5, sigmoid_steepness = 0.8, sigmoid_high = 20, sigmoid_low = 5, resistance = -1,
              threshold_resistance = 1e9, wait_for_complete = True):
@@ -566,88 +1415,181 @@ class ADwinFemto(object):
         sigmoid_high *= 10 ** (self.burn_gain-4)
         sigmoid_low *= 10 ** (self.burn_gain - 4)
         # set the required parameters for the script
-        self._adwin.set('par31', self._input_channel)
-        self._adwin.set('par32', self._output_channel)
-        self._adwin.set('par33', cycle_num)
-        self._adwin.set('par34', self._voltage_to_digit(max_voltage))
-        self._adwin.set('par35', hold_at_10/(process_delay/PROCESS_CLOCK))
-        self._adwin.set('par36', process_delay)  # process delay
-        self._adwin.set('fpar10', ramp_up)
-        self._adwin.set('fpar11', ramp_down)
-        self._adwin.set('fpar12', sigmoid_center)
-        self._adwin.set('fpar13', sigmoid_steepness)
-        self._adwin.set('fpar14', sigmoid_high)
-        self._adwin.set('fpar15', sigmoid_low)
-        self._adwin.set('fpar16', 10 ** self.burn_gain)
-        self._adwin.set('fpar17', resistance)
-        self._adwin.set('fpar18', threshold_resistance)
+        self._set('par31', self._input_channel)
+        self._set('par32', self._output_channel)
+        self._set('par33', cycle_num)
+        self._set('par34', self._voltage_to_digit(max_voltage))
+        self._set('par35', hold_at_10/(process_delay/PROCESS_CLOCK))
+        self._set('par36', process_delay)  # process delay
+        self._set('fpar10', ramp_up)
+        self._set('fpar11', ramp_down)
+        self._set('fpar12', sigmoid_center)
+        self._set('fpar13', sigmoid_steepness)
+        self._set('fpar14', sigmoid_high)
+        self._set('fpar15', sigmoid_low)
+        self._set('fpar16', 10 ** self.burn_gain)
+        self._set('fpar17', resistance)
+        self._set('fpar18', threshold_resistance)
         self._busy_par = 'par40'
-        self._adwin.start_process(5)
+        # ramp_up is a step in digits per process delay, the ramp up to max_voltage takes this long (unless it triggers)
+        steps = abs(self._voltage_to_digit(max_voltage) - 32768) / float(ramp_up) if ramp_up > 0 else 0.
+        self._start_process(5, steps * process_delay / PROCESS_CLOCK)
+        self._drive(self._output_channel, 5)
         if wait_for_complete:
-            while self._adwin.get(self._busy_par): pass  # test the busy parameter until adwin is finished one cycle
+            completed = self.wait()  # wait until adwin is finished one cycle
+            if completed:
+                ADwinFemto._output_voltage[self._output_channel] = 0.
             count = self._adwin.get('par39')  # get the amount of datapoints
-            v = np.array(self._adwin.get('data1')[:count]) * (20.0 / 65535) - 10.0  # get voltage digit and transform into real units
-            i = np.array(self._adwin.get('data2')[:count]) * (20.0 / 65535) - 10.0  # get current digit transform into real units
-            flag = self._adwin.get('par37')  # get the burn flags
-            if not v.size and not i.size:
-                flag |= ADWIN_FLAG_NO_DATA
-            if np.max(np.absolute(i)) < _UNDERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_UNDERLOAD
-            elif np.max(np.absolute(i)) > _OVERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_OVERLOAD
-            return [v, i*(10**(-self.burn_gain)), flag]
+            [v, i, flag] = self._read_iv(0, count, self.burn_gain)
+            flag |= self._adwin.get('par37')  # get the burn flags
+            if not completed:
+                flag |= ADWIN_FLAG_DATA_INCOMPLETE
+            return [v, i, flag]
         else:
             return [[],[],ADWIN_FLAG_DATA_INCOMPLETE | ADWIN_FLAG_NO_DATA]
 
-    def current_time_trace(self, v, electrode = 'source', data_frequency = 10, num_datapoints = 100,
-                           num_average = 1, wait_for_complete = True, in_channel=-1):
+    def _setup_time_trace(self, v, electrode, data_frequency, num_average, in_channel):
+        """
+        outputs the bias voltage, sets the gain and stages the parameters of the ITTrace.bas script (except the number
+        of datapoints)
+
+        :return: [processdelay, both], where both is True if both ADC channels are recorded
+        """
         self.write(v,electrode=electrode)
         self.read()  # this handles autogain at the set voltage
-        self._adwin.set('par51', self._output_channel)
+        self._set('par51', self._output_channel)
         both = False
-        if in_channel < 0:
-            self._adwin.set('par52', self._input_channel)
-        elif in_channel > 0 and in_channel < 3:
-            self._adwin.set('par52', in_channel)
-        elif in_channel == 'both' or in_channel == 0 or in_channel > 2:
-            self._adwin.set('par52', 0)
+        if in_channel == 'both' or in_channel == 0 or in_channel > 2:
+            self._set('par52', 0)
             both = True
-            
-        self._adwin.set('par53', self._voltage_to_digit(v))
+        elif in_channel < 0:
+            self._set('par52', self._input_channel)
+        else:
+            self._set('par52', in_channel)
+
+        self._set('par53', self._voltage_to_digit(v))
         processdelay = int(PROCESS_CLOCK / (data_frequency * num_average))
         if processdelay < PROCESSDELAY_MINIMUM:
             print("Warning: attempting to measure too fast, decrease data_frequency or num_average.")
-        self._adwin.set('par54', processdelay)
-        self._adwin.set('par55', num_average)
-        self._adwin.set('par56', num_datapoints)
+        self._set('par54', processdelay)
+        self._set('par55', num_average)
+        return [processdelay, both]
+
+    @timed('adwin.current_time_trace')
+    def current_time_trace(self, v, electrode = 'source', data_frequency = 10, num_datapoints = 100,
+                           num_average = 1, wait_for_complete = True, in_channel=-1, monitor=None):
+        '''
+        measures the current versus time at a constant voltage
+
+        :param monitor: StabilityMonitor (see stability.py) that analyses the trace while it is measured, and ends it
+            as soon as the current is stable (or jumps). The trace is then streamed, so wait_for_complete is ignored.
+        :return: [t, i, flags], and with a monitor [t, i, flags, info], where info['reason'] says why the trace ended
+        '''
+        if monitor is not None:
+            return self._monitored_time_trace(v, electrode, data_frequency, num_datapoints, num_average, in_channel,
+                                              monitor)
+        [processdelay, both] = self._setup_time_trace(v, electrode, data_frequency, num_average, in_channel)
+        self._set('par56', num_datapoints)
 
         self._busy_par = 'par60'
-        self._adwin.start_process(6)
+        self._start_process(6, processdelay * num_average * num_datapoints / PROCESS_CLOCK)
         if wait_for_complete:
-            while self._adwin.get(self._busy_par): pass  # test the busy parameter until adwin is finished
-            t = np.array(self._adwin.get('data1')[:num_datapoints]) * (processdelay/PROCESS_CLOCK)  # get voltage digit and transform into real units
-            i = np.array(self._adwin.get('data2')[:num_datapoints]) * (20.0 / 65535) - 10.0  # get current digit transform into real units
-            flag_i = i
-            if both:
-                i2 = np.array(self._adwin.get('data3')[:num_datapoints]) * (20.0 / 65535) - 10.0  # get current digit transform into real units
-                if self._in_channel == 1:
-                    flag_i = i
-                    i = [i*10**(-self.iv_gain),i2]
-                else:
-                    flag_i = i2
-                    i = [i,i2*10**(-self.iv_gain)]
             flag = 0
-            if not t.size and not flag_i.size:
-                flag |= ADWIN_FLAG_NO_DATA
-            if np.max(np.absolute(flag_i)) < _UNDERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_UNDERLOAD
-            elif np.max(np.absolute(flag_i)) > _OVERLOAD_THRESHOLD:
-                flag |= ADWIN_FLAG_OVERLOAD
-            if not both:
-                i*=10**(-self.iv_gain)
-            return [t, i, flag]
+            count = num_datapoints
+            if not self.wait():  # wait until adwin is finished
+                flag |= ADWIN_FLAG_DATA_INCOMPLETE
+                count = min(self._adwin.get('par57'), num_datapoints)
+            [t, i, load_flag] = self._read_it(0, count, processdelay, both)
+            return [t, i, flag | load_flag]
         else:
             return [[],[],ADWIN_FLAG_DATA_INCOMPLETE | ADWIN_FLAG_NO_DATA]
 
+    def _monitored_time_trace(self, v, electrode, data_frequency, num_datapoints, num_average, in_channel, monitor):
+        '''
+        streams a current versus time trace into the monitor until it says stop (see current_time_trace)
+        '''
+        monitor.reset()
+        chunk_size = max(int(data_frequency * _MONITOR_INTERVAL), 1)
+        chunks = []
+        flag = 0
+        both = False
+        for [t, i, chunk_flag] in self.stream_current_time_trace(v, electrode, data_frequency, chunk_size,
+                                                                 num_datapoints, num_average, in_channel):
+            chunks.append([t, i])
+            flag |= chunk_flag
+            both = isinstance(i, list)
+            if monitor.update(t, i[self._input_channel - 1] if both else i) is not None:
+                break  # leaving the stream stops the trace
+        count = sum(len(t) for [t, _] in chunks)
+        if monitor.reason is None:
+            monitor.reason = 'complete' if count >= num_datapoints else 'stopped'
+            if count < num_datapoints:
+                flag |= ADWIN_FLAG_DATA_INCOMPLETE
+        if not chunks:
+            return [[], [], flag | ADWIN_FLAG_NO_DATA, monitor.statistics()]
+        t = np.concatenate([t for [t, _] in chunks])
+        if both:
+            i = [np.concatenate([i[channel] for [_, i] in chunks]) for channel in range(2)]
+        else:
+            i = np.concatenate([i for [_, i] in chunks])
+        return [t, i, flag, monitor.statistics()]
+
+    def stream_current_time_trace(self, v, electrode = 'source', data_frequency = 10, chunk_size = 1000,
+                                  num_datapoints = None, num_average = 1, in_channel = -1, segment_size = BUFFER_SIZE):
+        """
+        streams a current versus time trace in chunks of chunk_size datapoints, without a limit on its length.
+
+        The trace is recorded in segments of at most segment_size datapoints, which are read from the ADwin while they
+        are being recorded. Only one chunk is held in memory at a time: when the chunks are not consumed fast enough,
+        the ADwin holds the data until the current segment is full, and the next segment starts once it is read out.
+        The time stamps are relative to the start of the first segment. The trace ends after num_datapoints, when it is
+        stopped (stop() or cancel_hook), or when the generator is closed.
+
+        :param num_datapoints: total number of datapoints, None streams until stopped
+        :param chunk_size: number of datapoints per chunk (the last chunk of a segment may be shorter)
+        :param segment_size: maximum number of datapoints per run of the ITTrace.bas script
+        :return: generator of [t, i, flags] chunks (see current_time_trace)
+        """
+        [processdelay, both] = self._setup_time_trace(v, electrode, data_frequency, num_average, in_channel)
+        remaining = num_datapoints
+        t_first = None
+        stopped = False
+        try:
+            while not stopped and (remaining is None or remaining > 0):
+                n = int(segment_size if remaining is None else min(segment_size, remaining))
+                self._set('par56', n)
+                self._busy_par = 'par60'
+                t_segment = self._now()  # before the start, as the segment starts recording with the process
+                self._start_process(6, processdelay * num_average * n / PROCESS_CLOCK)
+                if t_first is None:
+                    t_first = t_segment
+                start = 0
+                while True:
+                    running = self.is_busy()
+                    count = self._adwin.get('par57')
+                    if count - start >= chunk_size or (not running and count > start):
+                        stop = min(count, start + chunk_size)
+                        [t, i, flag] = self._read_it(start, stop, processdelay, both)
+                        t += t_segment - t_first
+                        start = stop
+                        yield [t, i, flag]
+                    elif not running:
+                        break
+                    else:
+                        if not stopped and self.cancel_hook is not None and self.cancel_hook():
+                            self.stop()
+                            stopped = True
+                        # sleep until the next chunk should be complete
+                        interval = float(chunk_size - (count - start)) / data_frequency / ADwinFemto._speed
+                        _msleep(min(max(interval, _POLL_INTERVAL_MIN), _STREAM_POLL_MAX))
+                stopped = stopped or start < n
+                if remaining is not None:
+                    remaining -= start
+        finally:
+            if self.is_busy():
+                self.stop()
+                self._wait('par60')  # wait for the stop to be acknowledged, before the next process starts
+
     def stop(self):
         self._adwin.set('par80',1)
+        self._t_expected = time.time()  # the process ends as soon as it acknowledges the stop
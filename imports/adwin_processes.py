@@ -0,0 +1,161 @@
+"""
+
+Lazily loaded, cached ADwin processes
+
+The ADbasic processes are compiled and loaded into the ADwin only when they are first needed. The compiled binaries are
+cached on disk, keyed by a hash of the source file and the compiler settings, so that a process is only recompiled
+when its source (or the settings) changed. The processes that are resident on the ADwin are remembered, also across
+sessions, together with a boot marker that is written to the ADwin (MARKER_PAR). After a reboot of the ADwin the
+marker no longer matches and the processes are loaded again.
+
+Usage (see ADwinFemto):
+    processes = ProcessManager(adwin, {1: 'DAC.bas', 2: 'ADC.bas'})
+    processes.verify()  # checks that the processes remembered as resident are still loaded (once per session)
+    processes.require(1)  # compiles (or takes from the cache) and loads DAC.bas, unless it is already resident
+    processes.invalidate()  # forgets what is resident, the processes are loaded again when they are needed
+"""
+import os
+import glob
+import json
+import random
+import shutil
+import hashlib
+
+PROCESS_DIR = 'C:\\scripts\\ADwin\\Standard'
+MARKER_PAR = 'par79'  # global parameter of the ADwin that is not used by the processes, reset to 0 on a reboot
+_STATE_FILE = 'resident.json'
+
+
+class ProcessManager(object):
+    def __init__(self, adwin, sources, source_dir=PROCESS_DIR, cache_dir=None, settings=None):
+        '''
+        :param adwin: ADwin instrument
+        :param sources: dictionary of process number: file name of the ADbasic source
+        :param source_dir: folder of the sources
+        :param cache_dir: folder of the compiled binaries (the subfolder compiled of source_dir by default)
+        :param settings: dictionary of additional compiler settings (passed to compile_process)
+        '''
+        self._adwin = adwin
+        self._sources = sources
+        self._source_dir = source_dir
+        self._cache_dir = cache_dir if cache_dir is not None else os.path.join(source_dir, 'compiled')
+        self._settings = settings if settings is not None else {}
+        self._resident = {}  # process: key of the loaded binary
+        self._marker = None  # boot marker written to MARKER_PAR when the first process was loaded
+        self._keys = {}  # process: [modification time of the source, key]
+        self._verified = False
+        self._load_state()
+
+    def _path(self, process):
+        return os.path.join(self._source_dir, self._sources[process])
+
+    def _load_state(self):
+        try:
+            with open(os.path.join(self._cache_dir, _STATE_FILE)) as f:
+                state = json.load(f)
+            self._marker = state['marker']
+            self._resident = dict((int(process), key) for [process, key] in state['resident'].items())
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            [self._marker, self._resident] = [None, {}]
+
+    def _save_state(self):
+        try:
+            if not os.path.isdir(self._cache_dir):
+                os.makedirs(self._cache_dir)
+            with open(os.path.join(self._cache_dir, _STATE_FILE), 'w') as f:
+                json.dump({'marker': self._marker, 'resident': self._resident}, f)
+        except (IOError, OSError):
+            pass  # the cache only saves time, the processes are loaded again in the next session
+
+    def key(self, process):
+        '''
+        :param process: process number
+        :return: hash of the source of the process and the compiler settings, None if the source cannot be read. The
+            hash is only recomputed when the modification time of the source changed.
+        '''
+        path = self._path(process)
+        try:
+            mtime = os.path.getmtime(path)
+            if process in self._keys and self._keys[process][0] == mtime:
+                return self._keys[process][1]
+            with open(path, 'rb') as f:
+                digest = hashlib.sha1(f.read())
+        except (IOError, OSError):
+            return None
+        digest.update(repr((process, sorted(self._settings.items()))).encode('utf-8'))
+        self._keys[process] = [mtime, digest.hexdigest()]
+        return self._keys[process][1]
+
+    def verify(self):
+        '''
+        checks that the processes that are remembered as resident are still loaded, i.e. that the ADwin was not rebooted
+        since they were loaded (the boot marker is still in MARKER_PAR)
+
+        :return: True if the remembered processes are resident, False if they have to be loaded again
+        '''
+        self._verified = True
+        if self._marker is not None and self._resident and self._adwin.get(MARKER_PAR) == self._marker:
+            return True
+        self._resident = {}
+        self._marker = None
+        return False
+
+    def invalidate(self):
+        '''
+        forgets which processes are resident, so that they are loaded again when they are needed
+        '''
+        self._resident = {}
+        self._marker = None
+        self._verified = False
+
+    def require(self, process):
+        '''
+        makes sure that the current version of the process is loaded, compiling it only if it is not in the cache
+
+        :param process: process number
+        '''
+        if not self._verified:
+            self.verify()
+        key = self.key(process)
+        if process in self._resident and self._resident[process] == key:
+            return
+        binary = self._cached(process, key)
+        if binary is None:
+            binary = self._store(process, key, self._adwin.compile_process(self._path(process), process=process,
+                                                                           **self._settings))
+        self._adwin.load_process(binary)
+        if self._marker is None:
+            self._marker = random.randint(1, 2 ** 30)
+            self._adwin.set(MARKER_PAR, self._marker)
+        self._resident[process] = key
+        if key is not None:
+            self._save_state()
+
+    def _cache_name(self, process, key):
+        return os.path.join(self._cache_dir, '%s_%s' % (os.path.splitext(self._sources[process])[0], key[:16]))
+
+    def _cached(self, process, key):
+        '''
+        :return: path of the cached binary of the process, None if it is not cached
+        '''
+        if key is None:
+            return None
+        found = glob.glob(self._cache_name(process, key) + '.*')
+        return found[0] if found else None
+
+    def _store(self, process, key, binary):
+        '''
+        copies the compiled binary into the cache
+
+        :return: path of the cached binary, or binary itself if it cannot be cached
+        '''
+        if key is None or not isinstance(binary, (str, type(u''))) or not os.path.isfile(binary):
+            return binary
+        try:
+            if not os.path.isdir(self._cache_dir):
+                os.makedirs(self._cache_dir)
+            cached = self._cache_name(process, key) + os.path.splitext(binary)[1]
+            shutil.copyfile(binary, cached)
+            return cached
+        except (IOError, OSError):
+            return binary
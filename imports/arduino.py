@@ -1,4 +1,5 @@
 import qt
+from imports.timing import timed
 
 class SignalSwitch(object):
     _instr = 0
@@ -12,6 +13,7 @@ class SignalSwitch(object):
                 print('Warning: signal switcher could not be initialised.')
                 SignalSwitch._instr = 'NA'
 
+    @timed('switch.route')
     def route(self, channel, destination):
         if destination == 'HP' and SignalSwitch._instr == 'NA':
             print('Warning: signal switcher could not switch to HP.')
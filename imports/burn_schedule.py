@@ -0,0 +1,134 @@
+"""
+
+Breakpoint voltage schedule for electroburning, learned from the devices that were already burned on the chip
+
+Junctions on the same chip break at similar voltages. The scheduler keeps statistics of the breakpoint voltage of the
+first cycle of every device and of the increase of the breakpoint voltage that was needed when a cycle reached its
+maximum voltage without triggering. From these it seeds the maximum voltage of the first cycle of the next device and
+the increase after an untriggered cycle. Until enough devices were burned it falls back to the fixed rules.
+
+Usage (see ADwin_electroburn.py):
+    scheduler = BurnScheduler('burn_schedule.json')  # loads the statistics of the run so far, if the file exists
+    scheduler.start_device()
+    for cycle in instr.eburn_series(max_voltage=scheduler.initial_voltage(10.), breakpoint_increase=scheduler.increase):
+        scheduler.observe(cycle)
+    scheduler.end_device()  # adds the statistics of the device and saves them
+"""
+import json
+import numpy as np
+from imports.adwin_femto import ADWIN_FLAG_BURN_BREAKPOINT_V, ADWIN_FLAG_BURN_OHMIC, ADWIN_FLAG_BURN_I_OVERLOAD, \
+    ADWIN_FLAG_OVERLOAD, ADWIN_FLAG_BURN_FEEDBACK, ADWIN_FLAG_BURN_R_THRESHOLD, ADWIN_FLAG_BURN_R_INCREASE, \
+    increase_breakpoint
+
+_TRIGGERED = ADWIN_FLAG_BURN_FEEDBACK | ADWIN_FLAG_BURN_R_THRESHOLD | ADWIN_FLAG_BURN_R_INCREASE
+_FAILED = ADWIN_FLAG_BURN_OHMIC | ADWIN_FLAG_BURN_I_OVERLOAD | ADWIN_FLAG_OVERLOAD
+_HISTORY = 500  # number of values that are kept per statistic
+_MAX_VOLTAGE = 10.  # V, the ADwin output range
+
+
+class BurnScheduler(object):
+    def __init__(self, filename=None, min_devices=3, min_increases=5, seed_quantile=0.9, seed_margin=1.1,
+                 increase_quantile=0.75, max_increase=1.5):
+        '''
+        :param filename: json file in which the statistics are kept (None keeps them in memory only)
+        :param min_devices: number of burned devices from which the first maximum voltage is seeded
+        :param min_increases: number of observed increases from which the increase is learned
+        :param seed_quantile: quantile of the first breakpoint voltages that the first cycle should reach
+        :param seed_margin: factor by which the seeded voltage exceeds that quantile
+        :param increase_quantile: quantile of the needed increases that a single increase should cover
+        :param max_increase: largest factor by which the maximum voltage is increased at once
+        '''
+        self.filename = filename
+        self.min_devices = min_devices
+        self.min_increases = min_increases
+        self.seed_quantile = seed_quantile
+        self.seed_margin = seed_margin
+        self.increase_quantile = increase_quantile
+        self.max_increase = max_increase
+        self.first_breakpoints = []  # V, breakpoint voltage of the first triggered cycle of every device
+        self.increases = []  # ratio of the breakpoint voltage after an untriggered cycle to its maximum voltage
+        self.cycles = []  # number of cycles of every device
+        self._device = None
+        self.load()
+
+    def load(self):
+        if self.filename is None:
+            return
+        try:
+            with open(self.filename) as f:
+                state = json.load(f)
+            self.first_breakpoints = state['first_breakpoints']
+            self.increases = state['increases']
+            self.cycles = state['cycles']
+        except (IOError, OSError, ValueError, KeyError):
+            pass  # nothing learned yet
+
+    def save(self):
+        if self.filename is None:
+            return
+        try:
+            with open(self.filename, 'w') as f:
+                json.dump({'first_breakpoints': self.first_breakpoints, 'increases': self.increases,
+                           'cycles': self.cycles}, f)
+        except (IOError, OSError):
+            print('Warning: could not save the burn schedule.')
+
+    def initial_voltage(self, default=_MAX_VOLTAGE):
+        '''
+        :param default: maximum voltage of the first cycle when too few devices were burned
+        :return: maximum voltage of the first cycle of the next device in V
+        '''
+        if len(self.first_breakpoints) < self.min_devices:
+            return default
+        seed = np.percentile(self.first_breakpoints, 100 * self.seed_quantile) * self.seed_margin
+        return float(min(seed, _MAX_VOLTAGE))
+
+    def increase(self, v_max):
+        '''
+        :param v_max: maximum voltage of a cycle that did not trigger
+        :return: maximum voltage of the next cycle, never below the fixed rule (increase_breakpoint)
+        '''
+        v_next = increase_breakpoint(v_max)
+        if len(self.increases) >= self.min_increases:
+            ratio = min(np.percentile(self.increases, 100 * self.increase_quantile), self.max_increase)
+            v_next = max(v_next, v_max * ratio)
+        return float(min(v_next, max(_MAX_VOLTAGE, v_max)))
+
+    def start_device(self):
+        self._device = {'first': None, 'cycles': 0, 'untriggered': None}
+
+    def observe(self, cycle):
+        '''
+        :param cycle: BurnCycle of the device (see ADwinFemto.eburn_series)
+        '''
+        if self._device is None:
+            self.start_device()
+        device = self._device
+        device['cycles'] += 1
+        if cycle.flags & _FAILED:
+            return  # the voltage of an overloaded or ohmic cycle says nothing about the breakpoint
+        if cycle.flags & _TRIGGERED:
+            if device['first'] is None:
+                device['first'] = cycle.breakpoint
+            if device['untriggered'] is not None and device['untriggered'] > 0:
+                _append(self.increases, cycle.breakpoint / device['untriggered'])
+            device['untriggered'] = None
+        elif cycle.flags & ADWIN_FLAG_BURN_BREAKPOINT_V and device['untriggered'] is None:
+            device['untriggered'] = cycle.breakpoint  # reached the maximum voltage without triggering
+
+    def end_device(self):
+        '''
+        adds the statistics of the device and saves them
+        '''
+        if self._device is None:
+            return
+        if self._device['first'] is not None:
+            _append(self.first_breakpoints, self._device['first'])
+        _append(self.cycles, self._device['cycles'])
+        self._device = None
+        self.save()
+
+
+def _append(values, value):
+    values.append(float(value))
+    del values[:-_HISTORY]
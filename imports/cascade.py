@@ -1,5 +1,6 @@
 import re
 import qt
+from imports.timing import span, timed
 class Cascade(object):
 
     def __init__(self):
@@ -8,12 +9,14 @@ class Cascade(object):
         print('Cascade initialised.')
         self._position=[0,0]
 
+    @timed('cascade.move_abs')
     def move_abs(self,pos): #move the cascade to an absolute position
         if pos[0] != self._position[0] or pos[1] != self.position[1]:
             print("moving the head: "+str(pos[0]-self._position[0])+","+str(pos[1]-self._position[1]))
             self.instr.set('position',[pos[0]-self._position[0],-(pos[1]-self._position[1]),0],rel=True)
             self.position=pos
-            qt.msleep(2)
+            with span('cascade.settle'):
+                qt.msleep(2)
 
     def state(self):
         if self.instr.get('contact'):
@@ -6,6 +6,9 @@ from template files or directly define it from the script. Then, you can load a
 For example, you can load the T2.ini chip template, which has columns a to w, and row 1 to 38, of which row 38 is
 shorted. Then, you can load devices on column a only, to create a run list for the devices on column a only.
 
+The chip keeps its devices in arrays (see c.layout below), so that selecting ranges and looking up positions stays fast
+for full wafer maps of a hundred thousand devices.
+
 User callable functions:
 
 ------------------------------------------------------------------------------------------------------------------------
@@ -20,7 +23,7 @@ c=Chip(experiment_name, template='2T.ini')
 
 ------------------------------------------------------------------------------------------------------------------------
 
-c.define_devices(device_square, position=(0,0), pitch=(0,0), hide_from_range=False)
+c.define_devices(device_square, position=(0,0), pitch=(0,0), hide_from_range=False, test=False)
 
 define a chip architecture. For the T2 chip, we would run this function twice:
 c.define_devices('a1-w37', (0,0), (400, 200), False)
@@ -35,6 +38,9 @@ Then, we include the shorted devices on row 38. The devices a38-w38 include all
 first device (a38) is at 0 for x and 7400 for y. The pitch is the same as before. These devices are hidden from the
 range (see c.load_devices below).
 
+Devices that are defined again are moved to the new position. With test=True, the devices are marked as test devices (in
+c.layout.test); the template files do so for the lines that start with 'test'.
+
 ------------------------------------------------------------------------------------------------------------------------
 
 c.load_template(filename, ignore_hidden=True)
@@ -73,6 +79,21 @@ c.load_devices('a3,a3-6') # this would list a3 twice, followed by a4, a5 and a6.
 
 ------------------------------------------------------------------------------------------------------------------------
 
+c.device_range(device_range)
+c.device_square(device_square)
+
+Return the devices of a device range (as in c.load_devices) or a device square (as in c.add_experiment) as a DeviceSet.
+The expression is parsed once: the device set is cached until the chip is changed (c.define_devices, c.limit_range), so
+the same expression returns the same device set. A DeviceSet is an (immutable) frozenset of the devices, so checking
+whether a device is in it takes the same time for any number of devices, but it also keeps the order of the range
+(with devices that are listed more than once) in DeviceSet.devices, and iterates over the devices in that order.
+Device sets are combined with | (union), & (intersection) and - (difference), which keep the order of the left one.
+They can be passed to c.load_devices and c.add_experiment instead of an expression. For example:
+c.load_devices(c.device_range('a-e') - c.device_square('b10-d20'))  # columns a to e, without a block in the middle
+c.add_experiment('test', c.device_square('a1-w37') & c.device_range('b15-c3'))
+
+------------------------------------------------------------------------------------------------------------------------
+
 c.load_from_file(filename)
 
 Loads the device range from a file. See c.load_devices above for details.
@@ -93,6 +114,21 @@ c.start_at_device('a35',True)
 
 ------------------------------------------------------------------------------------------------------------------------
 
+c.plan_route(start=None)
+
+Reorders the device list (see c.devices below) to minimise the travel of the probe station between the devices. Devices
+on a full rectangular grid are visited in a serpentine (column by column, alternating up and down), other layouts (or a
+start in the middle of a grid) by a nearest neighbour route that is improved by 2-opt (reversing parts of the route
+while that shortens it). The route starts at the start device (by default the first device in the list). A device that
+is listed more than once is still visited that many times, in a row. The travel before and after is printed and
+returned, in the units of the template. For example:
+c.load_devices('a,c-e,f30-h3')
+c.plan_route()
+
+When the route is planned, c.start_at_device plans it again from the device it starts at.
+
+------------------------------------------------------------------------------------------------------------------------
+
 c.add_experiment(script_file,devices='*'):
 
 defines an experiment for a device square (so, like in c.define_devices, not a range like in c.load_devices).
@@ -115,10 +151,55 @@ are defined on the chip. If the device is not on the chip, the position (-1, -1)
 
 ------------------------------------------------------------------------------------------------------------------------
 
-c.get_device_from_position(position)
+c.get_device_positions(devices)
+
+Returns the positions of a list of devices as an array of shape (n, 2), with (-1, -1) for devices that are not on the
+chip.
+
+------------------------------------------------------------------------------------------------------------------------
+
+c.get_devices_in_box(corner, opposite_corner, include_hidden=True)
+
+Returns the devices with a position inside the box between two corners (tuples of shape (position_x, position_y)),
+column by column. For example, the devices in the lower left millimetre of the chip:
+c.get_devices_in_box((0, 0), (1000, 1000))
+
+------------------------------------------------------------------------------------------------------------------------
+
+c.transform(offset=(0,0), angle=0., scale=1.)
+
+Moves the positions of all devices: they are scaled and rotated (counterclockwise, in degrees) around (0, 0), and then
+shifted by the offset. For example, for a chip that is mounted rotated by 0.5 degree, with a1 at (120, -40):
+c.transform(offset=(120, -40), angle=0.5)
+
+------------------------------------------------------------------------------------------------------------------------
+
+c.get_device_from_position(position, tolerance=1.)
+
+Returns the device at a certain position (input a tuple of shape (position_x, position_y). The device may be up to
+tolerance away from the position (in the units of the template), so that rounded positions (e.g. from the position file
+of the Cascade) still find the device. If no device is that close, an empty string is returned.
+
+------------------------------------------------------------------------------------------------------------------------
+
+c.get_nearest_devices(position, k=1)
+
+Returns the k devices nearest to a position as a list of [device, distance], nearest first.
 
-Returns the device at a certain position (input a tuple of shape (position_x, position_y). If the position does not
-contain a device, an empty string is returned.
+The position lookups use a spatial index (a grid of cells of about the device spacing), which is built on the first
+lookup after the devices were defined. A lookup only searches the cells around the position, so it takes the same time
+for a template of tens of thousands of devices.
+
+------------------------------------------------------------------------------------------------------------------------
+
+c.layout # property
+
+The devices that are defined on the chip, as a ChipLayout: arrays with an entry for every device, in the order in which
+the devices were defined. c.layout.col holds the column number (a is 0, b is 1, ..., aa is 26), c.layout.row the row,
+c.layout.x and c.layout.y the position, c.layout.hidden whether the device is hidden from the device ranges and
+c.layout.test whether it is a test device. c.layout.names holds the name of every device and c.layout.index maps a name
+to its entry. For example, the devices of the even rows that are not hidden:
+c.layout.select((c.layout.row % 2 == 0) & ~c.layout.hidden)
 
 ------------------------------------------------------------------------------------------------------------------------
 
@@ -145,6 +226,7 @@ for the device, and otherwise nothing is returned.
 
 
 import re
+import numpy as np
 try: from imports.experiment import *
 except:
     class Experiment:
@@ -153,6 +235,235 @@ except:
         @staticmethod
         def restart():
             pass
+try:
+    _string = basestring  # python 2, which also has unicode device names
+except NameError:
+    _string = str
+
+def _travel(xy):
+    '''
+    :return: the length of the route through the positions xy (n, 2) in their order
+    '''
+    if len(xy) < 2:
+        return 0.
+    return float(np.sum(np.hypot(*np.diff(xy, axis=0).T)))
+
+
+def _serpentines(xy):
+    '''
+    :return: the serpentine routes through positions on a full rectangular grid (by columns and by rows, from every
+        corner), or no routes if the positions are not a full grid
+    '''
+    [xs, x_index] = np.unique(np.round(xy[:, 0], 6), return_inverse=True)
+    [ys, y_index] = np.unique(np.round(xy[:, 1], 6), return_inverse=True)
+    if xs.size * ys.size != len(xy) or len(set(zip(x_index, y_index))) != len(xy):
+        return []
+    routes = []
+    for [major, minor] in [[x_index, y_index], [y_index, x_index]]:
+        for major_sign in (1, -1):
+            for minor_sign in (1, -1):
+                # the minor direction alternates with every line of the major axis
+                alternate = np.where(major % 2 == 0, 1, -1) * minor_sign
+                routes.append(np.lexsort((alternate * minor, major_sign * major)))
+    return routes
+
+
+def _nearest_neighbour(xy, first):
+    order = [first]
+    left = np.ones(len(xy), dtype=bool)
+    left[first] = False
+    for _ in range(len(xy) - 1):
+        distance = np.hypot(*(xy - xy[order[-1]]).T)
+        distance[~left] = np.inf
+        order.append(int(np.argmin(distance)))
+        left[order[-1]] = False
+    return np.array(order)
+
+
+def _two_opt(xy, order):
+    '''
+    improves a route with a fixed first position and a free end by reversing parts of it, as long as that shortens it
+    '''
+    n = len(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            p = xy[order]
+            # reversing order[i:j + 1] replaces the edges (i - 1, i) and (j, j + 1) by (i - 1, j) and (i, j + 1)
+            j = np.arange(i + 1, n)
+            removed = np.hypot(*(p[i] - p[i - 1])) + np.append(np.hypot(*(p[j[:-1] + 1] - p[j[:-1]]).T), 0.)
+            added = np.hypot(*(p[j] - p[i - 1]).T) + np.append(np.hypot(*(p[j[:-1] + 1] - p[i]).T), 0.)
+            gain = removed - added
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-9 * (1. + removed[best]):
+                order[i:j[best] + 1] = order[i:j[best] + 1][::-1].copy()
+                improved = True
+    return order
+
+
+def _plan_route(xy, first):
+    '''
+    :param xy: positions (n, 2)
+    :param first: index of the position to start at
+    :return: the indices of the positions in the order of the planned route
+    '''
+    routes = [route for route in _serpentines(xy) if route[0] == first]
+    if routes:
+        return min(routes, key=lambda route: _travel(xy[route]))
+    return _two_opt(xy, _nearest_neighbour(xy, first))
+
+
+_SQUARE = re.compile(r' *([a-zA-Z]+)(\d+)-([a-zA-Z]+)(\d+)')
+_RANGE = re.compile(r' *,? *([a-zA-Z]+)(\d*)-?([a-zA-Z]*)(\d*)')
+
+
+class ChipLayout(object):
+    '''
+    the devices of a chip as a structure of arrays: device k is in column col[k] (the column number, see Chip._w2d) and
+    row row[k], at position (x[k], y[k]). hidden[k] hides it from the device ranges and test[k] marks it as a test
+    device. names[k] is the name of the device, and index maps the name back to k.
+    '''
+    def __init__(self):
+        self.col = np.zeros(0, dtype=int)
+        self.row = np.zeros(0, dtype=int)
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.hidden = np.zeros(0, dtype=bool)
+        self.test = np.zeros(0, dtype=bool)
+        self.names = []
+        self.index = {}
+        self._order = None
+        self._last_rows = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def _changed(self):
+        self._order = None
+        self._last_rows = None
+
+    def add(self, names, col, row, x, y, hidden=False, test=False):
+        '''
+        adds devices. A device that was added before is moved to the new position, and stays in the device ranges if it
+        was in them.
+
+        :param names: the names of the devices
+        :param col, row, x, y: arrays with the column number, row and position of every device
+        :param hidden, test: flags of all devices
+        '''
+        k = np.array([self.index.get(name, -1) for name in names], dtype=int)
+        old = k >= 0
+        self.x[k[old]] = x[old]
+        self.y[k[old]] = y[old]
+        self.hidden[k[old]] &= hidden
+        self.test[k[old]] &= test
+        new = ~old
+        added = [name for [name, is_new] in zip(names, new) if is_new]
+        self.index.update(zip(added, range(len(self.names), len(self.names) + len(added))))
+        self.names.extend(added)
+        self.col = np.concatenate((self.col, col[new]))
+        self.row = np.concatenate((self.row, row[new]))
+        self.x = np.concatenate((self.x, x[new]))
+        self.y = np.concatenate((self.y, y[new]))
+        self.hidden = np.concatenate((self.hidden, np.zeros(len(added), dtype=bool) | hidden))
+        self.test = np.concatenate((self.test, np.zeros(len(added), dtype=bool) | test))
+        self._changed()
+
+    def keep(self, selected):
+        '''
+        removes the devices that are not selected
+
+        :param selected: boolean array, True for the devices to keep
+        '''
+        [self.col, self.row, self.x, self.y, self.hidden, self.test] = \
+            [a[selected] for a in [self.col, self.row, self.x, self.y, self.hidden, self.test]]
+        self.names = [name for [name, kept] in zip(self.names, selected) if kept]
+        self.index = dict(zip(self.names, range(len(self.names))))
+        self._changed()
+
+    def select(self, selected):
+        '''
+        :param selected: boolean array, True for the devices to select
+        :return: list of the names of the selected devices, column by column
+        '''
+        if self._order is None:
+            self._order = np.lexsort((self.row, self.col))
+        return [self.names[k] for k in self._order[selected[self._order]]]
+
+    def last_rows(self):
+        '''
+        :return: array with the last row of the devices in the device ranges of every column number (-1 for none)
+        '''
+        if self._last_rows is None:
+            self._last_rows = -np.ones(self.col.max() + 1 if len(self) else 0, dtype=int)
+            np.maximum.at(self._last_rows, self.col[~self.hidden], self.row[~self.hidden])
+        return self._last_rows
+
+    def positions(self, names):
+        '''
+        :return: array (n, 2) with the positions of the devices, (-1, -1) for devices that are not on the chip
+        '''
+        k = np.array([self.index.get(name, -1) for name in names], dtype=int)
+        xy = np.column_stack((self.x[k], self.y[k])) if len(self) else np.zeros((k.size, 2))
+        xy[k < 0] = -1
+        return xy
+
+    def transform(self, matrix, offset):
+        '''
+        moves every position p to matrix . p + offset
+        '''
+        [self.x, self.y] = np.dot(matrix, [self.x, self.y]) + np.reshape(offset, (2, 1))
+
+
+class DeviceSet(frozenset):
+    '''
+    immutable set of devices, which keeps the order in which the devices were listed (see the documentation at the top)
+    '''
+    def __new__(cls, devices=()):
+        devices = tuple(devices)
+        self = frozenset.__new__(cls, devices)
+        self.devices = devices  # in order, with the devices that are listed more than once
+        return self
+
+    def __init__(self, devices=()):
+        frozenset.__init__(self)
+
+    def __iter__(self):
+        seen = set()
+        for dev in self.devices:
+            if not dev in seen:
+                seen.add(dev)
+                yield dev
+
+    def __repr__(self):
+        return 'DeviceSet(%r)' % list(self)
+
+    def __reduce__(self):
+        return (DeviceSet, (self.devices,))
+
+    @staticmethod
+    def _as_set(devices):
+        if isinstance(devices, frozenset) or isinstance(devices, set):
+            return devices
+        return frozenset([devices] if isinstance(devices, _string) else devices)
+
+    def __or__(self, other):
+        other = other if isinstance(other, DeviceSet) else DeviceSet([other] if isinstance(other, _string) else other)
+        return DeviceSet(self.devices + tuple(dev for dev in other.devices if not dev in self))
+
+    def __and__(self, other):
+        other = self._as_set(other)
+        return DeviceSet(dev for dev in self.devices if dev in other)
+
+    def __sub__(self, other):
+        other = self._as_set(other)
+        return DeviceSet(dev for dev in self.devices if not dev in other)
+
+    union = __or__
+    intersection = __and__
+    difference = __sub__
+
 
 class Chip:
     def _w2d(self,w):
@@ -192,18 +503,19 @@ class Chip:
         return self._run_dev_list.__contains__(item)
 
     def __init__(self, name, **kwargs):
-        self._dev_list = {}
-        self._test_dev_list = {}
+        self._layout = ChipLayout()  # the devices that are defined on the chip
         self._run_dev_list = []
-        self._cols = []
         self._experiments = []
         self._name = name
+        self._route_planned = False
+        self._index = None  # spatial index of the device positions, see _position_index
+        self._device_sets = {}  # the compiled device ranges and squares, see device_range and device_square
         Experiment.restart()
         if 'template' in kwargs:
             self.load_template(kwargs['template'],kwargs.get('ignore_hidden',True))
 
 
-    def define_devices(self, device_square, position=(0,0), pitch=(0,0), hide_from_range=False):
+    def define_devices(self, device_square, position=(0,0), pitch=(0,0), hide_from_range=False, test=False):
         '''
         defines the device architecture on the chip.
 
@@ -218,136 +530,68 @@ class Chip:
         :param device_range:
         :param position:
         :param pitch:
+        :param hide_from_range: leave the devices out of the device ranges
+        :param test: mark the devices as test devices
         :return nothing:
         '''
-        m=re.findall(' *([a-zA-Z]+)(\d+)-([a-zA-Z]+)(\d+)', device_square)
+        self._index = None
+        self._device_sets = {}
+        m=_SQUARE.findall(device_square)
         for index, r in enumerate(m):
-            r = list(r)
-            # exclude the last "match"
-##            if index == len(m)-1:
-##                continue
-            if not r[1]:
-                r[1] = r[3]
-            if not r[3]:
-                r[3] = r[1]
-            if not r[0]:
-                r[0] = r[2]
-            if not r[2]:
-                r[2] = r[0]
-            if r[1] > r[3]:
-                t = r[1]
-                r[1] = r[3]
-                r[3] = t
-            wd1 = self._w2d(r[0])
-            wd2 = self._w2d(r[2])
-            if wd2 < wd1:
-                t = wd1
-                wd1=wd2
-                wd2=t
-            if (not r[0] or not r[1]):
-                r = m[index]
-                print('Warning: illegal device range supplied: %s%s-%s%s' % (r[0],r[1],r[2],r[3]))
-                continue
-            d_range = range(int(r[1]),int(r[3])+1)
-            w_range = range(wd1,wd2+1)
-            for w_index, dw in enumerate(w_range):
-                if not self._d2w(dw) in self._cols and not hide_from_range:
-                    self._cols.append(self._d2w(dw))
-                for d_index, d in enumerate(d_range):
-                    pos = (position[0] + pitch[0] * w_index, position[1]+pitch[1]*d_index)
-                    try:
-                        if not self._d2w(dw)+str(d) in self._dev_list and not hide_from_range:
-                            self._dev_list[self._d2w(dw)].append(d)
-                    except KeyError:
-                        self._dev_list[self._d2w(dw)]=[]
-                        if not hide_from_range:
-                            self._dev_list[self._d2w(dw)].append(d)
-                    self._dev_list[self._d2w(dw)+str(d)] = pos
-                    
+            [wd1, wd2] = sorted([self._w2d(r[0]), self._w2d(r[2])])
+            [d1, d2] = sorted([int(r[1]), int(r[3])])
+            w_range = np.arange(wd1, wd2 + 1)
+            d_range = np.arange(d1, d2 + 1)
+            col = np.repeat(w_range, d_range.size)
+            row = np.tile(d_range, w_range.size)
+            names = [w + str(d) for w in [self._d2w(dw) for dw in w_range] for d in range(d1, d2 + 1)]
+            self._layout.add(names, col, row, position[0] + pitch[0] * (col - wd1), position[1] + pitch[1] * (row - d1),
+                             bool(hide_from_range), bool(test))
+
     def _dev_square_to_list(self, device_square):
         lst = []
+        layout = self._layout
         if '*' in device_square:
-            device_square = '%s%d-%s%d' % (self._cols[0], self._dev_list[self._cols[0]][0], self._cols[-1], self._dev_list[self._cols[-1]][-1])
-        m = re.findall(' *([a-zA-Z]+)(\d+)-([a-zA-Z]+)(\d+)', device_square)
-        for index, r in enumerate(m):
-            r = list(r)
-            # exclude the last "match"
-            if not r[1]:
-                r[1] = r[3]
-            if not r[3]:
-                r[3] = r[1]
-            if not r[0]:
-                r[0] = r[2]
-            if not r[2]:
-                r[2] = r[0]
-            if r[1] > r[3]:
-                t = r[1]
-                r[1] = r[3]
-                r[3] = t
-            wd1 = self._w2d(r[0])
-            wd2 = self._w2d(r[2])
-            if wd2 < wd1:
-                t = wd1
-                wd1 = wd2
-                wd2 = t
-            if (not r[0] or not r[1]):
-                r = m[index]
-                print('Warning: illegal device range supplied: %s%s-%s%s' % (r[0], r[1], r[2], r[3]))
-                continue
-            d_range = range(int(r[1]), int(r[3]) + 1)
-            w_range = range(wd1, wd2 + 1)
-            lst=[]
-            for w_index, dw in enumerate(w_range):
-                for d_index, d in enumerate(d_range):
-                    dev = self._d2w(dw)+str(d)
-                    if dev in self._dev_list:
-                        lst.append(dev)
+            # the square around the devices in the device ranges
+            shown = ~layout.hidden
+            if not np.any(shown):
+                return lst
+            device_square = '%s%d-%s%d' % (self._d2w(layout.col[shown].min()), layout.row[shown].min(),
+                                           self._d2w(layout.col[shown].max()), layout.row[shown].max())
+        for r in _SQUARE.findall(device_square):
+            [wd1, wd2] = sorted([self._w2d(r[0]), self._w2d(r[2])])
+            [d1, d2] = sorted([int(r[1]), int(r[3])])
+            lst.extend(layout.select((layout.col >= wd1) & (layout.col <= wd2) &
+                                     (layout.row >= d1) & (layout.row <= d2)))
         return lst
 
     def _dev_range_to_list(self, device_range):
         lst = []
+        layout = self._layout
+        last_rows = layout.last_rows()  # the columns in the device ranges have a last row
         if '*' in device_range:
-            device_range = device_range.replace('*','%s-%s' % (self._cols[0], self._cols[-1]))
-        m = re.findall(' *,? *([a-zA-Z]+)(\d*)-?([a-zA-Z]*)(\d*)', device_range)
-        for index, r in enumerate(m):
-            r = list(r)
+            cols = np.nonzero(last_rows >= 0)[0]
+            if not cols.size:
+                return lst
+            device_range = device_range.replace('*','%s-%s' % (self._d2w(cols[0]), self._d2w(cols[-1])))
+        for r in _RANGE.findall(device_range):
             if not r[0]: continue  # first column should be set
-            if not r[1]:
-                dorow = True
-                r[1] = 1  # if first row isn't set, assume 1
-            else:
-                dorow = False
-            if not r[2]:
-                r[2] = r[0]  # if the second column isn't set, it should be the same as the first
-            if not r[3] and not dorow and r[2] == r[0]:
-                r[3] = r[1]  # if it is a single device, set r3 = r1
-            elif not r[3]:
-                r[3] = self._dev_list[r[2]][-1]  # if it is multiple columns, go til the end
-            # make w range
-            try:
-                cols = self._cols[self._cols.index(r[0]):self._cols.index(r[2]) + 1]
-            except:
+            c1 = self._w2d(r[0])
+            c2 = self._w2d(r[2]) if r[2] else c1  # if the second column isn't set, it should be the same as the first
+            if r[1] and not r[3] and c2 == c1:
+                # a single device (which may be hidden)
+                if r[0] + str(int(r[1])) in layout.index:
+                    lst.append(r[0] + str(int(r[1])))
+                continue
+            if max(c1, c2) >= last_rows.size or last_rows[c1] < 0 or last_rows[c2] < 0:
                 continue
-            for c_index, col in enumerate(cols):
-                d1 = int(r[1])
-                if c_index > 0:
-                    d1 = 1
-                d2 = int(self._dev_list[col][-1])
-                if c_index == len(cols) - 1:
-                    d2 = int(r[3])
-                try:
-                    _ = self._dev_list[col][d1 - 1]
-                    _ = self._dev_list[col][d2 - 1]
-                    d_range = self._dev_list[col][d1 - 1:d2]
-                    if len(d_range) < 2:
-                        d_range=range(d_range,d_range+1)
-                except:
-                    d_range = range(d1, d2 + 1)
-                for d_index, d in enumerate(d_range):
-                    # if not d in self._dev_list
-                    dev = col + str(d)
-                    if dev in self._dev_list:
-                        lst.append(dev)
+            # every column from the first row (or from 1) until its last row, but the last column until the last row
+            d2 = int(r[3]) if r[3] else last_rows[c2]
+            selected = (layout.col >= c1) & (layout.col <= c2) & \
+                       (layout.row <= np.where(layout.col == c2, d2, last_rows[layout.col]))
+            if r[1]:
+                selected &= (layout.col != c1) | (layout.row >= int(r[1]))
+            lst.extend(layout.select(selected))
         return lst
 
     def load_template(self, filename, ignore_hidden=True):
@@ -377,32 +621,45 @@ class Chip:
             f = open(filename, "r")
         for line in f:
             m = re.match(
-                ' *(hidden|test|exclude)? *([a-zA-Z0-9\-]+) *, *\( *(-?\d*\.?\d+) *, *(-?\d*\.?\d+) *\) *, *\( *(-?\d*\.?\d+) *, *(-?\d*\.?\d+) *\) *',
+                r' *(hidden|test|exclude)? *([a-zA-Z0-9\-]+) *, *\( *(-?\d*\.?\d+) *, *(-?\d*\.?\d+) *\) *, *\( *(-?\d*\.?\d+) *, *(-?\d*\.?\d+) *\) *',
                 line)
             if m:
                 g = list(m.groups())
+                test = g[0] == 'test'  # test devices stay marked, also when the hidden devices are added
                 if not ignore_hidden:  # just add all devices, do not ignore hidden
                     g[0] = False
                 self.define_devices(g[1], position=(float(g[2]), float(g[3])), pitch=(float(g[4]), float(g[5])),
-                                    hide_from_range=bool(g[0]))
+                                    hide_from_range=bool(g[0]), test=test)
         f.close()
         return True
 
     def limit_range(self, device_square):
-        lst = self._dev_square_to_list(device_square)
-        it = [dev for dev in self._dev_list]
-        for dev in it:
-            m = re.match(' *([a-zA-Z]+)([0-9]+) *', dev)
-            if m:
-                if not dev in lst:
-                    del self._dev_list[dev]
-                    try:
-                        self._dev_list[m.group(1)].remove(int(m.group(2)))
-                        if not len(self._dev_list[m.group(1)]):
-                            del self._dev_list[m.group(1)]
-                            self._cols.remove(m.group(1))
-                    except:
-                        pass
+        lst = self.device_square(device_square)
+        self._layout.keep(np.array([dev in lst for dev in self._layout.names], dtype=bool))
+        self._index = None
+        self._device_sets = {}
+
+    def _device_set(self, kind, expression, to_list):
+        if isinstance(expression, DeviceSet):
+            return expression
+        key = (kind, expression)
+        if not key in self._device_sets:
+            self._device_sets[key] = DeviceSet(to_list(expression))
+        return self._device_sets[key]
+
+    def device_range(self, device_range):
+        '''
+        :param device_range: device range, column by column (see load_devices)
+        :return: the DeviceSet of the device range, parsed once per chip definition
+        '''
+        return self._device_set('range', device_range, self._dev_range_to_list)
+
+    def device_square(self, device_square):
+        '''
+        :param device_square: device square (see define_devices)
+        :return: the DeviceSet of the device square, parsed once per chip definition
+        '''
+        return self._device_set('square', device_square, self._dev_square_to_list)
 
     def load_devices(self, device_range):
         '''
@@ -413,10 +670,11 @@ class Chip:
         a3-5 does devices a3, a4 and a5
         a3-b5 does all devices in a starting from a3, and continues to do all devices in b until (including) b5
 
-        :param device_range:
+        :param device_range: device range or DeviceSet
         :return nothing:
         '''
-        self._run_dev_list = self._dev_range_to_list(device_range)
+        self._run_dev_list = list(self.device_range(device_range).devices)
+        self._route_planned = False
 
     def load_from_file(self,filename):
         '''
@@ -453,36 +711,168 @@ class Chip:
             self._run_dev_list = self._run_dev_list[index:] + self._run_dev_list[:index]
         else:
             self._run_dev_list = self._run_dev_list[index:]
+        if self._route_planned:
+            self.plan_route(dev)  # the route from the start device, instead of wrapping around to the skipped devices
         return dev
 
+    def plan_route(self, start=None):
+        '''
+        reorders the device list to minimise the travel between the devices (see the documentation at the top)
+
+        :param start: device to start at (the first device of the list if None or not in the list)
+        :return: [travel before, travel after] in the units of the template
+        '''
+        if not self._run_dev_list:
+            return [0., 0.]
+        devices = []
+        counts = {}
+        for dev in self._run_dev_list:
+            if not dev in counts:
+                devices.append(dev)
+                counts[dev] = 0
+            counts[dev] += 1
+        if not start in counts:
+            start = self._run_dev_list[0]
+        xy = self.get_device_positions(devices)
+        order = _plan_route(xy, devices.index(start))
+        before = _travel(self.get_device_positions(self._run_dev_list))
+        self._run_dev_list = [devices[k] for k in order for _ in range(counts[devices[k]])]
+        self._route_planned = True
+        after = _travel(xy[order])
+        print('Route of %d devices planned: travel %.0f instead of %.0f (%.0f%% saved)' %
+              (len(devices), after, before, 100. * (before - after) / before if before else 0.))
+        return [before, after]
+
     def add_experiment(self,script_file,devices='*',**kwargs):
         '''
         add an experiment to the experiment list. The execute_experiment function will run over experiments and run them
         :param script_file:
-        :param devices:
+        :param devices: device square or DeviceSet
         :return:
         '''
-        device_list = self._dev_square_to_list(devices)
-        exp = Experiment(script_file, name=self._name, devices=device_list, **kwargs)
+        exp = Experiment(script_file, name=self._name, devices=self.device_square(devices), **kwargs)
         self._experiments.append(exp)
         return exp
 
     def get_device_position(self,dev):   #gets the absolute position of a device from the origin point (0,0)
         m = re.match(' *([a-z]+[0-9]+) *',dev)
         if m:
-            d = m.group(1)
-            if not d in self._dev_list:
-                return (-1,-1)
-            return (self._dev_list[dev][0], self._dev_list[dev][1])
+            k = self._layout.index.get(m.group(1))
+            if k is not None:
+                return (float(self._layout.x[k]), float(self._layout.y[k]))
         return (-1,-1)
 
-    def get_device_from_position(self,position):
-        for dev in self._dev_list:
-            if len(self._dev_list[dev]) > 1:
-                if self._dev_list[dev][0] == position[0] and self._dev_list[dev][1] == position[1]:
-                    return dev
+    def get_device_positions(self, devices):
+        '''
+        :param devices: list of devices
+        :return: array (n, 2) with the positions of the devices, (-1, -1) for devices that are not on the chip
+        '''
+        return self._layout.positions(devices)
+
+    def get_devices_in_box(self, corner, opposite_corner, include_hidden=True):
+        '''
+        :param corner, opposite_corner: tuples (position_x, position_y) of opposite corners of the box
+        :param include_hidden: also list the devices that are hidden from the device ranges
+        :return: list of the devices in the box, column by column
+        '''
+        layout = self._layout
+        [x1, x2] = sorted([corner[0], opposite_corner[0]])
+        [y1, y2] = sorted([corner[1], opposite_corner[1]])
+        selected = (layout.x >= x1) & (layout.x <= x2) & (layout.y >= y1) & (layout.y <= y2)
+        if not include_hidden:
+            selected &= ~layout.hidden
+        return layout.select(selected)
+
+    def transform(self, offset=(0,0), angle=0., scale=1.):
+        '''
+        moves all devices: their positions are scaled and rotated around (0, 0), then shifted
+
+        :param offset: tuple (x, y) that is added to the positions
+        :param angle: counterclockwise rotation in degrees
+        :param scale: factor by which the positions are scaled
+        '''
+        [c, s] = [scale * np.cos(np.radians(angle)), scale * np.sin(np.radians(angle))]
+        self._layout.transform([[c, -s], [s, c]], offset)
+        self._index = None
+
+    def _position_index(self):
+        '''
+        builds the spatial index of the device positions: the devices are sorted into square cells, which are about the
+        size of the device spacing
+
+        :return: [devices, positions (n, 2), cell size, {cell: indices of the devices in the cell}, [lowest cell, highest
+            cell]]
+        '''
+        if self._index is None:
+            devices = list(self._layout.names)
+            xy = np.column_stack((self._layout.x, self._layout.y)).reshape(-1, 2)
+            size = 1.
+            if len(devices) > 1:
+                extent = xy.max(axis=0) - xy.min(axis=0)
+                area = np.prod(extent[extent > 0]) if np.any(extent > 0) else 0.
+                size = (area / len(devices)) ** (1. / max(np.count_nonzero(extent > 0), 1)) or 1.
+            cells = {}
+            cell_of = np.floor(xy / size).astype(int)
+            for [k, cell] in enumerate(map(tuple, cell_of)):
+                cells.setdefault(cell, []).append(k)
+            bounds = [cell_of.min(axis=0), cell_of.max(axis=0)] if len(devices) else [None, None]
+            self._index = [devices, xy, size, cells, bounds]
+        return self._index
+
+    def get_nearest_devices(self, position, k=1):
+        '''
+        :param position: tuple (position_x, position_y)
+        :param k: number of devices
+        :return: list of [device, distance] of the k devices nearest to the position, nearest first
+        '''
+        [devices, xy, size, cells, [low, high]] = self._position_index()
+        k = min(k, len(devices))
+        if k < 1:
+            return []
+        point = np.array(position[:2], dtype=float)
+        cell = np.floor(point / size).astype(int)
+        if np.any(cell < low) or np.any(cell > high):
+            found = list(range(len(devices)))  # outside of the chip, where the rings would be mostly empty
+        else:
+            [cx, cy] = cell
+            reach = int(np.max(np.maximum(cell - low, high - cell)))  # the ring that includes all cells
+            found = list(cells.get((cx, cy), []))
+            ring = 0
+            while ring < reach:
+                # the devices outside the rings searched so far are at least ring * size away
+                if len(found) >= k and np.sort(np.hypot(*(xy[found] - point).T))[k - 1] <= ring * size:
+                    break
+                ring += 1
+                # the cells on the square ring around the cell of the position
+                for x in range(cx - ring, cx + ring + 1):
+                    found.extend(cells.get((x, cy - ring), []))
+                    found.extend(cells.get((x, cy + ring), []))
+                for y in range(cy - ring + 1, cy + ring):
+                    found.extend(cells.get((cx - ring, y), []))
+                    found.extend(cells.get((cx + ring, y), []))
+        found = np.array(found, dtype=int)
+        distance = np.hypot(*(xy[found] - point).T)
+        nearest = np.argsort(distance, kind='mergesort')[:k]
+        return [[devices[found[n]], float(distance[n])] for n in nearest]
+
+    def get_device_from_position(self, position, tolerance=1.):
+        '''
+        :param position: tuple (position_x, position_y)
+        :param tolerance: largest distance between the position and the device
+        :return: the device at the position, an empty string if there is none
+        '''
+        nearest = self.get_nearest_devices(position, 1)
+        if nearest and nearest[0][1] <= tolerance:
+            return nearest[0][0]
         return ''
 
+    @property
+    def layout(self):
+        '''
+        :return the ChipLayout with the arrays of the devices that are defined on the chip:
+        '''
+        return self._layout
+
     @property
     def experiments(self):
         return self._experiments
@@ -0,0 +1,131 @@
+"""
+
+Co-acquisition of a gate sweep by the HP 4156A with a current versus time trace of the ADwin
+
+The HP sweeps the gate, while the ADwin records the current through the FEMTO on its input channel and the gate
+voltage on the other ADC channel (the HP gate output, divided by vg_scale). The trace is armed before the sweep and
+stopped as soon as the HP returns. There is no trigger line between the instruments, so the sweep is located in the
+trace by the gate voltage: the sweep starts when the gate moves more than vg_threshold from its resting value, and
+every ADwin datapoint is assigned to the nearest HP step of the segment of the sweep it was measured in. The result
+is decimated to the HP steps.
+
+Usage (see HP_ADwin_gatetrace.py):
+    [vg, i, t, flags] = hp_gate_trace(adwin, hp, v_min=-100, v_max=100, v_step=1, bias=0.2, data_frequency=50)
+        vg = the gate voltages of the HP sweep in V
+        i = the mean current measured by the ADwin at every gate voltage in A (NaN for steps without datapoints)
+        t = the mean time of the datapoints of every gate voltage in s, from the start of the sweep
+        flags = the flags of the trace (ADWIN_FLAG_NO_DATA if the sweep was not found in the trace)
+    [vg, i, t] = align_to_sweep(t, vg_trace, i_trace, v_sweep)
+        The alignment alone, for a trace and sweep that were measured in another way.
+"""
+import numpy as np
+from imports.adwin_femto import BUFFER_SIZE, ADWIN_FLAG_DATA_INCOMPLETE, ADWIN_FLAG_NO_DATA
+from imports.timing import timed
+
+
+def _segments(v_sweep):
+    '''
+    :return: list of [first, last] indices of the monotonic segments of the sweep (a turning point ends a segment)
+    '''
+    direction = np.sign(np.diff(v_sweep))
+    segments = []
+    first = 0
+    current = 0
+    for k in range(direction.size):
+        if direction[k] == 0:
+            continue
+        if current != 0 and direction[k] != current:
+            segments.append([first, k])
+            first = k
+        current = direction[k]
+    segments.append([first, v_sweep.size - 1])
+    return segments
+
+
+def align_to_sweep(t, vg, i, v_sweep, threshold=None):
+    '''
+    decimates a trace that was recorded during a sweep to the steps of the sweep
+
+    :param t: time of every datapoint of the trace in s
+    :param vg: measured sweep voltage of every datapoint of the trace in V
+    :param i: current of every datapoint of the trace in A
+    :param v_sweep: the voltage steps of the sweep in V, in the order in which they were applied
+    :param threshold: change of vg in V that marks the start of the sweep (None uses half a step)
+    :return: [v_sweep, i, t] with the mean current and time of the datapoints of every step, None if the trace does
+        not contain the sweep
+    '''
+    [t, vg, i] = [np.asarray(t, dtype=float), np.asarray(vg, dtype=float), np.asarray(i, dtype=float)]
+    v_sweep = np.asarray(v_sweep, dtype=float)
+    steps = np.abs(np.diff(v_sweep))
+    step = np.median(steps[steps > 0]) if np.any(steps > 0) else 0.
+    if threshold is None:
+        threshold = step / 2.
+    rest = np.median(vg[:10]) if vg.size else 0.
+    moved = np.nonzero(np.abs(vg - rest) > threshold)[0]
+    if not moved.size or not step:
+        return None
+    # the boundaries of the segments of the sweep in the trace: a segment ends when vg reaches its last step
+    segments = _segments(v_sweep)
+    bounds = [moved[0]]
+    for [first, last] in segments:
+        direction = np.sign(v_sweep[last] - v_sweep[first])
+        reached = np.nonzero(direction * (vg[bounds[-1]:] - v_sweep[last]) >= -threshold)[0]
+        bounds.append(bounds[-1] + reached[0] + 1 if reached.size else vg.size)
+    # the first step was applied before vg moved and the last one is held after the sweep: keep one dwell time of each
+    dwell = max(int(round(float(bounds[-1] - bounds[0]) / v_sweep.size)), 1)
+    bounds[0] = max(bounds[0] - dwell, 0)
+    bounds[-1] = min(bounds[-1] + dwell, vg.size)
+    index = np.zeros(vg.size, dtype=int)
+    use = np.zeros(vg.size, dtype=bool)
+    for [[first, last], start, stop] in zip(segments, bounds[:-1], bounds[1:]):
+        levels = v_sweep[first:last + 1]
+        order = np.argsort(levels, kind='mergesort')
+        middles = (levels[order][1:] + levels[order][:-1]) / 2.
+        index[start:stop] = first + order[np.digitize(vg[start:stop], middles)]
+        use[start:stop] = True
+    count = np.bincount(index[use], minlength=v_sweep.size).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        i_mean = np.bincount(index[use], weights=i[use], minlength=v_sweep.size) / count
+        t_mean = np.bincount(index[use], weights=t[use], minlength=v_sweep.size) / count
+    for k in np.nonzero(count == 0)[0]:  # a step that is repeated (e.g. the turning point) shares its datapoints
+        for neighbour in (k - 1, k + 1):
+            if 0 <= neighbour < v_sweep.size and v_sweep[neighbour] == v_sweep[k] and count[neighbour]:
+                [i_mean[k], t_mean[k]] = [i_mean[neighbour], t_mean[neighbour]]
+    return [v_sweep, i_mean, t_mean - t[bounds[0]]]
+
+
+@timed('coacquisition.hp_gate_trace')
+def hp_gate_trace(adwin, hp, v_min, v_max, v_step, bias=0., data_frequency=50, num_average=1000, vg_scale=10.,
+                  vg_threshold=None, max_duration=3600.):
+    '''
+    sweeps the gate with the HP while the ADwin records the current, and aligns both
+
+    :param adwin: ADwinFemto, which measures the current on its input channel and the gate on the other ADC channel
+    :param hp: HP, which sweeps the gate (see HP.sweep_triangle)
+    :param bias: source voltage in V (output by both, as the switch decides which of them reaches the source)
+    :param data_frequency: datapoints per second of the ADwin trace
+    :param num_average: number of averaged reads per datapoint of the ADwin trace
+    :param vg_scale: gate voltage per V on the ADC channel
+    :param vg_threshold: change of the gate voltage in V that marks the start of the sweep (None uses half a step)
+    :param max_duration: the trace is armed for at most this duration of the sweep in s
+    :return: [vg, i, t, flags] (see the module documentation)
+    '''
+    num_datapoints = int(min(max_duration * data_frequency, BUFFER_SIZE))
+    adwin.current_time_trace(bias, data_frequency=data_frequency, num_datapoints=num_datapoints,
+                             num_average=num_average, wait_for_complete=False, in_channel='both')
+    [v_sweep, _] = hp.sweep_triangle(v_min=v_min, v_max=v_max, v_step=v_step, electrode='gate', source=bias)
+    adwin.stop()  # the sweep is done, so is the trace
+    adwin.wait()
+    [t, channels, flags, count] = adwin.get_data()
+    if count >= num_datapoints:
+        print('Warning: the HP sweep took longer than the armed trace (max_duration).')
+        flags |= ADWIN_FLAG_DATA_INCOMPLETE
+    if np.size(v_sweep) < 2 or np.size(t) == 0:
+        return [[], [], [], flags | ADWIN_FLAG_NO_DATA]
+    # the trace holds both ADC channels in the order of the channels, the current is that of the input channel
+    [i, vg] = channels if adwin._input_channel == 1 else channels[::-1]
+    aligned = align_to_sweep(t, np.asarray(vg) * vg_scale, i, v_sweep, vg_threshold)
+    if aligned is None:
+        print('Warning: the gate sweep was not found in the trace of the ADwin.')
+        return [[], [], [], flags | ADWIN_FLAG_NO_DATA]
+    return aligned + [flags]
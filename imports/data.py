@@ -2,8 +2,11 @@ import qt
 import inspect
 import os
 import time
+import numpy as np
+from imports.timing import timed
 basepath = 'c:\\data'
 class Data(object):
+    @timed('data.create')
     def create_file(self):
         '''
         This code uses private variables of QTLab because the authors of QTLab didn't want us to sort data in a normal way
@@ -56,6 +59,7 @@ class Data(object):
             self._vals.append(str(values))
             self._data.add_value(str(values))
 
+    @timed('data.fill')
     def fill(self, *args, **kwargs):
         if args:
             if len(args) != len(self._coords) + len(self._vals):
@@ -78,9 +82,30 @@ class Data(object):
     def add_data_point(self, *args, **kwargs):
         self.fill(*args, **kwargs)
 
+    @timed('data.fill')
+    def fill_grid(self, x, y, values):
+        '''
+        writes a grid of values (e.g. a stability diagram) in one call, one block per row
+
+        :param x: first coordinate of every row (length n_rows)
+        :param y: second coordinate of every column (length n_columns), or of every value (n_rows, n_columns), e.g. the
+            voltage of every cycle of a sweep_triangle (see TriangleSweep)
+        :param values: 2D array of the values (n_rows, n_columns)
+        '''
+        if len(self._coords) != 2 or len(self._vals) != 1:
+            print('Error (data.fill_grid): data is not a grid of 2 coordinates and 1 value.')
+            return
+        y = np.asarray(y)
+        for row in range(len(x)):
+            y_row = y[row] if y.ndim > 1 else y
+            self._data.add_data_point(x[row] * np.ones(y_row.size), y_row, np.asarray(values[row]))
+            self._data.new_block()
+
+    @timed('data.new_block')
     def new_block(self):
         self._data.new_block()
 
+    @timed('data.plot')
     def plot3d(self, coorddims=(0,1), valdim=2, traceofs=0, **kwargs):
         name = kwargs.get('name',self._name)
         try: del kwargs['name']
@@ -90,6 +115,7 @@ class Data(object):
         else:
             self._plots[name]=qt.Plot3D(self._data, name=name, coorddims=coorddims, valdim=valdim, traceofs=traceofs, **kwargs)
 
+    @timed('data.plot')
     def plot2d(self, coorddim=0, valdim=0, traceofs=0, **kwargs):
         if valdim == 0:
             valdim = len(self._coords)
@@ -107,10 +133,12 @@ class Data(object):
         else:
             self.plot2d(**kwargs)
 
+    @timed('data.plot')
     def save_png(self, **kwargs):
         for plot in self._plots:
             self._plots[plot].save_png()
 
+    @timed('data.close')
     def close(self):
         self._data.close_file()
 
@@ -2,8 +2,10 @@ import importlib
 import time
 import os
 import shutil
+import json
 import qt
 from imports.data import Data
+from imports.timing import timing, span
 
 class Experiment(object):
     _info_file = ''
@@ -25,7 +27,9 @@ class Experiment(object):
             self._kwargs = {}
         self._instr = self._exp.init()
         self._name = name
-        self._devices = devices
+        if isinstance(devices, basestring):
+            devices = [devices]  # a single device (e.g. of an experiment run by the RUN code)
+        self._devices = devices if isinstance(devices, frozenset) else frozenset(devices)  # set, for a fast `in`
         # generate the experiment info file
         if not Experiment._info_file:
             d = Data(name='%s_info' % (name))
@@ -58,7 +62,8 @@ class Experiment(object):
             output = [device, str(time.time() - Experiment._t0), self.script]
             for key in tkwargs:
                 output.append('%s:%s' % (key, tkwargs[key]))
-            o = self._exp.start(self._instr,self._name, device, **tkwargs)
+            with span('experiment.%s' % self.script):
+                o = self._exp.start(self._instr,self._name, device, **tkwargs)
             if type(o) is list or type(o) is tuple:
                 for j in range(len(o)):
                     output.append(str(o[j]))
@@ -69,6 +74,13 @@ class Experiment(object):
                     f.write('\t'.join(output) + '\n')
             except:
                 print("Warning: couldn't save experimental info to file.")
+            # save where the time went (the record includes the movement to the device and the signal routing)
+            record = timing.record(device=device, experiment=self.script)
+            try:
+                with open('%s_timing.txt' % os.path.splitext(self._info_file)[0], "a") as f:
+                    f.write(json.dumps(record) + '\n')
+            except:
+                print("Warning: couldn't save timing info to file.")
             return output
         return []
 
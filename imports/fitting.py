@@ -0,0 +1,161 @@
+"""
+
+Resistance fits of IV traces, for one trace or for many traces at once
+
+All fits take stacked traces, arrays of shape (n_traces, n_points), and fit every trace in one pass. A single trace (a
+1d array) gives floats instead of arrays. Datapoints that are NaN are left out, so traces of different lengths can be
+stacked by padding them with NaN.
+
+Usage:
+    from imports.fitting import fit_resistance, fit_resistance_robust
+
+    [R, I0, r2, R_error] = fit_resistance(v, i)  # fits I = V / R + I0
+    [R, I0, r2, R_error] = fit_resistance(v, i, v_window=0.1)  # fits only the datapoints with |V| <= 0.1 V
+
+    # the resistance of every cycle of a triangle sweep
+    [v, i, flags] = instrument.sweep_triangle(-0.4, 0.4, num_datapoints=200, num_cycles=50)
+    [R, I0, r2, R_error] = fit_resistance(np.reshape(v, (50, 200)), np.reshape(i, (50, 200)))
+
+    # the same, but insensitive to outliers (switching events, spikes)
+    [R, I0, r2, R_error] = fit_resistance_robust(v, i)
+
+    The returned values are:
+        R = the resistance in Ohm (NaN when the trace has less than 3 datapoints or no slope)
+        I0 = the current at zero bias in A
+        r2 = the coefficient of determination of the fit
+        R_error = the standard error of R in Ohm (inf when R is NaN)
+"""
+import numpy as np
+from imports.timing import timed
+
+_BISQUARE = 4.685  # tuning constant of the Tukey bisquare weights (95% efficiency for normally distributed noise)
+_MAD_SCALE = 1.4826  # converts the median absolute deviation to the standard deviation of normally distributed noise
+_SCALE_FLOOR = 1e-9  # smallest noise scale of the robust fit, relative to the largest current of the trace
+
+
+def _prepare(v, i, v_window):
+    '''
+    :return: [v, i, w, single], the traces as 2d arrays with NaN replaced by 0, the weights (1 for the datapoints to
+        fit, 0 otherwise) and whether a single trace was given
+    '''
+    v = np.asarray(v, dtype=float)
+    i = np.asarray(i, dtype=float)
+    single = v.ndim < 2 and i.ndim < 2
+    [v, i] = np.broadcast_arrays(np.atleast_2d(v), np.atleast_2d(i))  # one voltage axis may serve all traces
+    w = np.isfinite(v) & np.isfinite(i)
+    if v_window is not None:
+        w &= np.abs(np.where(w, v, 0.)) <= v_window
+    return [np.where(w, v, 0.), np.where(w, i, 0.), w.astype(float), single]
+
+
+def _weighted_fit(v, i, w):
+    '''
+    weighted least squares fit of i = slope * v + intercept along the last axis
+
+    :return: [slope, intercept, r2, slope_error, residuals]
+    '''
+    n = (w > 0).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sw = w.sum(axis=-1)
+        v_mean = (w * v).sum(axis=-1) / sw
+        i_mean = (w * i).sum(axis=-1) / sw
+        dv = v - v_mean[:, None]
+        di = i - i_mean[:, None]
+        sxx = (w * dv * dv).sum(axis=-1)
+        sxy = (w * dv * di).sum(axis=-1)
+        syy = (w * di * di).sum(axis=-1)
+        slope = sxy / sxx
+        intercept = i_mean - slope * v_mean
+        r2 = sxy * sxy / (sxx * syy)
+        residuals = di - slope[:, None] * dv
+        sse = (w * residuals * residuals).sum(axis=-1)
+        slope_error = np.sqrt(sse / (sw * (n - 2) / n) / sxx)
+    invalid = (n < 3) | ~(sxx > 0)
+    slope[invalid] = np.nan
+    return [slope, intercept, r2, slope_error, residuals]
+
+
+def _result(slope, intercept, r2, slope_error, single):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        R = 1. / slope
+        R_error = slope_error / (slope * slope)
+    bad = ~np.isfinite(R) | (slope == 0)
+    R[bad] = np.nan
+    R_error[bad | ~np.isfinite(R_error)] = np.inf
+    if single:
+        return [float(R[0]), float(intercept[0]), float(r2[0]), float(R_error[0])]
+    return [R, intercept, r2, R_error]
+
+
+@timed('fit')
+def fit_resistance(v, i, v_window=None):
+    '''
+    fits I = V / R + I0 to every trace by least squares
+
+    :param v: voltage in V, shape (n_points) or (n_traces, n_points)
+    :param i: current in A, shape (n_points) or (n_traces, n_points)
+    :param v_window: only the datapoints with |V| <= v_window are fitted (None fits all datapoints)
+    :return: [R, I0, r2, R_error], floats for a single trace, arrays of length n_traces otherwise
+    '''
+    [v, i, w, single] = _prepare(v, i, v_window)
+    [slope, intercept, r2, slope_error, _] = _weighted_fit(v, i, w)
+    return _result(slope, intercept, r2, slope_error, single)
+
+
+@timed('fit')
+def fit_resistance_robust(v, i, v_window=None, iterations=10):
+    '''
+    fits I = V / R + I0 to every trace, with datapoints far from the fit weighted down (iteratively reweighted least
+    squares with Tukey bisquare weights). Spikes and switching events then hardly affect R.
+
+    :param iterations: maximum number of reweighting steps
+    :return: [R, I0, r2, R_error] (see fit_resistance), where r2 and R_error are those of the weighted fit
+    '''
+    [v, i, mask, single] = _prepare(v, i, v_window)
+    w = mask
+    residuals = _resistant_residuals(v, i, mask)  # a least squares start would already be pulled by the outliers
+    for _ in range(iterations):
+        masked = np.where(mask > 0, np.abs(residuals), np.nan)
+        # the scale of the noise, at least a fraction _SCALE_FLOOR of the current (a trace without noise)
+        scale = np.maximum(_MAD_SCALE * _nanmedian(masked), _SCALE_FLOOR * np.abs(i * mask).max(axis=-1))
+        scale[~(scale > 0)] = np.inf  # no current at all, nothing to weight
+        u = np.nan_to_num(residuals / (_BISQUARE * scale[:, None]))
+        w_next = mask * np.where(np.abs(u) < 1, (1 - u * u) ** 2, 0.)
+        if np.allclose(w_next, w):
+            break
+        w = w_next
+        residuals = _weighted_fit(v, i, w)[4]
+    [slope, intercept, r2, slope_error, _] = _weighted_fit(v, i, w)
+    return _result(slope, intercept, r2, slope_error, single)
+
+
+def _resistant_residuals(v, i, mask):
+    '''
+    :return: the residuals of Tukey's resistant line: the line through the medians of the left and the right third of
+        the datapoints of every trace
+    '''
+    n = mask.sum(axis=-1)
+    rank = np.argsort(np.argsort(np.where(mask > 0, v, np.inf), axis=-1), axis=-1)  # the datapoints to fit first
+    third = np.maximum(n // 3, 1)[:, None]
+    left = (mask > 0) & (rank < third)
+    right = (mask > 0) & (rank >= n[:, None] - third)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (_nanmedian(np.where(right, i, np.nan)) - _nanmedian(np.where(left, i, np.nan))) / \
+                (_nanmedian(np.where(right, v, np.nan)) - _nanmedian(np.where(left, v, np.nan)))
+    slope[~np.isfinite(slope)] = 0.
+    residuals = i - slope[:, None] * v
+    return residuals - _nanmedian(np.where(mask > 0, residuals, np.nan))[:, None]
+
+
+def _nanmedian(a):
+    '''
+    :return: the median of every row of a, ignoring NaN (NaN for rows without datapoints)
+    '''
+    a = np.sort(a, axis=-1)  # NaN is sorted to the end
+    n = np.isfinite(a).sum(axis=-1)
+    rows = np.arange(a.shape[0])
+    lower = a[rows, np.maximum((n - 1) // 2, 0)]
+    upper = a[rows, np.maximum(n // 2, 0)]
+    median = (lower + upper) / 2.
+    median[n == 0] = np.nan
+    return median
@@ -1,4 +1,4 @@
-from scipy import stats
+from imports.fitting import fit_resistance
 import qt
 import thread
 
@@ -29,8 +29,7 @@ def linear_fit_resistance(Vdata, Idata):
     :param Idata:
     :return the resistance of a linear fit across the data:
     """
-    slope, intercept, r_value, p_value, std_err = stats.linregress(Vdata, Idata)
-    return 1 / slope  # return resistance
+    return fit_resistance(Vdata, Idata)[0]  # return resistance (see fitting.py for many traces at once)
 
 def sleep(seconds):
     qt.msleep(seconds)
@@ -1,5 +1,6 @@
 import qt
 import numpy as np
+from imports.timing import timed
 class HP(object):
     instr = 0
     def __init__(self, source=1, drain=2, gate=3, screen_refresh=False):
@@ -13,6 +14,7 @@ class HP(object):
         HP.instr.set('smu_func%d' % drain, 'CONS')
         self._screen_refresh = 1 if screen_refresh else 0
 
+    @timed('hp.write')
     def write(self, v, electrode='source'):
         HP.instr.set('screen_refresh', self._screen_refresh)
         if electrode=='gate':
@@ -21,6 +23,7 @@ class HP(object):
             HP.instr.set('smu_source%d' % self._source, v)
         HP.instr.set('screen_refresh', 1)
 
+    @timed('hp.sweep_triangle')
     def sweep_triangle(self, v_min=-0.4, v_max=0.4, v_step=0.01, electrode='source', source=0, gate=0):
         HP.instr.set('screen_refresh', self._screen_refresh)
         sw = self._source
@@ -0,0 +1,124 @@
+"""
+
+Background worker for saving and plotting data while the next measurement runs
+
+Usage:
+    with Pipeline(max_pending=4) as pipeline:
+        for n in range(cycles):
+            [v, i, flags] = instr.eburn()
+            pipeline.submit(save, data, n, v, i)  # save(data, n, v, i) runs on the worker, in the order of submission
+            pipeline.plot(data)  # plots data once it is saved, on this thread
+
+    The work is queued and runs on a single worker thread, so that the measurement loop does not wait for files and
+    plots. When max_pending jobs are queued, submit waits for the worker (the queue stays bounded). Leaving the with
+    block (also by an exception, e.g. exiting on user input) waits until all submitted work is done.
+    An error in a job is raised in the measurement loop by the next submit or flush, and the remaining jobs are skipped.
+    The arguments of submitted jobs should not be changed afterwards, as the job may still be waiting in the queue.
+    The plots of qtlab are not thread safe, so jobs should not plot: plot(data) marks data when the worker gets to it
+    (after the jobs submitted before), and the marked data is plotted by the next submit, flush or close, on the thread
+    of the measurement loop.
+"""
+import threading
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+
+class Pipeline(object):
+    def __init__(self, max_pending=4):
+        '''
+        :param max_pending: maximum number of queued jobs, submit waits when the queue is full
+        '''
+        self._queue = queue.Queue(max_pending)
+        self._error = None
+        self._lock = threading.Lock()
+        self._plots = []  # data to plot on the thread of the measurement loop
+        self._worker = threading.Thread(target=self._work)
+        self._worker.daemon = True
+        self._worker.start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                if self._error is None:
+                    [function, args, kwargs] = job
+                    function(*args, **kwargs)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise(self):
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise error
+
+    def _mark(self, data):
+        with self._lock:
+            if not any(marked is data for marked in self._plots):
+                self._plots.append(data)
+
+    def _replot(self):
+        with self._lock:
+            [plots, self._plots] = [self._plots, []]
+        for data in plots:
+            data.plot()
+
+    def submit(self, function, *args, **kwargs):
+        '''
+        queues function(*args, **kwargs) to run on the worker, and plots the data marked since the last call (see plot)
+
+        :raises: the error of an earlier job that failed
+        '''
+        self._raise()
+        if self._worker is None:
+            function(*args, **kwargs)  # closed, run it directly
+        else:
+            self._queue.put([function, args, kwargs])
+        self._replot()
+
+    def plot(self, data):
+        '''
+        plots data (with data.plot()) after the jobs submitted before are done. The plot is drawn by the next submit,
+        flush or close, so on the thread of the measurement loop rather than on the worker.
+
+        :param data: Data object
+        '''
+        self.submit(self._mark, data)
+
+    def flush(self):
+        '''
+        waits until all submitted work is done
+
+        :raises: the error of a job that failed
+        '''
+        self._queue.join()
+        self._replot()
+        self._raise()
+
+    def close(self, raise_errors=True):
+        '''
+        waits until all submitted work is done and stops the worker
+        '''
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+        self._replot()
+        if raise_errors:
+            self._raise()
+        elif self._error is not None:
+            print('Error (pipeline): %s' % self._error)
+            self._error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(raise_errors=exc_type is None)
+        return False
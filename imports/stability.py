@@ -0,0 +1,178 @@
+"""
+
+Online analysis of a current versus time trace, to end the trace as soon as the current is stable or an event occurs
+
+The monitor is fed the chunks of a streamed trace. It keeps the mean and variance of the whole trace and of its last
+window datapoints, the drift of the current over the window (the slope of a linear fit) and looks for sudden jumps in
+the current (switching events). A jump is a change of the mean of jump_length datapoints with respect to the
+jump_length datapoints before it, larger than jump_threshold times the noise. The same change between the neighbouring
+groups of datapoints is subtracted, so that a drift does not count as a jump, and the noise is estimated from the
+differences of successive datapoints. After a jump, the window starts again at the new level.
+
+Usage:
+    monitor = StabilityMonitor(window=200, max_relative_std=0.01, max_drift=0.01, stop_on_jump=False)
+    [t, i, flags, info] = instrument.current_time_trace(0.1, data_frequency=100, num_datapoints=6000, monitor=monitor)
+        The trace ends as soon as the current of the last 200 datapoints varies less than 1% and drifts less than 1%
+        over those datapoints. info['reason'] says why the trace ended: 'stable', 'jump' (with stop_on_jump=True),
+        'complete' (all num_datapoints were measured) or 'stopped' (by stop() or the cancel_hook). The other entries of
+        info are the statistics of the monitor (see StabilityMonitor.statistics), e.g. info['jumps'] lists the [t, step]
+        of all jumps.
+
+    The monitor can also be fed a stream (see ADwin_current_time_trace.py):
+        for [t, i, flags] in instrument.stream_current_time_trace(0.1, data_frequency=100, chunk_size=25):
+            if monitor.update(t, i):
+                break  # leaving the stream stops the trace
+
+    Or with a criterion of your own, which gets the statistics and returns True when the current is stable:
+        StabilityMonitor(window=500, criterion=lambda s: abs(s['window_mean']) < 1e-12)
+"""
+import numpy as np
+
+_MAD_SCALE = 1.4826  # converts the median absolute deviation to the standard deviation of normally distributed noise
+
+
+class StabilityMonitor(object):
+    def __init__(self, window=100, max_relative_std=None, max_drift=None, criterion=None, min_time=0.,
+                 jump_threshold=8., jump_length=5, stop_on_jump=False):
+        '''
+        :param window: number of most recent datapoints on which the stability is judged
+        :param max_relative_std: stable when the standard deviation over the window is at most this fraction of the mean
+        :param max_drift: stable when the current drifts at most this fraction of the mean over the window
+        :param criterion: callable that gets the statistics and returns True when stable (all set criteria must hold)
+        :param min_time: the trace is never stable before this time in s
+        :param jump_threshold: size of a jump in units of the noise of a mean of jump_length datapoints
+        :param jump_length: number of datapoints before and after a jump that are averaged to detect it
+        :param stop_on_jump: end the trace at the first jump (otherwise jumps are only recorded)
+        '''
+        self.window = int(window)
+        self.max_relative_std = max_relative_std
+        self.max_drift = max_drift
+        self.criterion = criterion
+        self.min_time = min_time
+        self.jump_threshold = jump_threshold
+        self.jump_length = int(jump_length)
+        self.stop_on_jump = stop_on_jump
+        self.reset()
+
+    def reset(self):
+        self.reason = None
+        self.jumps = []  # [t, step in A] of every jump
+        self._n = 0
+        self._mean = 0.
+        self._m2 = 0.  # sum of squared deviations from the mean (Chan's parallel variance)
+        self._t = np.zeros(0)
+        self._i = np.zeros(0)
+        self._t_last = None
+
+    def update(self, t, i):
+        '''
+        adds a chunk of the trace
+
+        :param t: time of the datapoints in s
+        :param i: current of the datapoints in A
+        :return: the reason to end the trace ('stable' or 'jump'), None to continue
+        '''
+        t = np.asarray(t, dtype=float)
+        i = np.asarray(i, dtype=float)
+        if not i.size:
+            return None
+        # statistics of the whole trace, merged chunk by chunk
+        [n, mean] = [i.size, i.mean()]
+        m2 = np.sum((i - mean) ** 2)
+        delta = mean - self._mean
+        total = self._n + n
+        self._m2 += m2 + delta * delta * self._n * n / total
+        self._mean += delta * n / total
+        self._n = total
+        self._t_last = t[-1]
+        checked = max(self._i.size - 2 * self.jump_length + 1, 0)  # the positions before it had all their datapoints
+        self._t = np.concatenate((self._t, t))
+        self._i = np.concatenate((self._i, i))
+        jump = self._find_jump(checked)
+        if jump is not None:
+            self.jumps.append([self._t[jump], self._i[jump:jump + self.jump_length].mean() -
+                               self._i[jump - self.jump_length:jump].mean()])
+            [self._t, self._i] = [self._t[jump:], self._i[jump:]]  # judge the stability on the new level only
+            if self.stop_on_jump:
+                self.reason = 'jump'
+                return self.reason
+        keep = max(self.window, 4 * self.jump_length)
+        [self._t, self._i] = [self._t[-keep:], self._i[-keep:]]
+        if self._stable():
+            self.reason = 'stable'
+        return self.reason
+
+    def _noise(self):
+        '''
+        :return: the standard deviation of the noise of single datapoints, from the differences of successive datapoints
+        '''
+        if self._i.size < 3:
+            return np.inf
+        differences = np.diff(self._i)
+        noise = _MAD_SCALE * np.median(np.abs(differences))
+        if noise == 0:  # mostly the same ADC value, the noise is that of the occasional step of the least significant bit
+            noise = np.sqrt(np.mean(differences * differences))
+        return noise / np.sqrt(2.)
+
+    def _find_jump(self, checked):
+        '''
+        :param checked: first position of the buffer that was not tested before
+        :return: the position in the buffer of the first jump, None if there is none
+        '''
+        length = self.jump_length
+        sums = np.concatenate(([0.], np.cumsum(self._i)))
+        positions = np.arange(max(checked, 2 * length), self._i.size - 2 * length + 1)
+        if not positions.size:
+            return None
+
+        def change(p):  # mean of the length datapoints from p on, minus that of the length datapoints before p
+            return (sums[p + length] - 2 * sums[p] + sums[p - length]) / length
+        step = change(positions) - (change(positions - length) + change(positions + length)) / 2.  # without drift
+        noise = self._noise() * np.sqrt(5. / length)  # the noise of step
+        if not noise > 0:
+            return None
+        jumps = np.nonzero(np.abs(step) > self.jump_threshold * noise)[0]
+        if not jumps.size:
+            return None
+        # the jump is where the step is largest, among the positions that exceed the threshold around the first one (a
+        # jump affects the step from 2 * length datapoints before it)
+        region = jumps[jumps < jumps[0] + 2 * length]
+        return int(positions[region[np.argmax(np.abs(step[region]))]])
+
+    def _stable(self):
+        if self.max_relative_std is None and self.max_drift is None and self.criterion is None:
+            return False
+        if self._i.size < self.window or self._t_last < self.min_time:
+            return False
+        statistics = self.statistics()
+        if self.max_relative_std is not None and not statistics['window_std'] <= \
+                self.max_relative_std * abs(statistics['window_mean']):
+            return False
+        if self.max_drift is not None and not abs(statistics['drift'] * (self._t[-1] - self._t[-self.window])) <= \
+                self.max_drift * abs(statistics['window_mean']):
+            return False
+        if self.criterion is not None and not self.criterion(statistics):
+            return False
+        return True
+
+    def statistics(self):
+        '''
+        :return: dictionary with the number of datapoints 'n', the 'mean' and 'std' of the whole trace, the
+            'window_mean', 'window_std' and 'drift' (slope in A/s) of the last window datapoints, the estimated 'noise'
+            of a datapoint, the 'jumps' and the 'reason' the trace ended
+        '''
+        [t, i] = [self._t[-self.window:], self._i[-self.window:]]
+        drift = np.nan
+        if i.size > 1:
+            dt = t - t.mean()
+            sxx = np.dot(dt, dt)
+            drift = np.dot(dt, i - i.mean()) / sxx if sxx > 0 else np.nan
+        return {'n': self._n,
+                'mean': self._mean,
+                'std': np.sqrt(self._m2 / (self._n - 1)) if self._n > 1 else np.nan,
+                'window_mean': i.mean() if i.size else np.nan,
+                'window_std': i.std(ddof=1) if i.size > 1 else np.nan,
+                'drift': drift,
+                'noise': self._noise(),
+                'jumps': list(self.jumps),
+                'reason': self.reason}
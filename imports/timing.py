@@ -0,0 +1,156 @@
+"""
+
+Timing of the phases of an experiment run (hardware, auto gain, fitting, saving, plotting, moving, ...)
+
+Usage:
+    from imports.timing import timing, span, timed
+
+    with span('fit'):  # times the block as the phase 'fit'
+        R = linear_fit_resistance(v, i)
+
+    @timed('adwin.sweep_linear')  # times every call of the function
+    def sweep_linear(self, ...):
+
+    timing.next_cycle()  # starts a new cycle within the current record (e.g. a burn cycle)
+    record = timing.record(device='a1', experiment='ADwin_IV')  # closes the record of a device (see Experiment.run)
+    print(timing.summary())  # ranks the phases by the time spent in them over the whole run
+
+    Spans may be nested. Every phase has a total time (including the phases inside it) and a self time (excluding
+    them), so the self times of all phases add up to the tracked wall clock time. Spans in other threads than the one
+    that imported this module (e.g. the saving worker of a Pipeline) run in the background and are named
+    '<name> (background)'. A record holds the phases since the previous record, so the movement to a device is part of
+    the record of the first experiment on that device.
+"""
+import time
+import threading
+import functools
+from contextlib import contextmanager
+
+_BACKGROUND = ' (background)'
+
+
+class Timing(object):
+    def __init__(self):
+        self.enabled = True
+        self.records = []
+        self._main = threading.current_thread()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''
+        forgets all records and starts timing the run from now
+        '''
+        with self._lock:
+            self.records = []
+            self._totals = {}  # phase: [calls, total time, self time] over the run
+            self._phases = {}  # the same, for the current record
+            self._cycles = []  # list of phase dictionaries, one per cycle of the current record
+            self._t_run = time.time()
+            self._t_record = self._t_run
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name):
+        '''
+        times the enclosed block as the phase name
+        '''
+        if not self.enabled:
+            yield
+            return
+        stack = self._stack()
+        stack.append(0.)  # time spent in nested spans
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            duration = time.time() - t0
+            nested = stack.pop()
+            if stack:
+                stack[-1] += duration
+            if threading.current_thread() is not self._main:
+                name += _BACKGROUND
+            self._add(name, duration, duration - nested)
+
+    def timed(self, name=None):
+        '''
+        decorator that times every call of the function as the phase name (the name of the function by default)
+        '''
+        def decorator(function):
+            phase = name if name is not None else function.__name__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(phase):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _add(self, name, total, own):
+        with self._lock:
+            phase_lists = [self._totals, self._phases]
+            if self._cycles:
+                phase_lists.append(self._cycles[-1])
+            for phases in phase_lists:
+                entry = phases.setdefault(name, [0, 0., 0.])
+                entry[0] += 1
+                entry[1] += total
+                entry[2] += own
+
+    def next_cycle(self):
+        '''
+        starts a new cycle in the current record, the phases of every cycle are also recorded separately
+        '''
+        with self._lock:
+            self._cycles.append({})
+
+    def record(self, **info):
+        '''
+        closes the current record
+
+        :param info: information to store with the record (e.g. device and experiment)
+        :return: the record, a dictionary with the info, the wall clock time in s ('wall'), the phases and the cycles.
+            A phase is a dictionary {'calls', 'total', 'self'} of the number of calls and the times in s.
+        '''
+        with self._lock:
+            now = time.time()
+            record = dict(info)
+            record['wall'] = now - self._t_record
+            record['phases'] = _phase_dict(self._phases)
+            record['cycles'] = [_phase_dict(phases) for phases in self._cycles]
+            self.records.append(record)
+            [self._phases, self._cycles, self._t_record] = [{}, [], now]
+        return record
+
+    def summary(self, top=20):
+        '''
+        :param top: number of phases to list
+        :return: text that ranks the phases by their self time over the run, the untracked time is the wall clock time
+            outside of all spans
+        '''
+        with self._lock:
+            wall = time.time() - self._t_run
+            phases = sorted(self._totals.items(), key=lambda item: -item[1][2])
+        tracked = sum(entry[2] for [name, entry] in phases if not name.endswith(_BACKGROUND))
+        lines = ['Timing summary: %.1f s wall clock, %d records' % (wall, len(self.records)),
+                 '%-40s %12s %7s %12s %8s' % ('phase', 'self [s]', '%', 'total [s]', 'calls')]
+        for [name, [calls, total, own]] in phases[:top]:
+            lines.append('%-40s %12.2f %7.1f %12.2f %8d' % (name, own, 100. * own / wall if wall else 0., total, calls))
+        untracked = wall - tracked
+        lines.append('%-40s %12.2f %7.1f' % ('untracked', untracked, 100. * untracked / wall if wall else 0.))
+        return '\n'.join(lines)
+
+
+def _phase_dict(phases):
+    return dict((name, {'calls': entry[0], 'total': entry[1], 'self': entry[2]}) for [name, entry] in phases.items())
+
+
+timing = Timing()
+span = timing.span
+timed = timing.timed
@@ -57,6 +57,11 @@ chip = Chip(name=name,template='2T.ini',ignore_hidden=False)
 
 # load the signal switch. Does signal switching automatically based on the name of the script file. Be careful: starting your scriptname with HP will make the signal switch to HP!
 signal_switch = SignalSwitch()  
+
+# uncomment to run the ADwin experiments on an emulated ADwin and FEMTO instead of the hardware (see adwin_emulator.py)
+#from imports.adwin_femto import ADwinFemto
+#from imports.adwin_emulator import ADwinEmulator, BurningJunction
+#ADwinFemto.use_emulator(ADwinEmulator(BurningJunction(), speed=10.))
     
 #chip.limit_range('a1-k18')  # use this to cut up a standard design chip into quarters
 
@@ -72,6 +77,9 @@ chip.load_devices('o21-w')
 # alternatively, load the devices from a csv file (given the same syntax as defined above)
 # chip.load_from_file('exp_devices.csv')
 
+# reorder the devices to minimise the travel of the probe station (instead of running them column by column)
+# chip.plan_route()
+
 # add experiments to the chip. The device ranges are treated as SQUARES. So: b3-c4 includes devices b3, b4, c3 and c4.
 chip.add_experiment("ADwin_resistance")  # the resistance script outputs a 'SKIP' if the resistance is too low or too high, in which case the other experiments are skipped
 chip.add_experiment("ADwin_electroburn",'a1-w37')
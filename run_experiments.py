@@ -2,6 +2,7 @@ if start_at_current_position:
     chip.start_at_device(current_dev, run_skipped_devices)  # sort the chip devices list to start at the current device (and either skip the devices or add them to the end of the list)
 
 # loop over all devices that were loaded by the user
+timing.reset()  # time the run from here (see the summary at the end)
 cont = True
 for dev in chip:
     # run the experiments that were loaded by the user
@@ -55,4 +56,7 @@ if return_to_start:
 #cascade.up()  # put the probes up, so that we see the measurement is completed.
 
 for experiment in chip.experiments:
-    experiment.end()
\ No newline at end of file
+    experiment.end()
+
+# rank where the time of the run went (the timing of every device is saved next to the experiment info file)
+print(timing.summary())
\ No newline at end of file
@@ -0,0 +1,56 @@
+"""
+
+Shared fixtures of the tests. The tests run without qtlab and without the hardware: the ADwin and the FEMTO are
+emulated (see adwin_emulator.py).
+
+Run from the main script directory:
+    python -m pytest tests
+"""
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if not ROOT in sys.path:
+    sys.path.insert(0, ROOT)
+
+from imports.adwin_emulator import ADwinEmulator, Resistor
+from imports.adwin_femto import ADwinFemto
+
+
+@pytest.fixture
+def root():
+    '''
+    runs the test in the main script directory (where the chip templates are)
+    '''
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    yield ROOT
+    os.chdir(cwd)
+
+
+def emulated(model=None, speed=None, **kwargs):
+    '''
+    :return: [emulator, instrument] of an ADwinFemto on an emulated ADwin and FEMTO
+    '''
+    emulator = ADwinEmulator(model if model is not None else Resistor(1e6), speed=speed, seed=1, **kwargs)
+    return [emulator, ADwinFemto(emulator=emulator)]
+
+
+@pytest.fixture
+def instrument():
+    '''
+    ADwinFemto on an emulated 1 MOhm resistor, as fast as possible
+    '''
+    yield emulated()[1]
+    ADwinFemto.use_emulator(None)
+
+
+@pytest.fixture
+def realtime():
+    '''
+    function(model=None, speed=1., **kwargs) that returns [emulator, instrument] of an emulated setup that runs in real
+    time, the kwargs are passed on to the ADwinEmulator
+    '''
+    yield lambda model=None, speed=1., **kwargs: emulated(model, speed, **kwargs)
+    ADwinFemto.use_emulator(None)
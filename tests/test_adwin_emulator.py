@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from imports.adwin_emulator import ADwinEmulator, Resistor, Short, TunnelJunction, BurningJunction
+from imports.adwin_femto import ADwinFemto, ADWIN_FLAG_OVERLOAD
+from conftest import emulated
+
+
+@pytest.fixture(autouse=True)
+def hardware():
+    yield
+    ADwinFemto.use_emulator(None)
+
+
+def test_sweep_of_a_resistor():
+    [emulator, instr] = emulated(Resistor(1e6))
+    instr.iv_gain = 7
+    [v, i, flags] = instr.sweep_linear(-0.4, 0.4, num_datapoints=100, time_per_scan=0.5, auto_gain=False)
+    assert len(v) == 100 and flags == 0
+    assert v[0] == pytest.approx(-0.4, abs=1e-3) and v[-1] == pytest.approx(0.4, abs=1e-3)
+    assert np.allclose(i, v / 1e6, rtol=0.01, atol=1e-9)
+    assert emulator.time == pytest.approx(0.5, rel=0.05)  # the emulated time follows the process timing
+
+
+def test_tunnel_junction_is_gated():
+    [emulator, instr] = emulated(TunnelJunction(R=1e6, v_barrier=0.5, gate_coupling=1.))
+    instr.iv_gain = 5
+    instr.write(0.4)
+    off = instr.read(auto_gain=False)
+    instr.write_gate(1.)
+    on = instr.read(auto_gain=False)
+    assert off == pytest.approx(0.4 / 1e6 * 1.64, rel=0.02)
+    assert on / off == pytest.approx(np.e, rel=0.02)
+
+
+def test_femto_overloads():
+    [_, instr] = emulated(Short(1e3))
+    instr.iv_gain = 9
+    [_, i, flags] = instr.sweep_linear(-0.4, 0.4, num_datapoints=20, auto_gain=False)
+    assert flags & ADWIN_FLAG_OVERLOAD
+    assert np.max(np.abs(i)) == pytest.approx(10. * 1e-9, rel=0.1)
+
+
+def test_auto_gain_finds_the_decade():
+    [_, instr] = emulated(Resistor(1e4))
+    instr.iv_gain = 9
+    [_, _, flags] = instr.sweep_linear(-0.4, 0.4, num_datapoints=20)  # overloads, then 40 mV at the lowest gain
+    assert flags == 0 and instr.iv_gain == 5
+
+
+def test_burning_junction_burns():
+    model = BurningJunction(R=2e3, seed=1)
+    [_, instr] = emulated(model)
+    instr.burn_gain = 3
+    for _ in range(5):
+        instr.eburn(max_voltage=3., v_rate_up=50.)
+        if model.R > 2e3:
+            break
+    assert model.R > 2e3
+
+
+def test_the_noise_is_seeded():
+    data = []
+    for _ in range(2):
+        [_, instr] = emulated(Resistor(1e9))
+        data.append(instr.sweep_linear(-0.4, 0.4, num_datapoints=20, auto_gain=False)[1])
+    assert np.array_equal(data[0], data[1])
@@ -0,0 +1,481 @@
+import sys
+import time
+import ctypes
+import numpy as np
+import pytest
+from imports.adwin_femto import ADwinFemto, ADWIN_FLAG_DATA_INCOMPLETE, ADWIN_FLAG_UNDERLOAD, ADWIN_FLAG_OVERLOAD, \
+    ADWIN_FLAG_NO_DATA, fit_burn_resistance, _range_reader, _digits_to_units, _peak_voltage, _load_flags, \
+    _predict_gain, TriangleSweep, _UNDERLOAD_THRESHOLD, _OVERLOAD_THRESHOLD
+
+
+class _Connection(object):
+    '''
+    connection of the ADwin python package, with a data array that holds its own 1-based index
+    '''
+    calls = []
+
+    def __init__(self, DeviceNo=1, raiseExceptions=1):
+        self.device = DeviceNo
+
+    def GetData_Long(self, DataNo, Startindex, Count):
+        _Connection.calls.append((DataNo, Startindex, Count))
+        return (ctypes.c_int32 * Count)(*range(Startindex, Startindex + Count))
+
+
+class _Package(object):
+    ADwin = _Connection
+
+
+class _WholeArrays(object):
+    '''
+    qt driver that only reads whole arrays
+    '''
+    def get(self, name):
+        return np.arange(100)
+
+
+def test_range_reader_prefers_the_instrument(instrument):
+    assert _range_reader(instrument._adwin) == instrument._adwin.get_data_range
+
+
+def test_range_reader_reads_the_window_with_getdata_long(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'ADwin', _Package)
+    _Connection.calls = []
+    data = _range_reader(_WholeArrays(), dev=1)(2, 10, 5)
+    assert _Connection.calls == [(2, 11, 5)]
+    assert data.tolist() == [11, 12, 13, 14, 15]
+
+
+def test_range_reader_without_the_package(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'ADwin', None)
+    assert _range_reader(_WholeArrays()) is None
+
+
+def test_get_array_transfers_only_the_window(instrument, monkeypatch):
+    instrument.sweep_linear(-0.4, 0.4, num_datapoints=50, auto_gain=False)
+    full = instrument._adwin.get('data1')[:50]
+    windows = []
+    read = ADwinFemto._read_range
+    monkeypatch.setattr(ADwinFemto, '_read_range', lambda index, start, count: windows.append(count) or
+                        read(index, start, count))
+    assert instrument._get_array(1, 10, 20).tolist() == full[10:20].tolist()
+    assert windows == [10]
+
+
+def test_get_array_falls_back_to_whole_arrays(instrument, monkeypatch):
+    instrument.sweep_linear(-0.4, 0.4, num_datapoints=50, auto_gain=False)
+    full = instrument._adwin.get('data1')
+    monkeypatch.setattr(ADwinFemto, '_read_range', None)
+    assert instrument._get_array(1, 10, 20).tolist() == full[10:20].tolist()
+    assert instrument._get_array(1, 20, 20).size == 0
+
+
+def test_stream_segments_join_in_time(instrument):
+    chunks = list(instrument.stream_current_time_trace(0.1, data_frequency=100, chunk_size=10, num_datapoints=60,
+                                                        segment_size=20))
+    t = np.concatenate([t for [t, _, _] in chunks])
+    assert t.size == 60
+    assert abs(t[0]) < 0.02
+    assert np.allclose(np.diff(t), 0.01, atol=0.005)
+
+
+def test_predict_gain_keeps_a_peak_in_the_window():
+    gains = list(range(3, 10))
+    for peak in [0.95, 3., 6., 9.9]:
+        assert _predict_gain(peak, 6, gains) == 6
+        assert _predict_gain(peak, 6, gains, overload_step=1) == 6
+
+
+def test_predict_gain_on_overload():
+    gains = list(range(3, 10))
+    assert _predict_gain(10.5, 6, gains) == 3
+    assert _predict_gain(10.5, 6, gains, overload_step=1) == 5
+    assert _predict_gain(10.5, 3, gains, overload_step=1) == 3
+
+
+def test_predict_gain_on_underload_leaves_headroom():
+    gains = list(range(3, 10))
+    for peak in [0.5, 0.09, 0.1, 0.04, 0.003]:
+        gain = _predict_gain(peak, 5, gains)
+        predicted = peak * 10 ** (gain - 5)
+        assert _UNDERLOAD_THRESHOLD <= predicted <= _OVERLOAD_THRESHOLD
+    assert _predict_gain(0.04, 5, gains) == 7  # 4 V rather than 9.9 V at gain 8
+    assert _predict_gain(0.001, 5, gains) == 8  # below the noise floor
+    assert _predict_gain(0.001, 8, gains) == 9  # clamped to the highest gain
+
+
+def _reads(instrument, amplitude):
+    '''
+    runs auto gain on a signal of amplitude (FEMTO output in V at gain 0)
+
+    :return: the gains that were measured at
+    '''
+    gains = []
+
+    def measure():
+        gains.append(instrument.iv_gain)
+        return [amplitude * 10 ** instrument.iv_gain, None]
+    instrument._auto_gain(measure)
+    return gains
+
+
+def test_auto_gain_verifies_once(instrument):
+    instrument.iv_gain = 9
+    assert _reads(instrument, 2e-9) == [9]
+    assert _reads(instrument, 1e-12) == [9]  # already at the highest gain
+    instrument.iv_gain = 3
+    assert _reads(instrument, 1e-12) == [3, 6]  # below the noise floor, the second read is not followed by another
+    instrument.iv_gain = 9
+    assert _reads(instrument, 1e-5) == [9, 3, 5]  # overload, lowest gain, prediction
+
+
+def test_cancelled_acquisition_returns_without_waiting_for_the_sweep(realtime):
+    [_, instr] = realtime()
+    acquisition = instr.sweep_linear(-0.4, 0.4, num_datapoints=100, time_per_scan=5., auto_gain=False,
+                                     wait_for_complete=False)
+    time.sleep(0.2)
+    t = time.time()
+    assert acquisition.cancel()
+    [v, i, flag] = acquisition.result()
+    assert time.time() - t < 1.
+    assert flag & ADWIN_FLAG_DATA_INCOMPLETE
+    assert 0 < len(v) < 100
+
+
+
+class _Opens(object):
+    '''
+    junction that opens abruptly after 60 ms, so that its current is only measurable on the ramp up of a burn
+    '''
+    def __init__(self):
+        self.t = 0.
+
+    def current(self, v, vg=0., dt=0.):
+        self.t += dt
+        return v / (2e5 if self.t < 0.06 else 1e9)
+
+
+def test_eburn_series_flags_cover_the_ramp_up(instrument):
+    emulator = ADwinFemto._emulator
+    for keep_data in [True, False]:
+        emulator.model = _Opens()
+        instrument.burn_gain = 6
+        cycle = next(instrument.eburn_series(max_voltage=1., keep_data=keep_data, max_cycles=1))
+        assert not cycle.flags & ADWIN_FLAG_UNDERLOAD
+        assert instrument.burn_gain == 6
+    assert len(cycle.v) < 1000  # only the ramp down was returned
+
+
+def test_eburn_series_reads_the_ramp_down_of_its_rate(instrument):
+    ADwinFemto._emulator.model = _Opens()
+    cycle = next(instrument.eburn_series(max_voltage=1., max_cycles=1, v_rate_down=100))
+    assert cycle.v[0] == pytest.approx(cycle.breakpoint) and cycle.v[-1] == pytest.approx(0., abs=0.01)
+    assert 500 < len(cycle.v) < 5100  # 1 V in steps of 2 mV, read back to at most 10 V
+
+
+def test_eburn_series_sets_wait_for_complete_itself(instrument):
+    with pytest.raises(TypeError):
+        next(instrument.eburn_series(wait_for_complete=False))
+
+
+class _Spike(object):
+    '''
+    high resistance with a narrow current peak around zero bias, which the coarse auto gain sweep steps over
+    '''
+    def current(self, v, vg=0., dt=0.):
+        return v / 1e9 + (1e-7 if abs(v) < 0.02 else 0.)
+
+
+def test_stability_diagram_steps_down_from_a_missed_overload(instrument):
+    ADwinFemto._emulator.model = _Spike()
+    instrument.iv_gain = 9
+    [v, i, flags] = instrument.stability_diagram([0., 0.1, 0.2], -0.45, 0.45, num_datapoints=100)
+    assert instrument.iv_gain == 7
+    assert not np.any(flags & ADWIN_FLAG_OVERLOAD)
+    assert np.max(i) == pytest.approx(1e-7, rel=0.05)
+
+
+def test_wait_completes_a_sweep(realtime):
+    [_, instr] = realtime()
+    instr.sweep_linear(-0.4, 0.4, num_datapoints=50, time_per_scan=0.3, auto_gain=False, wait_for_complete=False)
+    t = time.time()
+    assert instr.wait()
+    assert 0.2 < time.time() - t < 0.6
+    assert instr.get_data()[3] == 50
+
+
+def test_wait_paces_its_polls(realtime, monkeypatch):
+    [emulator, instr] = realtime()
+    polls = []
+    get = emulator.adwin.get
+    monkeypatch.setattr(emulator.adwin, 'get', lambda name, *args: polls.append(name) or get(name, *args))
+    instr.sweep_linear(-0.4, 0.4, num_datapoints=50, time_per_scan=0.5, auto_gain=False, wait_for_complete=False)
+    del polls[:]
+    instr.wait()
+    assert len(polls) < 40  # a busy loop polls thousands of times
+
+
+def test_wait_sleeps_until_the_expected_end(realtime, monkeypatch):
+    [emulator, instr] = realtime()
+    polls = []
+    get = emulator.adwin.get
+    monkeypatch.setattr(emulator.adwin, 'get', lambda name, *args: polls.append(name) or get(name, *args))
+    instr.sweep_linear(-0.4, 0.4, num_datapoints=50, time_per_scan=1., auto_gain=False, wait_for_complete=False)
+    del polls[:]
+    instr.wait()
+    assert polls.count('par30') < 15  # polling every _WAIT_SLICE during the sweep reads it 20 times
+
+
+def test_eburn_expects_the_ramp_up(instrument, monkeypatch):
+    durations = []
+    start = instrument._start_process
+    monkeypatch.setattr(instrument, '_start_process', lambda process, duration=0.: durations.append(duration) or
+                        start(process, duration))
+    instrument.eburn(max_voltage=3., v_rate_up=7.5)
+    assert durations == [pytest.approx(0.4)]
+
+
+def test_wait_timeout_stops_the_process(realtime):
+    [_, instr] = realtime()
+    instr.sweep_linear(-0.4, 0.4, num_datapoints=50, time_per_scan=5., auto_gain=False, wait_for_complete=False)
+    t = time.time()
+    assert not instr.wait(timeout=0.2)
+    assert time.time() - t < 1.
+    assert not instr.is_busy()
+
+
+def test_cancel_hook_stops_a_blocking_call(realtime):
+    [_, instr] = realtime()
+    t = time.time()
+    instr.cancel_hook = lambda: time.time() - t > 0.2
+    [v, i, flag] = instr.sweep_linear(-0.4, 0.4, num_datapoints=50, time_per_scan=5., auto_gain=False)
+    assert time.time() - t < 1.
+    assert flag & ADWIN_FLAG_DATA_INCOMPLETE
+
+
+def _record(monkeypatch, instrument, name):
+    '''
+    records the calls of instrument.name
+    '''
+    calls = []
+    function = getattr(instrument, name)
+
+    def recorded(*args, **kwargs):
+        calls.append(args)
+        return function(*args, **kwargs)
+    monkeypatch.setattr(instrument, name, recorded)
+    return calls
+
+
+def test_only_changed_parameters_are_uploaded(instrument, monkeypatch):
+    uploads = _record(monkeypatch, instrument._adwin, 'set')
+    instrument.sweep_linear(-0.4, 0.4, num_datapoints=50, auto_gain=False)
+    first = sum(len(args[0]) for args in uploads if isinstance(args[0], dict))
+    del uploads[:]
+    instrument.sweep_linear(-0.4, 0.4, num_datapoints=50, auto_gain=False)
+    assert sum(len(args[0]) for args in uploads if isinstance(args[0], dict)) < first
+    del uploads[:]
+    instrument.sweep_linear(-0.4, 0.3, num_datapoints=50, auto_gain=False)
+    changed = set(name for args in uploads if isinstance(args[0], dict) for name in args[0])
+    assert 'par24' in changed and not 'par23' in changed
+
+
+def test_invalidated_parameters_are_uploaded_again(instrument, monkeypatch):
+    instrument.sweep_linear(-0.4, 0.4, num_datapoints=50, auto_gain=False)
+    uploads = _record(monkeypatch, instrument._adwin, 'set')
+    instrument.invalidate_parameters()
+    instrument.sweep_linear(-0.4, 0.4, num_datapoints=50, auto_gain=False)
+    changed = set(name for args in uploads if isinstance(args[0], dict) for name in args[0])
+    assert set(['par23', 'par24', 'par26']) <= changed
+
+
+def test_digits_to_units():
+    digits = np.array([0, 32768, 65535], dtype=np.int32)
+    assert np.allclose(_digits_to_units(digits), [-10., 20. * 32768 / 65535 - 10., 10.])
+    assert np.allclose(_digits_to_units(digits, 9), _digits_to_units(digits) * 1e-9)
+    out = np.zeros(3)
+    assert _digits_to_units(digits, 3, out=out) is out
+
+
+def test_load_flags():
+    volts = lambda v: np.array([int(65535 / 20. * (x + 10.)) for x in v], dtype=np.int32)
+    assert _load_flags(volts([0.1, -0.5])) == ADWIN_FLAG_UNDERLOAD
+    assert _load_flags(volts([0.1, -5.])) == 0
+    assert _load_flags(volts([0.1, 10.])) == ADWIN_FLAG_OVERLOAD
+    assert _load_flags(np.array([], dtype=np.int32)) == ADWIN_FLAG_NO_DATA
+    assert _peak_voltage(volts([0.1, -5.])) == pytest.approx(5., abs=1e-3)
+
+
+def test_gain_is_only_sent_when_it_changes(instrument, monkeypatch):
+    writes = _record(monkeypatch, instrument._femto, 'set')
+    instrument.set_gain(6)
+    instrument.set_gain(6)
+    instrument.sweep_linear(-0.4, 0.4, num_datapoints=50, auto_gain=False)  # at iv_gain 9
+    instrument.sweep_linear(-0.4, 0.4, num_datapoints=50, auto_gain=False)
+    assert writes == [('gain', 'L6'), ('gain', 'L9')]
+    instrument.invalidate_gain()
+    instrument.set_gain(9)
+    assert writes[-1] == ('gain', 'L9') and len(writes) == 3
+
+
+def _burn_cycle(R_up, R_down, noise=0.):
+    '''
+    burn cycle that ramps up to 1 V through R_up and down to 0 V through R_down
+    '''
+    random = np.random.RandomState(1)
+    v = np.concatenate([np.linspace(0., 1., 200), np.linspace(1., 0., 20)])
+    i = np.concatenate([v[:200] / R_up, v[200:] / R_down]) + random.normal(0, noise, v.size)
+    return [v, i]
+
+
+def test_fit_burn_resistance_of_either_segment():
+    [v, i] = _burn_cycle(1e3, 1e5)
+    assert fit_burn_resistance(v, i)[0] == pytest.approx(1e5)
+    assert fit_burn_resistance(v, i, segment='up')[0] == pytest.approx(1e3)
+    assert fit_burn_resistance(v, i)[1] < 1e-6
+
+
+def test_fit_burn_resistance_error_grows_with_the_noise():
+    [v, i] = _burn_cycle(1e3, 1e7, noise=1e-9)
+    [R, R_error] = fit_burn_resistance(v, i)
+    assert R == pytest.approx(1e7, rel=5 * R_error)
+    assert 1e-3 < R_error < 0.2
+
+
+def test_fit_burn_resistance_without_enough_datapoints():
+    assert np.isnan(fit_burn_resistance([0., 1., 0.], [0., 1., 0.])[0])
+    [v, i] = _burn_cycle(1e3, 1e5)
+    [R, R_error] = fit_burn_resistance(v, i, v_window=0.05)  # only the last datapoint of the ramp down is below 50 mV
+    assert np.isnan(R) and R_error == np.inf
+
+
+def test_ramp_takes_the_time_of_its_rate(realtime):
+    [emulator, instr] = realtime(speed=10.)
+    t = time.time()
+    assert instr.ramp(2., rate=5.)
+    assert emulator.dac[instr._gate_channel] == pytest.approx(2., abs=1e-3)
+    assert emulator.time == pytest.approx(0.4, rel=0.1)
+    assert 0.03 < time.time() - t < 0.3  # 0.4 s at ten times real time
+    t_emulated = emulator.time
+    assert instr.ramp(2., rate=5.)  # already there, nothing is sent
+    assert emulator.time == t_emulated
+
+
+def test_ramp_from_the_last_written_voltage(instrument):
+    emulator = ADwinFemto._emulator
+    instrument.write(-1., electrode='source')
+    instrument.ramp(1., rate=100., electrode='source')
+    assert instrument.get_data()[0][0] == pytest.approx(-1., abs=1e-3)
+    assert emulator.dac[instrument._output_channel] == pytest.approx(1., abs=1e-3)
+
+
+def test_stopped_ramp_continues_where_it_stopped(realtime):
+    [emulator, instr] = realtime()
+    t = time.time()
+    instr.cancel_hook = lambda: time.time() - t > 0.1
+    assert not instr.ramp(5., rate=1.)
+    v_stopped = emulator.dac[instr._gate_channel]
+    assert 0. < v_stopped < 5.
+    instr.cancel_hook = None
+    assert instr.ramp(v_stopped + 0.05, rate=10.)
+    assert instr.get_data()[0][0] == pytest.approx(v_stopped, abs=1e-3)
+
+
+def test_cancelled_sweep_does_not_claim_its_end_voltage(realtime):
+    [emulator, instr] = realtime()
+    acquisition = instr.sweep_linear(-1., 1., num_datapoints=100, time_per_scan=2., auto_gain=False,
+                                     wait_for_complete=False)
+    time.sleep(0.2)
+    acquisition.cancel()
+    acquisition.result()
+    assert instr._output(instr._output_channel) == pytest.approx(emulator.dac[instr._output_channel], abs=1e-3)
+
+
+def test_ramp_refuses_an_unknown_output(realtime):
+    [emulator, instr] = realtime()
+    acquisition = instr.sweep_triangle(-1., 1., num_datapoints=100, cycle_frequency=0.5, auto_gain=False,
+                                       wait_for_complete=False)
+    time.sleep(0.2)
+    acquisition.cancel()
+    acquisition.result()
+    assert not instr.ramp(0., rate=10., electrode='source')
+    v_stopped = emulator.dac[instr._output_channel]
+    assert instr.ramp(0., rate=10., electrode='source', v_start=v_stopped)
+    assert instr._output(instr._output_channel) == 0.
+
+
+def test_ramp_rate_should_be_positive(instrument):
+    assert not instrument.ramp(1., rate=0.)
+    assert not instrument.ramp(1., rate=-1.)
+
+
+def _triangle(num_cycles, hysteresis=0.):
+    '''
+    cycles 0 -> 1 -> -1 -> 0 V of 40 datapoints through 1 kOhm, with the current of the forward sweep lowered
+    '''
+    v_cycle = np.concatenate([np.linspace(0, 1, 10, endpoint=False), np.linspace(1, -1, 20, endpoint=False),
+                              np.linspace(-1, 0, 10, endpoint=False)])
+    forward = np.gradient(v_cycle) > 0
+    i_cycle = v_cycle / 1e3 - hysteresis * forward
+    return [np.tile(v_cycle, num_cycles), np.tile(i_cycle, num_cycles) * np.repeat(np.arange(1., num_cycles + 1), 40)]
+
+
+def test_triangle_sweep_cycles_are_views():
+    [v, i] = _triangle(3)
+    sweep = TriangleSweep([v[:100], i[:100], 0], 40)  # a stopped sweep, halfway the third cycle
+    assert sweep.num_cycles == 2
+    assert sweep.i_cycles.shape == (2, 40)
+    assert np.shares_memory(sweep.i_cycles, sweep[1])
+    assert np.allclose(sweep.mean()[1], sweep.i_cycles[0] * 1.5)
+    assert np.allclose(sweep.std(), np.abs(sweep.i_cycles[0]) * 0.5)
+    [v, i, flags] = sweep  # still unpacks like the result of the blocking call
+    assert flags == 0
+
+
+def test_triangle_sweep_statistics():
+    [v, i] = _triangle(2, hysteresis=1e-5)
+    sweep = TriangleSweep([v, i, 0], 40)
+    assert np.all(sweep.hysteresis_area() > 0)
+    assert sweep.hysteresis_area()[1] == pytest.approx(2 * sweep.hysteresis_area()[0])
+    [v, i] = _triangle(2)
+    assert TriangleSweep([v, i, 0], 40).resistance()[0] == pytest.approx([1e3, 5e2])
+
+
+def test_sweep_triangle_returns_the_cycles(instrument):
+    instrument.iv_gain = 7
+    sweep = instrument.sweep_triangle(-0.4, 0.4, num_datapoints=40, num_cycles=3, auto_gain=False)
+    assert sweep.num_cycles == 3
+    assert sweep.resistance()[0] == pytest.approx([1e6] * 3, rel=0.01)
+
+
+def test_acquisition_reads_partial_data(realtime):
+    [_, instr] = realtime()
+    acquisition = instr.sweep_linear(-0.4, 0.4, num_datapoints=100, time_per_scan=0.5, auto_gain=False,
+                                     wait_for_complete=False)
+    time.sleep(0.2)
+    assert not acquisition.done()
+    [v, _, flag, count] = acquisition.partial()
+    assert 0 < count < 100 and len(v) == count and flag & ADWIN_FLAG_DATA_INCOMPLETE
+    [v, i, flag] = acquisition.result()
+    assert acquisition.done() and len(v) == 100 and not flag & ADWIN_FLAG_DATA_INCOMPLETE
+    assert acquisition.partial(count)[0].tolist() == v[count:].tolist()
+
+
+def test_acquisition_of_overwritten_data(instrument):
+    first = instrument.sweep_linear(-0.4, 0.4, num_datapoints=50, auto_gain=False, wait_for_complete=False)
+    instrument.sweep_linear(-0.4, 0.4, num_datapoints=50, auto_gain=False)
+    assert first.done()
+    assert first.result()[2] & ADWIN_FLAG_NO_DATA
+
+
+def test_acquisition_can_be_awaited(instrument):
+    asyncio = pytest.importorskip('asyncio')
+    acquisition = instrument.sweep_linear(-0.4, 0.4, num_datapoints=50, auto_gain=False, wait_for_complete=False)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        [v, i, flag] = loop.run_until_complete(acquisition.wait_async())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    assert len(v) == 50
@@ -0,0 +1,82 @@
+import os
+import time
+import pytest
+from imports.adwin_processes import ProcessManager, MARKER_PAR
+
+
+class _ADwin(object):
+    '''
+    ADwin that compiles a source into a .TB1 file next to it
+    '''
+    def __init__(self):
+        self.par = {}
+        self.compiled = []
+        self.loaded = []
+
+    def get(self, name):
+        return self.par.get(name, 0)
+
+    def set(self, name, value):
+        self.par[name] = value
+
+    def compile_process(self, path, process=1, **settings):
+        self.compiled.append(process)
+        binary = os.path.splitext(path)[0] + '.TB%d' % process
+        with open(path) as source, open(binary, 'w') as f:
+            f.write(source.read())
+        return binary
+
+    def load_process(self, binary):
+        self.loaded.append(os.path.basename(binary))
+
+    def reboot(self):
+        self.par = {}
+
+
+@pytest.fixture
+def sources(tmpdir):
+    tmpdir.join('DAC.bas').write('dac')
+    tmpdir.join('ADC.bas').write('adc')
+    return [str(tmpdir), {1: 'DAC.bas', 2: 'ADC.bas'}]
+
+
+def test_processes_are_loaded_once_when_needed(sources):
+    adwin = _ADwin()
+    processes = ProcessManager(adwin, sources[1], source_dir=sources[0])
+    processes.require(1)
+    processes.require(1)
+    assert adwin.compiled == [1] and len(adwin.loaded) == 1
+    processes.require(2)
+    assert adwin.compiled == [1, 2]
+    assert adwin.get(MARKER_PAR) != 0
+
+
+def test_the_next_session_finds_the_processes_resident(sources):
+    adwin = _ADwin()
+    ProcessManager(adwin, sources[1], source_dir=sources[0]).require(1)
+    processes = ProcessManager(adwin, sources[1], source_dir=sources[0])
+    assert processes.verify()
+    processes.require(1)
+    assert adwin.compiled == [1] and len(adwin.loaded) == 1
+
+
+def test_a_reboot_loads_the_cached_binary(sources):
+    adwin = _ADwin()
+    ProcessManager(adwin, sources[1], source_dir=sources[0]).require(1)
+    adwin.reboot()
+    processes = ProcessManager(adwin, sources[1], source_dir=sources[0])
+    assert not processes.verify()
+    processes.require(1)
+    assert adwin.compiled == [1] and len(adwin.loaded) == 2
+    assert os.path.dirname(processes._cached(1, processes.key(1))).endswith('compiled')
+
+
+def test_a_changed_source_is_compiled_again(sources, tmpdir):
+    adwin = _ADwin()
+    processes = ProcessManager(adwin, sources[1], source_dir=sources[0])
+    processes.require(1)
+    source = tmpdir.join('DAC.bas')
+    source.write('dac, changed')
+    os.utime(str(source), (time.time() + 10, time.time() + 10))
+    processes.require(1)
+    assert adwin.compiled == [1, 1] and len(adwin.loaded) == 2
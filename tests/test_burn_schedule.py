@@ -0,0 +1,49 @@
+import pytest
+from imports.adwin_femto import BurnCycle, increase_breakpoint, ADWIN_FLAG_BURN_FEEDBACK, \
+    ADWIN_FLAG_BURN_BREAKPOINT_V, ADWIN_FLAG_BURN_OHMIC
+from imports.burn_schedule import BurnScheduler
+
+
+def _cycle(breakpoint, flags):
+    return BurnCycle(1, breakpoint, 1e3, 0.01, 4, flags, [[], []], [None, None], 0)
+
+
+def _burn_device(scheduler, cycles):
+    scheduler.start_device()
+    for [breakpoint, flags] in cycles:
+        scheduler.observe(_cycle(breakpoint, flags))
+    scheduler.end_device()
+
+
+def test_fixed_rules_until_enough_devices():
+    scheduler = BurnScheduler()
+    _burn_device(scheduler, [(2., ADWIN_FLAG_BURN_FEEDBACK)])
+    assert scheduler.initial_voltage(10.) == 10.
+    assert scheduler.increase(2.) == increase_breakpoint(2.)
+
+
+def test_first_voltage_is_seeded_from_the_burned_devices():
+    scheduler = BurnScheduler(min_devices=3, seed_quantile=1., seed_margin=1.1)
+    for v in [2., 2.5, 3.]:
+        _burn_device(scheduler, [(10., ADWIN_FLAG_BURN_OHMIC), (v, ADWIN_FLAG_BURN_FEEDBACK),
+                                 (1., ADWIN_FLAG_BURN_FEEDBACK)])
+    assert scheduler.first_breakpoints == [2., 2.5, 3.]  # failed cycles are ignored, later cycles are not the first
+    assert scheduler.initial_voltage(10.) == pytest.approx(3.3)
+    assert scheduler.cycles == [3, 3, 3]
+
+
+def test_increase_is_learned_from_untriggered_cycles():
+    scheduler = BurnScheduler(min_increases=2, increase_quantile=1., max_increase=1.5)
+    for _ in range(2):
+        _burn_device(scheduler, [(1., ADWIN_FLAG_BURN_BREAKPOINT_V), (1.1, ADWIN_FLAG_BURN_BREAKPOINT_V),
+                                 (1.4, ADWIN_FLAG_BURN_FEEDBACK)])
+    assert scheduler.increases == [1.4, 1.4]  # relative to the first untriggered cycle
+    assert scheduler.increase(1.) == pytest.approx(1.4)
+    assert scheduler.increase(9.) == 10.  # within the output range
+
+
+def test_statistics_survive_a_restart(tmpdir):
+    filename = str(tmpdir.join('schedule.json'))
+    scheduler = BurnScheduler(filename)
+    _burn_device(scheduler, [(2., ADWIN_FLAG_BURN_FEEDBACK)])
+    assert BurnScheduler(filename).first_breakpoints == [2.]
@@ -0,0 +1,120 @@
+import pickle
+import numpy as np
+import pytest
+from imports.chip import Chip, DeviceSet
+
+
+@pytest.fixture
+def chip(root):
+    return Chip('test', template='2T.ini')
+
+
+def test_device_set_keeps_the_order_and_the_repeats():
+    devices = DeviceSet(['a3', 'a1', 'a3', 'a2'])
+    assert list(devices) == ['a3', 'a1', 'a2']
+    assert devices.devices == ('a3', 'a1', 'a3', 'a2')
+    assert devices == frozenset(['a1', 'a2', 'a3'])
+    assert pickle.loads(pickle.dumps(devices)).devices == devices.devices
+
+
+def test_device_set_operations_keep_the_order_of_the_left_set():
+    devices = DeviceSet(['b1', 'a1', 'c1'])
+    assert (devices | ['d1', 'a1']).devices == ('b1', 'a1', 'c1', 'd1')
+    assert (devices & set(['c1', 'b1'])).devices == ('b1', 'c1')
+    assert (devices - ['a1']).devices == ('b1', 'c1')
+
+
+def test_device_set_operations_take_a_single_device():
+    devices = DeviceSet(['b1', 'a1'])
+    assert (devices | 'c1').devices == ('b1', 'a1', 'c1')
+    assert (devices & 'a1').devices == ('a1',)
+    assert (devices - u'a1').devices == ('b1',)
+
+
+def test_device_ranges_are_cached_until_the_chip_changes(chip):
+    columns = chip.device_range('a-b')
+    assert chip.device_range('a-b') is columns
+    assert len(columns) == 2 * 37 and not 'a38' in columns
+    assert chip.device_range('a36-b2').devices == ('a36', 'a37', 'b1', 'b2')
+    assert list(chip.device_square('a1-b2')) == ['a1', 'a2', 'b1', 'b2']
+    chip.limit_range('a1-c37')
+    assert chip.device_range('a-b') is not columns
+
+
+def test_load_devices_accepts_a_device_set(chip):
+    chip.load_devices(chip.device_range('a-e') - chip.device_square('b10-d20'))
+    assert len(chip.devices) == 5 * 37 - 3 * 11
+    assert not 'c15' in chip.devices and 'e15' in chip.devices
+
+
+def test_template_marks_test_devices(root, tmpdir):
+    template = tmpdir.join('chip.ini')
+    template.write('a1-c3, (0, 0), (100, 50)\ntest d1-d3, (300, 0), (100, 50)\nhidden a4-d4, (0, 150), (100, 50)\n')
+    for ignore_hidden in [True, False]:
+        chip = Chip('test')
+        chip.load_template(str(template), ignore_hidden=ignore_hidden)
+        layout = chip.layout
+        test = [layout.names[k] for k in range(len(layout)) if layout.test[k]]
+        assert sorted(test) == ['d1', 'd2', 'd3']
+        assert layout.hidden[layout.index['d1']] == ignore_hidden  # test devices are hidden from the device ranges
+        assert ('a4' in chip.device_range('a')) != ignore_hidden
+
+
+def test_layout_positions(chip):
+    assert chip.get_device_position('b3') == (400., 400.)
+    assert chip.get_device_position('z1') == (-1, -1)
+    assert chip.get_device_positions(['a1', 'z1', 'c38']).tolist() == [[0., 0.], [-1., -1.], [800., 7400.]]
+    assert chip.get_devices_in_box((850, 7500), (350, 7100)) == ['b37', 'b38', 'c37', 'c38']
+    assert chip.get_devices_in_box((850, 7500), (350, 7100), include_hidden=False) == ['b37', 'c37']
+
+
+def test_transform_moves_every_device(chip):
+    chip.transform(offset=(10, 20), angle=90., scale=2.)
+    assert chip.get_device_position('b1') == pytest.approx((10., 820.))
+    assert chip.get_device_position('a2') == pytest.approx((-390., 20.))
+
+
+def test_plan_route_serpentine_on_a_grid(chip):
+    chip.load_devices('a1-3,b1-3,c1-3,b2,a1-3,b1-3,c1-3')  # devices listed more than once are measured that often
+    [before, after] = chip.plan_route()
+    assert after < before
+    assert chip.devices[:2] == ['a1', 'a1']
+    assert sorted(chip.devices) == sorted(['a1', 'a2', 'a3', 'b1', 'b2', 'b3', 'c1', 'c2', 'c3'] * 2 + ['b2'])
+    route = [dev for [k, dev] in enumerate(chip.devices) if k == 0 or dev != chip.devices[k - 1]]
+    assert route == ['a1', 'a2', 'a3', 'b3', 'b2', 'b1', 'c1', 'c2', 'c3']  # the rows are 200 apart, the columns 400
+
+
+def test_plan_route_of_scattered_devices(root):
+    chip = Chip('test')
+    random = np.random.RandomState(1)
+    for [k, [x, y]] in enumerate(random.uniform(0, 1000, (40, 2))):
+        chip.define_devices('a%d-a%d' % (k + 1, k + 1), position=(x, y))
+    chip.load_devices('a')
+    chip.start_at_device('a7', True)
+    [before, after] = chip.plan_route(start='a7')
+    assert chip.devices[0] == 'a7'
+    assert len(set(chip.devices)) == 40
+    assert after < 0.5 * before
+
+
+def test_nearest_devices_match_a_full_search(root):
+    chip = Chip('test', template='Thermo01.ini')
+    names = list(chip.layout.names)
+    xy = np.column_stack((chip.layout.x, chip.layout.y))
+    random = np.random.RandomState(1)
+    low = xy.min(axis=0) - 2000
+    high = xy.max(axis=0) + 2000
+    for point in random.uniform(low, high, (200, 2)):
+        distance = np.hypot(*(xy - point).T)
+        nearest = chip.get_nearest_devices(point, 3)
+        assert [d for [_, d] in nearest] == pytest.approx(np.sort(distance)[:3].tolist())
+        assert nearest[0][0] == names[int(np.argmin(distance))] or nearest[0][1] == nearest[1][1]
+
+
+def test_device_from_position(chip):
+    assert chip.get_device_from_position((400., 400.)) == 'b3'
+    assert chip.get_device_from_position((400.5, 400.)) == 'b3'
+    assert chip.get_device_from_position((410., 400.)) == ''
+    assert chip.get_device_from_position((410., 400.), tolerance=20.) == 'b3'
+    chip.transform(offset=(5, 0))
+    assert chip.get_device_from_position((405., 400.)) == 'b3'
@@ -0,0 +1,67 @@
+import time
+import numpy as np
+from imports.coacquisition import align_to_sweep, hp_gate_trace
+
+
+class _HP(object):
+    '''
+    HP that sweeps the gate in real time, 0 -> v_max -> 0 -> v_min -> 0 like HP.sweep_triangle
+    '''
+    def __init__(self, dwell=0.02):
+        self.dwell = dwell
+        self.vg = 0.
+
+    def sweep_triangle(self, v_min, v_max, v_step, electrode='gate', source=0.):
+        up = np.arange(0., v_max + v_step / 2., v_step)
+        down = np.arange(0., v_min - v_step / 2., -v_step)
+        v_sweep = np.concatenate([up, up[::-1], down, down[::-1]])
+        for self.vg in v_sweep:
+            time.sleep(self.dwell)
+        self.vg = 0.
+        return [v_sweep, np.zeros(v_sweep.size)]
+
+
+class _GatedResistor(object):
+    def __init__(self, hp):
+        self.hp = hp
+
+    def current(self, v, vg=0., dt=0.):
+        return v / 1e6 * (1 + self.hp.vg / 10.)
+
+
+def test_align_to_sweep_decimates_a_trace():
+    v_sweep = np.array([0., 1., 2., 2., 1., 0.])
+    vg = np.concatenate([np.zeros(20), np.repeat(v_sweep[1:], 10)])
+    t = np.arange(vg.size) * 0.1
+    [v, i, t_step] = align_to_sweep(t, vg, 2 * vg, v_sweep)
+    assert np.allclose(v, v_sweep)
+    assert np.allclose(i, 2 * v_sweep)
+    assert np.all(np.diff(t_step[1:3]) > 0)
+
+
+def test_align_to_sweep_without_a_sweep():
+    assert align_to_sweep(np.arange(50.), np.zeros(50), np.zeros(50), [0., 1., 2.]) is None
+
+
+def test_hp_gate_trace_stops_the_trace_with_the_sweep(realtime):
+    hp = _HP()
+    [_, adwin] = realtime(_GatedResistor(hp), aux=lambda channel, t: hp.vg / 10.)
+    t0 = time.time()
+    [vg, i, t, flags] = hp_gate_trace(adwin, hp, v_min=-2., v_max=2., v_step=0.5, bias=0.2, data_frequency=500,
+                                      num_average=10)
+    assert time.time() - t0 < 1.5  # the sweep takes 0.4 s, the trace is armed for an hour
+    assert not adwin.is_busy()
+    assert len(vg) == 20
+    assert np.allclose(i, 0.2 / 1e6 * (1 + np.asarray(vg) / 10.), rtol=0.05)
+
+
+def test_wait_returns_soon_after_a_stop(realtime):
+    [_, adwin] = realtime()
+    adwin.current_time_trace(0.1, data_frequency=20, num_datapoints=100, wait_for_complete=False)
+    time.sleep(0.2)
+    t0 = time.time()
+    adwin.stop()
+    adwin.wait()
+    assert time.time() - t0 < 0.5
+    assert not adwin.is_busy()
+    assert adwin.get_data()[3] < 100
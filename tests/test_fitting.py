@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from imports.fitting import fit_resistance, fit_resistance_robust
+
+
+def _traces(R, n_points=50, noise=0., seed=1):
+    random = np.random.RandomState(seed)
+    v = np.tile(np.linspace(-0.4, 0.4, n_points), (len(R), 1))
+    i = v / np.asarray(R, dtype=float)[:, None] + 1e-9 + random.normal(0, noise, v.shape)
+    return [v, i]
+
+
+def test_single_trace_matches_least_squares():
+    [v, i] = _traces([1e6], noise=1e-9)
+    [R, I0, r2, R_error] = fit_resistance(v[0], i[0])
+    [slope, intercept] = np.polyfit(v[0], i[0], 1)
+    assert isinstance(R, float)
+    assert R == pytest.approx(1. / slope)
+    assert I0 == pytest.approx(intercept)
+    assert 0.99 < r2 <= 1.
+    assert 0 < R_error < 0.01 * R
+
+
+def test_batch_equals_the_fits_of_the_single_traces():
+    [v, i] = _traces([1e3, 1e6, 1e9], noise=1e-12)
+    [R, I0, r2, R_error] = fit_resistance(v, i)
+    assert R.shape == (3,)
+    for k in range(3):
+        assert [R[k], I0[k], r2[k], R_error[k]] == pytest.approx(fit_resistance(v[k], i[k]))
+
+
+def test_nan_padding_and_window():
+    [v, i] = _traces([1e6, 2e6])
+    v[1, 25:] = np.nan
+    i[1, 25:] = np.nan
+    assert fit_resistance(v, i)[0] == pytest.approx([1e6, 2e6])
+    i[0, np.abs(v[0]) > 0.1] = 1.  # far off, but outside the window
+    assert fit_resistance(v[0], i[0], v_window=0.1)[0] == pytest.approx(1e6)
+
+
+def test_degenerate_traces():
+    [R, _, _, R_error] = fit_resistance(np.array([[0.1, 0.2], [0.1, 0.1]]), np.array([[1., 2.], [1., 1.]]))
+    assert np.all(np.isnan(R)) and np.all(R_error == np.inf)
+    assert np.isnan(fit_resistance(np.linspace(-1, 1, 10), np.zeros(10))[0])
+
+
+def test_robust_fit_ignores_spikes():
+    [v, i] = _traces([1e6, 1e6], noise=1e-10)
+    i[:, [5, 20, 33]] += 5e-7
+    assert fit_resistance(v, i)[0][0] != pytest.approx(1e6, rel=0.01)
+    assert fit_resistance_robust(v, i)[0] == pytest.approx([1e6, 1e6], rel=0.01)
+    [v, i] = _traces([1e6])
+    assert fit_resistance_robust(v[0], i[0])[0] == pytest.approx(1e6)  # without noise
@@ -0,0 +1,49 @@
+import threading
+import pytest
+from imports.pipeline import Pipeline
+
+
+class _Data(object):
+    def __init__(self):
+        self.rows = []
+        self.plots = []
+
+    def fill(self, row):
+        self.rows.append(row)
+
+    def plot(self):
+        self.plots.append([threading.current_thread(), len(self.rows)])
+
+
+def test_jobs_run_in_order_on_the_worker():
+    data = _Data()
+    threads = []
+    with Pipeline(max_pending=2) as pipeline:
+        for n in range(10):
+            pipeline.submit(data.fill, n)
+        pipeline.submit(lambda: threads.append(threading.current_thread()))
+    assert data.rows == list(range(10))
+    assert threads[0] is not threading.current_thread()
+
+
+def test_plots_run_on_the_calling_thread_after_the_saves():
+    data = _Data()
+    with Pipeline() as pipeline:
+        for n in range(5):
+            pipeline.submit(data.fill, n)
+            pipeline.plot(data)
+        pipeline.flush()
+        assert data.plots[-1][1] == 5
+    assert data.plots
+    assert all(thread is threading.current_thread() for [thread, _] in data.plots)
+    assert all(rows >= 1 for [_, rows] in data.plots)
+
+
+def test_errors_are_raised_in_the_loop():
+    def fail():
+        raise ValueError('disk full')
+    pipeline = Pipeline()
+    pipeline.submit(fail)
+    with pytest.raises(ValueError):
+        pipeline.flush()
+    pipeline.close()
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from imports.stability import StabilityMonitor
+
+
+def _feed(monitor, t, i, chunk=25):
+    '''
+    :return: the index of the datapoint after the chunk at which the monitor ended the trace, None if it did not
+    '''
+    for start in range(0, t.size, chunk):
+        if monitor.update(t[start:start + chunk], i[start:start + chunk]) is not None:
+            return start + chunk
+    return None
+
+
+def _trace(n=2000, noise=1e-12, seed=1):
+    t = np.arange(n) * 0.01
+    return [t, 1e-9 + np.random.RandomState(seed).normal(0, noise, n)]
+
+
+def test_statistics_of_the_whole_trace_merge_the_chunks():
+    [t, i] = _trace(500)
+    monitor = StabilityMonitor(window=100)
+    assert _feed(monitor, t, i, chunk=37) is None
+    statistics = monitor.statistics()
+    assert statistics['n'] == 500
+    assert statistics['mean'] == pytest.approx(i.mean())
+    assert statistics['std'] == pytest.approx(i.std(ddof=1))
+    assert statistics['window_mean'] == pytest.approx(i[-100:].mean())
+    assert statistics['noise'] == pytest.approx(1e-12, rel=0.2)
+
+
+def test_stable_after_a_settling_current():
+    [t, i] = _trace()
+    i += 1e-9 * np.exp(-t / 2.)  # settles in a few seconds
+    monitor = StabilityMonitor(window=200, max_relative_std=0.01, max_drift=0.01)
+    end = _feed(monitor, t, i)
+    assert monitor.reason == 'stable'
+    assert 300 < end < 2000
+    assert StabilityMonitor(window=200, max_relative_std=0.01, min_time=15.).update(t[:1000], i[:1000]) is None
+
+
+def test_drift_is_not_stable():
+    [t, i] = _trace()
+    i += 1e-11 * t  # 10 pA/s on 1 nA
+    monitor = StabilityMonitor(window=200, max_drift=0.01)
+    assert _feed(monitor, t, i) is None
+    assert monitor.statistics()['drift'] == pytest.approx(1e-11, rel=0.1)
+    assert not monitor.jumps
+
+
+def test_jumps_are_found_and_can_end_the_trace():
+    [t, i] = _trace()
+    i[1234:] += 2e-11
+    monitor = StabilityMonitor(window=200)
+    _feed(monitor, t, i)
+    [[t_jump, step]] = monitor.jumps
+    assert t_jump == pytest.approx(t[1234])
+    assert step == pytest.approx(2e-11, rel=0.2)
+    monitor = StabilityMonitor(window=200, stop_on_jump=True)
+    assert _feed(monitor, t, i) < 1300
+    assert monitor.reason == 'jump'
+
+
+def test_custom_criterion():
+    [t, i] = _trace(500)
+    monitor = StabilityMonitor(window=100, criterion=lambda s: s['n'] >= 300)
+    assert _feed(monitor, t, i, chunk=50) == 300
+
+
+def test_monitored_trace_ends_early(instrument):
+    monitor = StabilityMonitor(window=50, max_relative_std=0.05)
+    [t, i, flags, info] = instrument.current_time_trace(0.1, data_frequency=100, num_datapoints=5000,
+                                                        monitor=monitor)
+    assert info['reason'] == 'stable'
+    assert 50 <= len(t) < 5000
+    assert np.mean(i) == pytest.approx(1e-7, rel=0.01)
@@ -0,0 +1,58 @@
+import time
+import threading
+from imports.timing import Timing
+
+
+def test_nested_spans_split_self_and_total_time():
+    timing = Timing()
+    with timing.span('outer'):
+        time.sleep(0.02)
+        with timing.span('inner'):
+            time.sleep(0.02)
+    phases = timing.record(device='a1')['phases']
+    assert phases['outer']['total'] >= phases['inner']['total'] + phases['outer']['self'] - 1e-6
+    assert phases['outer']['self'] < phases['outer']['total']
+    assert phases['inner']['self'] == phases['inner']['total']
+
+
+def test_timed_counts_calls_per_phase_and_cycle():
+    timing = Timing()
+
+    @timing.timed('data.fill')
+    def fill():
+        pass
+
+    @timing.timed('data.new_block')
+    def new_block():
+        pass
+    for _ in range(3):
+        timing.next_cycle()
+        fill()
+        fill()
+        new_block()
+    record = timing.record()
+    assert record['phases']['data.fill']['calls'] == 6
+    assert record['phases']['data.new_block']['calls'] == 3
+    assert [cycle['data.fill']['calls'] for cycle in record['cycles']] == [2, 2, 2]
+    assert timing.record()['phases'] == {}
+
+
+def test_spans_of_other_threads_run_in_the_background():
+    timing = Timing()
+
+    def work():
+        with timing.span('data.save'):
+            pass
+    worker = threading.Thread(target=work)
+    worker.start()
+    worker.join()
+    assert list(timing.record()['phases']) == ['data.save (background)']
+    assert 'untracked' in timing.summary()
+
+
+def test_disabled_timing_records_nothing():
+    timing = Timing()
+    timing.enabled = False
+    with timing.span('fit'):
+        pass
+    assert timing.record()['phases'] == {}